@@ -1,19 +1,187 @@
 import socket
+import threading
+import time
 import ntplib
 import dns.resolver
+import dns.asyncresolver
 import requests
 import dns.exception
+from collections import OrderedDict
+from requests.adapters import HTTPAdapter
 from socket import gaierror
 from time import ctime
 from typing import Tuple, Optional
+from urllib.parse import urlsplit
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from probe_timing import PhaseTimer, active_timer, current_timer, timer_phase
+from probe_cancel import register_socket
+from resolver_cache import resolver_cache
 
 
-def check_ntp_server(server: str) -> Tuple[bool, Optional[str]]:
+class _TimedConnectionMixin:
+    """
+    Records the resolve, connect and first_byte phases of a request on the current PhaseTimer.
+
+    Reused keep-alive connections skip _new_conn, so warm checks only report first_byte.
+    The socket is registered with the current CancelScope while waiting for the response.
+    """
+
+    def _new_conn(self):
+        timer = current_timer()
+        if timer is None:
+            return super()._new_conn()
+        host = self._dns_host
+        try:
+            with timer.phase("resolve"):
+                address = resolver_cache.resolve(host, socket.AF_UNSPEC)
+        except gaierror:
+            # Let urllib3 raise its own name resolution error
+            return super()._new_conn()
+        # Connect to the resolved address; TLS still verifies and sends SNI for self.host
+        self._dns_host = address
+        try:
+            with timer.phase("connect"):
+                return super()._new_conn()
+        finally:
+            self._dns_host = host
+
+    def getresponse(self, *args, **kwargs):
+        # Returns once the status line and headers have arrived; stopping the task shuts the socket down
+        with timer_phase(current_timer(), "first_byte"), register_socket(self.sock):
+            return super().getresponse(*args, **kwargs)
+
+
+class TimedHTTPConnection(_TimedConnectionMixin, HTTPConnection):
+    pass
+
+
+class TimedHTTPSConnection(_TimedConnectionMixin, HTTPSConnection):
+    def connect(self):
+        timer = current_timer()
+        if timer is None:
+            return super().connect()
+        # The TLS handshake is what connect() takes beyond resolving and the TCP connect
+        before = timer.durations.get("resolve", 0) + timer.durations.get("connect", 0)
+        start = time.perf_counter_ns()
+        try:
+            return super().connect()
+        finally:
+            after = timer.durations.get("resolve", 0) + timer.durations.get("connect", 0)
+            timer.add("tls", time.perf_counter_ns() - start - (after - before))
+
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+
+class TimedHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter whose connections record their phases on the current PhaseTimer."""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {"http": TimedHTTPConnectionPool,
+                                                   "https": TimedHTTPSConnectionPool}
+
+
+def timed_session() -> requests.Session:
+    """Session whose connections record their phases on the current PhaseTimer."""
+    session = requests.Session()
+    adapter = TimedHTTPAdapter()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+class HttpSessionPool:
+    """
+    Size-bounded pool of keep-alive HTTP sessions keyed by (scheme, host, port).
+
+    Each session keeps its connections open between checks, so a warm check of the same server
+    skips the TCP and TLS handshakes. The least recently used session is closed when the pool is full.
+    """
+
+    def __init__(self, max_sessions: int = 256, connections_per_host: int = 4):
+        """
+        :param max_sessions: Number of (scheme, host, port) sessions kept open
+        :param connections_per_host: Number of keep-alive connections each session keeps
+        """
+        self.max_sessions = max_sessions
+        self.connections_per_host = connections_per_host
+        self._sessions: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, url: str) -> requests.Session:
+        """
+        Return the session for the scheme, host and port of url, creating it if needed.
+
+        :param url: URL of the server
+        :return: Shared keep-alive session
+        """
+        parts = urlsplit(url)
+        key = (parts.scheme, parts.hostname, parts.port)
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is not None:
+                self._sessions.move_to_end(key)
+                return session
+
+            session = requests.Session()
+            adapter = TimedHTTPAdapter(pool_connections=1, pool_maxsize=self.connections_per_host)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            self._sessions[key] = session
+
+            # Close the least recently used session when the pool is full
+            if len(self._sessions) > self.max_sessions:
+                _, oldest = self._sessions.popitem(last=False)
+                oldest.close()
+            return session
+
+    def close(self) -> None:
+        """Close every pooled session and its connections."""
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+
+
+# Shared by every http and https task
+http_session_pool = HttpSessionPool()
+
+
+def http_get(url: str, timeout: float, reuse_connection: bool, headers: Optional[dict] = None,
+             timer: Optional[PhaseTimer] = None) -> requests.Response:
+    """
+    GET url over a pooled keep-alive connection, or over a new connection closed afterwards.
+
+    :param url: URL of the server
+    :param timeout: Timeout for connecting and for each read, in seconds
+    :param reuse_connection: True to use a warm pooled connection, False to measure a cold handshake
+    :param headers: Extra request headers
+    :param timer: PhaseTimer recording resolve, connect, tls and first_byte
+    :return: The response, with its body read
+    """
+    with active_timer(timer):
+        if reuse_connection:
+            return http_session_pool.get(url).get(url, headers=headers, timeout=timeout)
+        # A fresh session asked to close the connection pays the full TCP (and TLS) handshake
+        with timed_session() as session:
+            return session.get(url, headers={**(headers or {}), 'Connection': 'close'}, timeout=timeout)
+
+
+def check_ntp_server(server: str, port: int = 123, timer: Optional[PhaseTimer] = None) -> Tuple[bool, Optional[str]]:
     """
     Checks if an NTP server is up and returns its status and time.
 
     Args:
     server (str): The hostname or IP address of the NTP server to check.
+    port (int): The UDP port of the NTP server. Default is 123.
+    timer (PhaseTimer): Records the resolve and exchange phases. Optional.
 
     Returns:
     Tuple[bool, Optional[str]]: A tuple containing a boolean indicating the server status
@@ -24,9 +192,13 @@ def check_ntp_server(server: str) -> Tuple[bool, Optional[str]]:
     client = ntplib.NTPClient()
 
     try:
+        with timer_phase(timer, "resolve"):
+            address = resolver_cache.resolve(server)
+
         # Request time from the NTP server
         # 'version=3' specifies the NTP version to use for the request
-        response = client.request(server, version=3)
+        with timer_phase(timer, "exchange"):
+            response = client.request(address, version=3, port=port)
 
         # If request is successful, return True and the server time
         # 'ctime' converts the time in seconds since the epoch to a readable format
@@ -36,22 +208,89 @@ def check_ntp_server(server: str) -> Tuple[bool, Optional[str]]:
         return False, None
 
 
-def check_dns_server(server, query, record_type) -> (bool, str):
+class DnsResolverCache:
+    """
+    Cache of dnspython resolvers keyed by name server.
+
+    Resolvers are created with configure=False so the system resolver configuration is not re-read,
+    and the name server's hostname is resolved through the shared resolver_cache.
+    """
+
+    def __init__(self):
+        self._resolvers: dict = {}  # (address, port) -> dns.resolver.Resolver
+        self._async_resolvers: dict = {}  # (address, port) -> dns.asyncresolver.Resolver
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def nameserver_address(server: str) -> str:
+        """
+        Return the IP address of the name server, from the shared cache while it is fresh.
+
+        :param server: DNS server name or IP address
+        :return: IPv4 address of the name server
+        """
+        return resolver_cache.resolve(server)
+
+    def resolver(self, server: str, port: int = 53) -> dns.resolver.Resolver:
+        """
+        Return the cached resolver that sends its queries to the name server.
+
+        :param server: DNS server name or IP address
+        :param port: Port of the name server
+        :return: Resolver using only that name server
+        """
+        key = (self.nameserver_address(server), port)
+        with self._lock:
+            resolver = self._resolvers.get(key)
+            if resolver is None:
+                resolver = dns.resolver.Resolver(configure=False)
+                resolver.nameservers = [key[0]]
+                resolver.port = port
+                self._resolvers[key] = resolver
+        return resolver
+
+    def async_resolver(self, address: str, port: int = 53) -> dns.asyncresolver.Resolver:
+        """
+        Return the cached asyncio resolver that sends its queries to the name server.
+
+        :param address: IP address of the name server, see nameserver_address()
+        :param port: Port of the name server
+        :return: dns.asyncresolver.Resolver using only that name server
+        """
+        key = (address, port)
+        with self._lock:
+            resolver = self._async_resolvers.get(key)
+            if resolver is None:
+                resolver = dns.asyncresolver.Resolver(configure=False)
+                resolver.nameservers = [address]
+                resolver.port = port
+                self._async_resolvers[key] = resolver
+        return resolver
+
+
+# Shared by every dns task
+dns_resolver_cache = DnsResolverCache()
+
+
+def check_dns_server(server, query, record_type, port=53, timer=None) -> (bool, str):
     """
     Check if a DNS server is up and return the DNS query results for a specified domain and record type.
 
     :param server: DNS server name or IP address
     :param query: Domain name to query
     :param record_type: Type of DNS record (e.g., 'A', 'AAAA', 'MX', 'CNAME')
+    :param port: Port of the DNS server. Default is 53.
+    :param timer: PhaseTimer recording the resolve (name server address) and query phases. Optional.
     :return: Tuple (status, query_results)
     """
     try:
-        # Set the DNS resolver to use the specified server
-        resolver = dns.resolver.Resolver()
-        resolver.nameservers = [socket.gethostbyname(server)]
+        # Use the cached DNS resolver for the specified server
+        with timer_phase(timer, "resolve"):
+            resolver = dns_resolver_cache.resolver(server, int(port))
 
         # Perform a DNS query for the specified domain and record type
-        query_results = resolver.resolve(query, record_type)
+        with timer_phase(timer, "query"):
+            query_results = resolver.resolve(query, record_type)
         results = [str(rdata) for rdata in query_results]
 
         return True, results
@@ -61,7 +300,8 @@ def check_dns_server(server, query, record_type) -> (bool, str):
         return False, str(e)
 
 
-def check_server_http(url: str) -> Tuple[bool, Optional[int]]:
+def check_server_http(url: str, timeout: int = 5, reuse_connection: bool = True,
+                      timer: Optional[PhaseTimer] = None) -> Tuple[bool, Optional[int]]:
     """
     Check if an HTTP server is up by making a request to the provided URL.
 
@@ -70,12 +310,15 @@ def check_server_http(url: str) -> Tuple[bool, Optional[int]]:
     and the HTTP status code returned by the server.
 
     :param url: URL of the server (including http://)
+    :param timeout: Timeout for the request in seconds. Default is 5 seconds.
+    :param reuse_connection: True to reuse a pooled keep-alive connection, False for a new connection.
+    :param timer: PhaseTimer recording resolve, connect and first_byte. Optional.
     :return: Tuple (True/False, status code)
              True if server is up (status code < 400), False otherwise
     """
     try:
         # Making a GET request to the server
-        response: requests.Response = requests.get(url)
+        response: requests.Response = http_get(url, timeout, reuse_connection, timer=timer)
 
         # The HTTP status code is a number that indicates the outcome of the request.
         # Here, we consider status codes less than 400 as successful,
@@ -96,7 +339,8 @@ def check_server_http(url: str) -> Tuple[bool, Optional[int]]:
         return False, None
 
 
-def check_server_https(url: str, timeout: int = 5) -> Tuple[bool, Optional[int], str]:
+def check_server_https(url: str, timeout: int = 5, reuse_connection: bool = True,
+                       timer: Optional[PhaseTimer] = None) -> Tuple[bool, Optional[int], str]:
     """
     Check if an HTTPS server is up by making a request to the provided URL.
 
@@ -106,6 +350,8 @@ def check_server_https(url: str, timeout: int = 5) -> Tuple[bool, Optional[int],
 
     :param url: URL of the server (including https://)
     :param timeout: Timeout for the request in seconds. Default is 5 seconds.
+    :param reuse_connection: True to reuse a pooled keep-alive connection, False for a new TLS handshake.
+    :param timer: PhaseTimer recording resolve, connect, tls and first_byte. Optional.
     :return: Tuple (True/False for server status, status code, description)
     """
     try:
@@ -114,7 +360,7 @@ def check_server_https(url: str, timeout: int = 5) -> Tuple[bool, Optional[int],
 
         # Making a GET request to the server with the specified URL and timeout.
         # The timeout ensures that the request does not hang indefinitely.
-        response: requests.Response = requests.get(url, headers=headers, timeout=timeout)
+        response: requests.Response = http_get(url, timeout, reuse_connection, headers=headers, timer=timer)
 
         # Checking if the status code is less than 400. Status codes in the 200-399 range generally indicate success.
         is_up: bool = response.status_code < 400
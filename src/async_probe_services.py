@@ -0,0 +1,461 @@
+import asyncio
+import socket
+import ssl
+import struct
+import threading
+import time
+import weakref
+import dns.asyncresolver
+import dns.exception
+import dns.resolver
+from collections import OrderedDict
+from time import ctime
+from typing import Tuple, Optional
+from urllib.parse import urljoin, urlsplit
+from application_layer_services import dns_resolver_cache
+from probe_timing import PhaseTimer, timer_phase
+from resolver_cache import resolver_cache
+
+"""
+asyncio counterparts of the blocking service checks.
+
+Every check here returns exactly what its synchronous counterpart returns, but waits on
+the network as a coroutine instead of a blocked thread. ProbeLoop runs one event loop on a
+background thread so the scheduler can keep thousands of checks in flight at once.
+"""
+
+# Seconds between 1900-01-01 (NTP epoch) and 1970-01-01 (Unix epoch)
+NTP_EPOCH_OFFSET = 2208988800
+# Redirects followed by the HTTP checks, same default as requests
+MAX_REDIRECTS = 30
+
+
+class ProbeLoop:
+    def __init__(self):
+        """Event loop running on its own daemon thread, shared by every async check."""
+        self._loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start the event loop thread if it is not already running."""
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever, name="probe-loop", daemon=True)
+                self._thread.start()
+        return self._loop
+
+    def submit(self, coroutine):
+        """
+        Schedule a coroutine on the loop from any thread.
+
+        :param coroutine: Coroutine to run
+        :return: concurrent.futures.Future completed with the coroutine's result
+        """
+        loop = self.start()
+        return asyncio.run_coroutine_threadsafe(coroutine, loop)
+
+    def run(self, coroutine, timeout=None):
+        """
+        Run a coroutine on the loop and block until it finishes.
+
+        :param coroutine: Coroutine to run
+        :param timeout: Seconds to wait for the result
+        :return: The coroutine's result
+        """
+        return self.submit(coroutine).result(timeout)
+
+
+# Process-wide loop used by the scheduler for async tasks
+probe_loop = ProbeLoop()
+
+
+async def _resolve(host: str, family: int = socket.AF_INET) -> str:
+    """Address of host from the shared resolver cache, looked up on a worker thread so a miss does not block the loop."""
+    return await asyncio.get_running_loop().run_in_executor(None, resolver_cache.resolve, host, family)
+
+
+async def async_check_tcp_port(ip_address: str, port: int, timeout: int = 3,
+                               timer: Optional[PhaseTimer] = None) -> (bool, str):
+    """
+    Async counterpart of transport_layer_services.check_tcp_port.
+
+    Args:
+    ip_address (str): The IP address of the target server.
+    port (int): The TCP port number to check.
+    timeout (int): The timeout duration in seconds for the connection. Default is 3 seconds.
+    timer (PhaseTimer): Records the resolve and connect phases. Optional.
+
+    Returns:
+    tuple: (True if the port is open, description of the port status)
+    """
+    try:
+        with timer_phase(timer, "resolve"):
+            address = await _resolve(ip_address)
+        with timer_phase(timer, "connect"):
+            _, writer = await asyncio.wait_for(asyncio.open_connection(address, port), timeout)
+        writer.close()
+        return True, f"Port {port} on {ip_address} is open."
+
+    except asyncio.TimeoutError:
+        return False, f"Port {port} on {ip_address} timed out."
+
+    except OSError:
+        return False, f"Port {port} on {ip_address} is closed or not reachable."
+
+    except Exception as e:
+        return False, f"Failed to check port {port} on {ip_address} due to an error: {e}"
+
+
+class _UdpCheckProtocol(asyncio.DatagramProtocol):
+    def __init__(self, on_done: asyncio.Future):
+        self.on_done = on_done
+
+    def datagram_received(self, data, addr):
+        if not self.on_done.done():
+            self.on_done.set_result(True)
+
+    def error_received(self, exc):
+        # ICMP 'Destination Unreachable' on the connected socket
+        if not self.on_done.done():
+            self.on_done.set_result(True)
+
+
+async def async_check_udp_port(ip_address: str, port: int, timeout: int = 3,
+                               timer: Optional[PhaseTimer] = None) -> (bool, str):
+    """
+    Async counterpart of transport_layer_services.check_udp_port.
+
+    Args:
+    ip_address (str): The IP address of the target server.
+    port (int): The UDP port number to check.
+    timeout (int): The timeout duration in seconds. Default is 3 seconds.
+    timer (PhaseTimer): Records the resolve, send and reply phases. Optional.
+
+    Returns:
+    tuple: (False if the port is definitely closed, description of the port status)
+    """
+    loop = asyncio.get_running_loop()
+    transport = None
+    try:
+        with timer_phase(timer, "resolve"):
+            address = await _resolve(ip_address)
+        answered = loop.create_future()
+        with timer_phase(timer, "send"):
+            transport, _ = await loop.create_datagram_endpoint(lambda: _UdpCheckProtocol(answered),
+                                                               remote_addr=(address, port))
+            transport.sendto(b'')
+        try:
+            with timer_phase(timer, "reply"):
+                await asyncio.wait_for(answered, timeout)
+            return False, f"Port {port} on {ip_address} is closed."
+        except asyncio.TimeoutError:
+            return True, f"Port {port} on {ip_address} is open or no response received."
+
+    except Exception as e:
+        return False, f"Failed to check UDP port {port} on {ip_address} due to an error: {e}"
+
+    finally:
+        if transport is not None:
+            transport.close()
+
+
+class AsyncHttpConnectionPool:
+    """
+    Idle keep-alive connections of the async HTTP checks, keyed by (scheme, host, port).
+
+    Async counterpart of application_layer_services.HttpSessionPool: a warm check reuses an idle
+    connection and skips the TCP and TLS handshakes. Connections belong to the event loop that opened
+    them, so every loop has its own idle connections; the least recently used host is dropped when
+    more than max_hosts have idle connections.
+    """
+
+    def __init__(self, max_hosts: int = 256, connections_per_host: int = 4):
+        """
+        :param max_hosts: Number of (scheme, host, port) keys with idle connections kept
+        :param connections_per_host: Number of idle connections kept per key
+        """
+        self.max_hosts = max_hosts
+        self.connections_per_host = connections_per_host
+        self._idle = weakref.WeakKeyDictionary()  # event loop -> OrderedDict key -> [(reader, writer), ...]
+
+    def acquire(self, key: tuple):
+        """
+        Take an idle connection of key, called on the loop thread.
+
+        :return: (reader, writer) or None when there is no usable idle connection
+        """
+        idle = self._idle.get(asyncio.get_running_loop())
+        connections = idle.get(key) if idle is not None else None
+        while connections:
+            reader, writer = connections.pop()
+            # Closed by the server while idle
+            if not writer.is_closing() and not reader.at_eof():
+                return reader, writer
+            writer.close()
+        return None
+
+    def release(self, key: tuple, reader, writer) -> None:
+        """Keep a connection whose response was read completely for the next check of key."""
+        idle = self._idle.setdefault(asyncio.get_running_loop(), OrderedDict())
+        connections = idle.setdefault(key, [])
+        idle.move_to_end(key)
+        if len(connections) >= self.connections_per_host:
+            writer.close()
+            return
+        connections.append((reader, writer))
+        while len(idle) > self.max_hosts:
+            _, oldest = idle.popitem(last=False)
+            for _, oldest_writer in oldest:
+                oldest_writer.close()
+
+
+# Shared by every async http and https task
+async_http_pool = AsyncHttpConnectionPool()
+
+
+async def _http_get_status(url: str, headers: dict, timeout: float, reuse_connection: bool = True,
+                           timer: Optional[PhaseTimer] = None) -> int:
+    """
+    Send HTTP GET requests following redirects and return the final status code.
+
+    With reuse_connection, requests go over pooled keep-alive connections (only first_byte is timed
+    on a reused one), else over a new connection closed afterwards, as with http_get.
+
+    Raises asyncio.TimeoutError when the whole exchange exceeds timeout and OSError on connection errors.
+    """
+    async def connect(parts, use_tls, port):
+        with timer_phase(timer, "resolve"):
+            address = await _resolve(parts.hostname, socket.AF_UNSPEC)
+        ssl_context = ssl.create_default_context() if use_tls else None
+        if ssl_context is not None and not hasattr(asyncio.StreamWriter, "start_tls"):
+            # Before Python 3.11 the handshake can only be made while connecting
+            with timer_phase(timer, "connect"):
+                return await asyncio.open_connection(address, port, ssl=ssl_context, server_hostname=parts.hostname)
+        with timer_phase(timer, "connect"):
+            reader, writer = await asyncio.open_connection(address, port)
+        if ssl_context is not None:
+            with timer_phase(timer, "tls"):
+                await writer.start_tls(ssl_context, server_hostname=parts.hostname)
+        return reader, writer
+
+    async def request(connection, parts, key):
+        reader, writer = connection
+        try:
+            target = parts.path or "/"
+            if parts.query:
+                target += f"?{parts.query}"
+            request_headers = {"Host": parts.netloc, "Accept": "*/*",
+                               "Connection": "keep-alive" if reuse_connection else "close", **headers}
+            request = f"GET {target} HTTP/1.1\r\n"
+            request += "".join(f"{name}: {value}\r\n" for name, value in request_headers.items())
+            with timer_phase(timer, "first_byte"):
+                writer.write((request + "\r\n").encode("latin-1"))
+                await writer.drain()
+                # Status line: HTTP/1.1 200 OK
+                status_line = await reader.readline()
+                if not status_line:
+                    raise ConnectionResetError("Connection closed before the response")
+                response_headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    response_headers[name.strip().lower()] = value.strip()
+            status_code = int(status_line.split()[1])
+            # The body must be read off the connection before it can carry the next request
+            delimited = await _read_body(reader, status_code, response_headers)
+        except BaseException:
+            writer.close()
+            raise
+        if reuse_connection and delimited and response_headers.get("connection", "").lower() != "close":
+            async_http_pool.release(key, reader, writer)
+        else:
+            writer.close()
+        return status_code, response_headers.get("location")
+
+    async def exchange(current_url):
+        parts = urlsplit(current_url)
+        if parts.scheme not in ("http", "https"):
+            raise ValueError(f"Unsupported URL scheme: {parts.scheme!r}")
+        use_tls = parts.scheme == "https"
+        port = parts.port or (443 if use_tls else 80)
+        key = (parts.scheme, parts.hostname, port)
+        connection = async_http_pool.acquire(key) if reuse_connection else None
+        if connection is not None:
+            try:
+                return await request(connection, parts, key)
+            except (OSError, asyncio.IncompleteReadError):
+                # The server closed the idle connection: retry once on a new one, as urllib3 does
+                pass
+        return await request(await connect(parts, use_tls, port), parts, key)
+
+    async def follow(current_url):
+        for _ in range(MAX_REDIRECTS + 1):
+            status_code, location = await exchange(current_url)
+            if status_code in (301, 302, 303, 307, 308) and location:
+                current_url = urljoin(current_url, location)
+                continue
+            return status_code
+        raise ValueError(f"Exceeded {MAX_REDIRECTS} redirects.")
+
+    return await asyncio.wait_for(follow(url), timeout)
+
+
+async def _read_body(reader, status_code: int, headers: dict) -> bool:
+    """
+    Read and discard a response body.
+
+    :return: True if the body had a delimited length, so the connection can carry another request
+    """
+    if 100 <= status_code < 200 or status_code in (204, 304):
+        return True
+    if "chunked" in headers.get("transfer-encoding", "").lower():
+        while True:
+            size = int((await reader.readline()).split(b";")[0].strip(), 16)
+            if size == 0:
+                # Trailer fields end with an empty line
+                while await reader.readline() not in (b"\r\n", b"\n", b""):
+                    pass
+                return True
+            # Chunk data and its CRLF
+            await reader.readexactly(size + 2)
+    if "content-length" in headers:
+        await reader.readexactly(int(headers["content-length"]))
+        return True
+    # Delimited by the end of the connection
+    while await reader.read(65536):
+        pass
+    return False
+
+
+async def async_check_server_http(url: str, timeout: int = 5, reuse_connection: bool = True,
+                                  timer: Optional[PhaseTimer] = None) -> Tuple[bool, Optional[int]]:
+    """
+    Async counterpart of application_layer_services.check_server_http.
+
+    :param url: URL of the server (including http://)
+    :param timeout: Timeout for the request in seconds. Default is 5 seconds.
+    :param reuse_connection: True to reuse a pooled keep-alive connection, False for a new connection.
+    :param timer: PhaseTimer recording resolve, connect and first_byte. Optional.
+    :return: Tuple (True/False, status code)
+    """
+    try:
+        status_code = await _http_get_status(url, {}, timeout, reuse_connection, timer)
+        return status_code < 400, status_code
+    except (asyncio.TimeoutError, asyncio.IncompleteReadError, OSError, ValueError, IndexError):
+        return False, None
+
+
+async def async_check_server_https(url: str, timeout: int = 5, reuse_connection: bool = True,
+                                   timer: Optional[PhaseTimer] = None) -> Tuple[bool, Optional[int], str]:
+    """
+    Async counterpart of application_layer_services.check_server_https.
+
+    :param url: URL of the server (including https://)
+    :param timeout: Timeout for the request in seconds. Default is 5 seconds.
+    :param reuse_connection: True to reuse a pooled keep-alive connection, False for a new TLS handshake.
+    :param timer: PhaseTimer recording resolve, connect, tls and first_byte. Optional.
+    :return: Tuple (True/False for server status, status code, description)
+    """
+    try:
+        status_code = await _http_get_status(url, {'User-Agent': 'Mozilla/5.0'}, timeout, reuse_connection, timer)
+        return status_code < 400, status_code, "Server is up"
+
+    except asyncio.TimeoutError:
+        return False, None, "Timeout occurred"
+
+    except (OSError, asyncio.IncompleteReadError):
+        return False, None, "Connection error"
+
+    except (ValueError, IndexError) as e:
+        return False, None, f"Error during request: {e}"
+
+
+async def async_check_dns_server(server, query, record_type, port=53, timer=None) -> (bool, str):
+    """
+    Async counterpart of application_layer_services.check_dns_server.
+
+    :param server: DNS server name or IP address
+    :param query: Domain name to query
+    :param record_type: Type of DNS record (e.g., 'A', 'AAAA', 'MX', 'CNAME')
+    :param port: Port of the DNS server. Default is 53.
+    :param timer: PhaseTimer recording the resolve (name server address) and query phases. Optional.
+    :return: Tuple (status, query_results)
+    """
+    loop = asyncio.get_running_loop()
+    try:
+        # Name server address from the shared cache (on a worker thread, a miss blocks on getaddrinfo)
+        with timer_phase(timer, "resolve"):
+            address = await loop.run_in_executor(None, dns_resolver_cache.nameserver_address, server)
+        resolver = dns_resolver_cache.async_resolver(address, int(port))
+
+        with timer_phase(timer, "query"):
+            query_results = await resolver.resolve(query, record_type)
+        results = [str(rdata) for rdata in query_results]
+
+        return True, results
+
+    except (dns.exception.Timeout, dns.resolver.NoNameservers, dns.resolver.NoAnswer, socket.gaierror) as e:
+        return False, str(e)
+
+
+class _NtpProtocol(asyncio.DatagramProtocol):
+    def __init__(self, on_reply: asyncio.Future):
+        self.on_reply = on_reply
+
+    def datagram_received(self, data, addr):
+        if not self.on_reply.done():
+            self.on_reply.set_result(data)
+
+    def error_received(self, exc):
+        if not self.on_reply.done():
+            self.on_reply.set_exception(exc)
+
+
+async def async_check_ntp_server(server: str, timeout: int = 5, port: int = 123,
+                                 timer: Optional[PhaseTimer] = None) -> Tuple[bool, Optional[str]]:
+    """
+    Async counterpart of application_layer_services.check_ntp_server.
+
+    Args:
+    server (str): The hostname or IP address of the NTP server to check.
+    timeout (int): Seconds to wait for the reply. Default is 5 seconds, as in ntplib.
+    port (int): The UDP port of the NTP server. Default is 123.
+    timer (PhaseTimer): Records the resolve and exchange phases. Optional.
+
+    Returns:
+    Tuple[bool, Optional[str]]: (True if up, server time as a string) or (False, None)
+    """
+    loop = asyncio.get_running_loop()
+    transport = None
+    try:
+        with timer_phase(timer, "resolve"):
+            address = await _resolve(server)
+
+        with timer_phase(timer, "exchange"):
+            reply = loop.create_future()
+            transport, _ = await loop.create_datagram_endpoint(lambda: _NtpProtocol(reply), remote_addr=(address, port))
+
+            # Client request: leap indicator 0, version 3, mode 3 (client), transmit time set
+            now = time.time() + NTP_EPOCH_OFFSET
+            request = struct.pack("!B47x", (0 << 6) | (3 << 3) | 3)
+            request = request[:40] + struct.pack("!II", int(now), int((now % 1) * 2 ** 32))
+            transport.sendto(request)
+
+            data = await asyncio.wait_for(reply, timeout)
+        if len(data) < 48:
+            return False, None
+        # Transmit timestamp: seconds and fraction since 1900 at bytes 40-47
+        seconds, fraction = struct.unpack("!II", data[40:48])
+        tx_time = seconds - NTP_EPOCH_OFFSET + fraction / 2 ** 32
+        return True, ctime(tx_time)
+
+    except (asyncio.TimeoutError, OSError):
+        return False, None
+
+    finally:
+        if transport is not None:
+            transport.close()
@@ -0,0 +1,82 @@
+import os
+import random
+import socket
+import string
+import struct
+import threading
+import timeit
+import zlib
+from network_layer_services import calculate_icmp_checksum, calculate_icmp_checksum_bytewise, \
+    create_icmp_packet, get_icmp_packet_template
+
+"""
+Micro-benchmark of ICMP packet building.
+
+Compares the original per-packet path (CRC32 identifier, fresh payload, byte-by-byte checksum)
+with the array-based checksum and the cached packet templates used by ping and traceroute.
+
+Run from src/: python3 benchmark_icmp_packets.py
+"""
+
+
+def legacy_create_icmp_packet(icmp_type: int = 8, icmp_code: int = 0, sequence_number: int = 1,
+                              data_size: int = 192) -> bytes:
+    """The packet builder as it was before templates: everything is recomputed for every packet."""
+    thread_id = threading.get_ident()
+    process_id = os.getpid()
+    icmp_id = zlib.crc32(f"{thread_id}{process_id}".encode()) & 0xffff
+    header: bytes = struct.pack('bbHHh', icmp_type, icmp_code, 0, icmp_id, sequence_number)
+    random_char: str = random.choice(string.ascii_letters + string.digits)
+    data: bytes = (random_char * data_size).encode()
+    chksum: int = calculate_icmp_checksum_bytewise(header + data)
+    header = struct.pack('bbHHh', icmp_type, icmp_code, socket.htons(chksum), icmp_id, sequence_number)
+    return header + data
+
+
+def verify(data_size: int) -> None:
+    """Check that the fast paths produce the same checksums as the reference implementation."""
+    for _ in range(1000):
+        data = os.urandom(data_size)
+        assert calculate_icmp_checksum(data) == calculate_icmp_checksum_bytewise(data)
+
+    template = get_icmp_packet_template(8, 0, 0x1234, data_size)
+    for sequence_number in range(1, 0x7fff, 97):
+        packet = template.packet(sequence_number)
+        # A packet with a correct checksum sums to zero.
+        assert calculate_icmp_checksum(packet) == 0, sequence_number
+
+
+def report(name: str, seconds: float, number: int, baseline: float = None) -> None:
+    rate = number / seconds
+    speedup = f"  x{baseline / seconds:.1f}" if baseline else ""
+    print(f"{name:<40} {seconds / number * 1e6:>9.2f} us/op {rate:>14,.0f} ops/s{speedup}")
+
+
+def main(number: int = 20000) -> None:
+    for data_size in (56, 192, 1400):
+        verify(data_size)
+        data = os.urandom(data_size + 8)
+        print(f"\nPayload size: {data_size} bytes ({number} operations each)")
+        print("-" * 86)
+
+        bytewise = min(timeit.repeat(lambda: calculate_icmp_checksum_bytewise(data), number=number, repeat=3))
+        report("checksum, byte by byte", bytewise, number)
+        vectorized = min(timeit.repeat(lambda: calculate_icmp_checksum(data), number=number, repeat=3))
+        report("checksum, array('H') summation", vectorized, number, bytewise)
+
+        sequence = iter(range(10 ** 9))
+        legacy = min(timeit.repeat(lambda: legacy_create_icmp_packet(sequence_number=next(sequence) % 0x7fff,
+                                                                     data_size=data_size),
+                                   number=number, repeat=3))
+        report("packet, legacy create path", legacy, number)
+        templated = min(timeit.repeat(lambda: create_icmp_packet(sequence_number=next(sequence) % 0x7fff,
+                                                                 data_size=data_size, icmp_id=0x1234),
+                                      number=number, repeat=3))
+        report("packet, create_icmp_packet (template)", templated, number, legacy)
+        template = get_icmp_packet_template(8, 0, 0x1234, data_size)
+        direct = min(timeit.repeat(lambda: template.packet(next(sequence) % 0x7fff), number=number, repeat=3))
+        report("packet, IcmpPacketTemplate.packet", direct, number, legacy)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,270 @@
+import http.server
+import multiprocessing
+import os
+import resource
+import shutil
+import socket
+import ssl
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import dns.message
+import dns.rrset
+from monitoring_service_task import tcp_task, udp_task, http_task, https_task, dns_task, ntp_task
+
+"""
+Probe throughput benchmark against local stand-in servers.
+
+Starts stand-ins on loopback in a child process (TCP listener, UDP responder and a closed
+UDP port, HTTP and HTTPS servers, DNS responder, NTP responder), then drives tcp_task,
+udp_task, http_task, https_task, dns_task and ntp_task from an increasing number of
+concurrent threads. For every probe and concurrency level it reports checks per second,
+the latency distribution, failed checks, CPU use of the probing process and its RSS.
+Needs no external network; HTTPS is skipped when openssl is not available.
+
+Run from src/: python3 benchmark_probes.py [seconds per level] [probe ...]
+"""
+
+CONCURRENCY_LEVELS = (1, 4, 16, 64)
+DNS_ANSWER = "192.0.2.1"
+NTP_EPOCH_OFFSET = 2208988800
+
+
+################# STAND-IN SERVERS ####################################################
+class StandInHttpHandler(http.server.BaseHTTPRequestHandler):
+    # Keep-alive, so warm checks reuse their connection
+    protocol_version = "HTTP/1.1"
+    body = b"ok\n"
+
+    def do_GET(self):
+        # One write for headers and body: separate small writes stall on delayed ACKs
+        self.wfile.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/plain\r\n"
+                         b"Content-Length: %d\r\n\r\n%s" % (len(self.body), self.body))
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StandInHttpServer(http.server.ThreadingHTTPServer):
+    # The default backlog of 5 overflows under concurrent connects (SYN retried after 1 s)
+    request_queue_size = socket.SOMAXCONN
+    daemon_threads = True
+
+
+def make_certificate(directory):
+    """Self-signed certificate for 127.0.0.1 and localhost; (cert, key) paths or None without openssl."""
+    if shutil.which("openssl") is None:
+        return None
+    cert = os.path.join(directory, "stand-in.pem")
+    key = os.path.join(directory, "stand-in.key")
+    result = subprocess.run(["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+                             "-subj", "/CN=localhost", "-addext", "subjectAltName=DNS:localhost,IP:127.0.0.1",
+                             "-keyout", key, "-out", cert], capture_output=True)
+    return (cert, key) if result.returncode == 0 else None
+
+
+def serve_tcp(server_sock):
+    while True:
+        client_sock, _ = server_sock.accept()
+        client_sock.close()
+
+
+def serve_udp_echo(server_sock):
+    while True:
+        message, client_address = server_sock.recvfrom(2048)
+        server_sock.sendto(message, client_address)
+
+
+def serve_dns(server_sock):
+    while True:
+        wire, client_address = server_sock.recvfrom(4096)
+        query = dns.message.from_wire(wire)
+        response = dns.message.make_response(query)
+        question = query.question[0]
+        response.answer.append(dns.rrset.from_text(question.name, 60, "IN", "A", DNS_ANSWER))
+        server_sock.sendto(response.to_wire(), client_address)
+
+
+def serve_ntp(server_sock):
+    while True:
+        request, client_address = server_sock.recvfrom(1024)
+        now = time.time() + NTP_EPOCH_OFFSET
+        seconds, fraction = int(now), int((now % 1) * 2 ** 32)
+        # Leap indicator 0, version 3, mode 4 (server), stratum 1; originate = client's transmit time
+        reply = struct.pack("!BBbb11I", (0 << 6) | (3 << 3) | 4, 1, 0, -20, 0, 0, 0,
+                            seconds, fraction, *struct.unpack("!II", request[40:48]),
+                            seconds, fraction, seconds, fraction)
+        server_sock.sendto(reply, client_address)
+
+
+def bind(kind):
+    sock = socket.socket(socket.AF_INET, kind)
+    sock.bind(("127.0.0.1", 0))
+    return sock
+
+
+def run_stand_ins(connection, cert_directory):
+    """Child process: start every stand-in, send their ports to the parent, serve until told to stop."""
+    ports = {}
+    threads = []
+
+    tcp_sock = bind(socket.SOCK_STREAM)
+    tcp_sock.listen(socket.SOMAXCONN)
+    ports["tcp"] = tcp_sock.getsockname()[1]
+    threads.append((serve_tcp, tcp_sock))
+
+    for name, serve in (("udp", serve_udp_echo), ("dns", serve_dns), ("ntp", serve_ntp)):
+        sock = bind(socket.SOCK_DGRAM)
+        ports[name] = sock.getsockname()[1]
+        threads.append((serve, sock))
+
+    # Nothing listens on this port: the kernel answers with ICMP port unreachable
+    with bind(socket.SOCK_DGRAM) as closed_sock:
+        ports["udp_closed"] = closed_sock.getsockname()[1]
+
+    http_server = StandInHttpServer(("127.0.0.1", 0), StandInHttpHandler)
+    ports["http"] = http_server.server_address[1]
+    threads.append((lambda server: server.serve_forever(), http_server))
+
+    certificate = make_certificate(cert_directory)
+    if certificate is not None:
+        https_server = StandInHttpServer(("127.0.0.1", 0), StandInHttpHandler)
+        context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        context.load_cert_chain(*certificate)
+        # Handshake in the handler thread, not in the accepting thread
+        https_server.socket = context.wrap_socket(https_server.socket, server_side=True,
+                                                  do_handshake_on_connect=False)
+        ports["https"] = https_server.server_address[1]
+        ports["https_ca"] = certificate[0]
+        threads.append((lambda server: server.serve_forever(), https_server))
+
+    for target, argument in threads:
+        threading.Thread(target=target, args=(argument,), daemon=True).start()
+    connection.send(ports)
+    # Any message (or the parent exiting) stops the stand-ins
+    try:
+        connection.recv()
+    except EOFError:
+        pass
+
+
+################# BENCHMARK DRIVER ####################################################
+def probes(ports):
+    """Name -> (check function with no arguments, predicate telling whether its result is a success)."""
+    def status_of(result):
+        return next(iter(result.values()))["status"]
+
+    def udp_answered(result):
+        # check_udp_port reports an answered (or refused) datagram as closed; only errors are failures
+        return "due to an error" not in next(iter(result.values()))["description"]
+
+    http_url = f"http://127.0.0.1:{ports['http']}/"
+    selected = {
+        "tcp": (lambda: tcp_task("127.0.0.1", ports["tcp"]), status_of),
+        "udp": (lambda: udp_task("127.0.0.1", ports["udp"]), udp_answered),
+        "udp-closed": (lambda: udp_task("127.0.0.1", ports["udp_closed"]), udp_answered),
+        "http": (lambda: http_task(http_url), status_of),
+        "http-cold": (lambda: http_task(http_url, 5, "cold"), status_of),
+        "dns": (lambda: dns_task("bench.example", "127.0.0.1", "A", ports["dns"]), status_of),
+        "ntp": (lambda: ntp_task("127.0.0.1", ports["ntp"]), status_of),
+    }
+    if "https" in ports:
+        https_url = f"https://127.0.0.1:{ports['https']}/"
+        selected["https"] = (lambda: https_task(https_url), status_of)
+        selected["https-cold"] = (lambda: https_task(https_url, 5, "cold"), status_of)
+    return selected
+
+
+def rss_bytes():
+    """Current resident set size; peak RSS where /proc is not available."""
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        # ru_maxrss is in kilobytes on Linux, bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def run_level(check, succeeded, concurrency, duration):
+    """Call check from concurrency threads for duration seconds; return throughput and latency figures."""
+    latencies = [[] for _ in range(concurrency)]
+    failures = [0] * concurrency
+    deadline = time.perf_counter() + duration
+
+    def worker(index):
+        own_latencies = latencies[index]
+        while time.perf_counter() < deadline:
+            start = time.perf_counter_ns()
+            try:
+                ok = succeeded(check())
+            except Exception:
+                ok = False
+            own_latencies.append((time.perf_counter_ns() - start) / 1e6)
+            if not ok:
+                failures[index] += 1
+
+    usage_before = resource.getrusage(resource.RUSAGE_SELF)
+    start = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    usage_after = resource.getrusage(resource.RUSAGE_SELF)
+
+    samples = sorted(latency for own_latencies in latencies for latency in own_latencies)
+    cpu = (usage_after.ru_utime - usage_before.ru_utime) + (usage_after.ru_stime - usage_before.ru_stime)
+
+    def percentile(q):
+        return samples[min(len(samples) - 1, int(q * len(samples)))] if samples else float("nan")
+
+    return {"checks": len(samples), "rate": len(samples) / elapsed, "failed": sum(failures),
+            "p50": percentile(0.5), "p95": percentile(0.95), "p99": percentile(0.99),
+            "max": samples[-1] if samples else float("nan"), "cpu": cpu / elapsed * 100, "rss": rss_bytes()}
+
+
+def report(name, concurrency, figures):
+    print(f"{name:<11} {concurrency:>5} {figures['checks']:>8} {figures['rate']:>10,.0f} {figures['failed']:>7} "
+          f"{figures['p50']:>9.2f} {figures['p95']:>9.2f} {figures['p99']:>9.2f} {figures['max']:>9.2f} "
+          f"{figures['cpu']:>6.0f}% {figures['rss'] / 2 ** 20:>8.1f}")
+
+
+def main(duration=2.0, selected=None):
+    cert_directory = tempfile.mkdtemp(prefix="benchmark-probes-")
+    context = multiprocessing.get_context("spawn")
+    parent_connection, child_connection = context.Pipe()
+    stand_ins = context.Process(target=run_stand_ins, args=(child_connection, cert_directory), daemon=True)
+    stand_ins.start()
+    try:
+        ports = parent_connection.recv()
+        if "https_ca" in ports:
+            # requests verifies the stand-in's self-signed certificate against this bundle
+            os.environ["REQUESTS_CA_BUNDLE"] = ports["https_ca"]
+        else:
+            print("openssl not found, skipping https.")
+
+        print(f"{duration:g} s per level, stand-ins on 127.0.0.1 (pid {stand_ins.pid}), probing from pid {os.getpid()}")
+        print(f"{'probe':<11} {'conc.':>5} {'checks':>8} {'checks/s':>10} {'failed':>7} {'p50 ms':>9} {'p95 ms':>9} "
+              f"{'p99 ms':>9} {'max ms':>9} {'CPU':>7} {'RSS MiB':>8}")
+        print("-" * 104)
+        for name, (check, succeeded) in probes(ports).items():
+            if selected and name not in selected:
+                continue
+            # Warm up caches and keep-alive connections outside the measurement
+            for _ in range(3):
+                check()
+            for concurrency in CONCURRENCY_LEVELS:
+                report(name, concurrency, run_level(check, succeeded, concurrency, duration))
+    finally:
+        parent_connection.send("stop")
+        stand_ins.join(5)
+        shutil.rmtree(cert_directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main(float(sys.argv[1]) if len(sys.argv) > 1 else 2.0, sys.argv[2:])
@@ -0,0 +1,158 @@
+import json
+import os
+import threading
+
+"""
+Keyed JSON store persisted as a snapshot plus an append-only journal.
+
+The snapshot (<path>) holds every entry as one JSON object. Each change after it is appended
+to the journal (<path>.journal) as one JSON line carrying the entry's full new value, so a
+change costs one short append instead of rewriting the whole file. Loading reads the snapshot
+and replays the journal over it. Once the journal holds more lines than the store holds
+entries (and at least compact_min), it is compacted: the snapshot is rewritten atomically
+(temporary file + rename) and the journal truncated, which keeps the cost of a change O(1)
+amortised. Replaying a journal line twice gives the same result, so a crash between the
+rename and the truncation loses nothing; a line torn by a crash is skipped.
+"""
+
+JOURNAL_EXTENSION = ".journal"
+# Journal lines always allowed before a compaction, whatever the number of entries
+DEFAULT_COMPACT_MIN = 1000
+
+
+class JournalStore:
+    def __init__(self, path, compact_min=DEFAULT_COMPACT_MIN, fsync=False):
+        """
+        Persistent key -> JSON value mapping.
+
+        :param path: Path of the snapshot, the journal is written next to it
+        :param compact_min: Journal lines always allowed before a compaction
+        :param fsync: True to fsync every journal append and snapshot, False to leave it to the OS
+        """
+        self.path = path
+        self.journal_path = path + JOURNAL_EXTENSION
+        self.compact_min = compact_min
+        self.fsync = fsync
+        self.data = {}
+        self._journal = None
+        self._journal_lines = 0
+        self._lock = threading.RLock()
+        self.load()
+
+    def load(self):
+        """
+        (Re)read the snapshot and replay the journal.
+
+        :return: The key -> value dict, also available as .data
+        """
+        with self._lock:
+            self.data = {}
+            try:
+                with open(self.path, "r") as file:
+                    snapshot = json.load(file)
+            except FileNotFoundError:
+                snapshot = {}
+            except ValueError as e:
+                print(f"WARNING: Ignoring {self.path}, it is not valid JSON: {e}")
+                snapshot = {}
+            if isinstance(snapshot, list):
+                # Older files hold a list of single-key objects, later keys replace earlier ones
+                # (entries that are not objects, e.g. bare IDs, hold nothing to load)
+                for entry in snapshot:
+                    if isinstance(entry, dict):
+                        self.data.update(entry)
+            elif isinstance(snapshot, dict):
+                self.data.update(snapshot)
+            else:
+                # Older files may hold a single JSON string (str() of a dict), which holds nothing to load
+                print(f"WARNING: Ignoring {self.path}, it holds a {type(snapshot).__name__} instead of entries")
+
+            self._journal_lines = 0
+            torn = False
+            try:
+                with open(self.journal_path, "r") as file:
+                    for line in file:
+                        try:
+                            change = json.loads(line)
+                        except ValueError:
+                            print(f"WARNING: Skipping a torn line of {self.journal_path}")
+                            torn = True
+                            continue
+                        self._apply(change)
+                        self._journal_lines += 1
+            except FileNotFoundError:
+                pass
+            if torn:
+                # Appending after a torn line would tear the next one too
+                self.compact()
+            return self.data
+
+    def get(self, key, default=None):
+        return self.data.get(key, default)
+
+    def put(self, key, value):
+        """
+        Set the value of key.
+
+        :param key: String key
+        :param value: JSON serialisable value; stored as given, do not modify it afterwards
+        """
+        self.write([(key, value)])
+
+    def delete(self, key):
+        self.write([(key, None)])
+
+    def write(self, changes):
+        """
+        Apply several changes with one journal append.
+
+        :param changes: Iterable of (key, value), a value of None deletes the key
+        """
+        with self._lock:
+            lines = []
+            for key, value in changes:
+                change = {"key": key, "deleted": True} if value is None else {"key": key, "value": value}
+                self._apply(change)
+                lines.append(json.dumps(change) + "\n")
+            if not lines:
+                return
+            if self._journal is None:
+                self._journal = open(self.journal_path, "a")
+            self._journal.write("".join(lines))
+            self._journal.flush()
+            if self.fsync:
+                os.fsync(self._journal.fileno())
+            self._journal_lines += len(lines)
+            if self._journal_lines > max(self.compact_min, len(self.data)):
+                self.compact()
+
+    def compact(self):
+        """Rewrite the snapshot with every entry and empty the journal."""
+        with self._lock:
+            temporary_path = self.path + ".tmp"
+            with open(temporary_path, "w") as file:
+                json.dump(self.data, file, indent=4)
+                if self.fsync:
+                    file.flush()
+                    os.fsync(file.fileno())
+            os.replace(temporary_path, self.path)
+            # Replayed over the new snapshot until truncated, which changes nothing
+            if self._journal is not None:
+                self._journal.close()
+            self._journal = open(self.journal_path, "w")
+            self._journal_lines = 0
+
+    def close(self):
+        """Compact and close the journal."""
+        with self._lock:
+            if self._journal_lines:
+                self.compact()
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+
+    def _apply(self, change):
+        if change.get("deleted"):
+            self.data.pop(change["key"], None)
+        else:
+            self.data[change["key"]] = change["value"]
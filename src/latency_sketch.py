@@ -0,0 +1,265 @@
+import math
+import threading
+import time
+from collections import deque
+from timeseries_store import extract_samples, STATUS_OK, STATUS_FAILED
+
+"""
+Streaming latency percentiles per task.
+
+LatencySketch is a mergeable quantile sketch with logarithmic buckets (as in DDSketch):
+every latency is counted in bucket ceil(log_gamma(value)), so any quantile it reports is
+within relative_accuracy of the true value, an update is one log and one dict increment,
+and two sketches with the same accuracy merge by adding their bucket counts. LatencyStats
+keeps a sketch and loss/error counters per task, in total and per minute, so summaries can
+be merged across tasks and time windows without reading any result file.
+"""
+
+QUANTILES = (0.5, 0.9, 0.95, 0.99)
+
+
+class LatencySketch:
+    def __init__(self, relative_accuracy=0.01, min_value=1e-3):
+        """
+        Quantile sketch with relative error guarantees.
+
+        :param relative_accuracy: Largest relative error of a reported quantile
+        :param min_value: Values at or below this (in ms) are counted as zero
+        """
+        self.relative_accuracy = relative_accuracy
+        self.min_value = min_value
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.buckets = {}
+        self.zero_count = 0
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, value):
+        """
+        Count one value.
+
+        :param value: Latency in ms
+        """
+        if value > self.min_value:
+            index = math.ceil(math.log(value) / self._log_gamma)
+            self.buckets[index] = self.buckets.get(index, 0) + 1
+        else:
+            self.zero_count += 1
+        self.count += 1
+        self.sum += value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        """
+        Add the counts of another sketch to this one.
+
+        :param other: LatencySketch with the same relative accuracy
+        """
+        if other.gamma != self.gamma:
+            raise ValueError("Only sketches with the same relative accuracy can be merged")
+        for index, count in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q):
+        """
+        Value below which a fraction q of the counted values lie.
+
+        :param q: Quantile between 0 and 1
+        :return: Latency in ms, or None if nothing was counted
+        """
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return 0.0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if rank < seen:
+                # Midpoint of the bucket (gamma^(index-1), gamma^index] in relative terms
+                value = 2 * self.gamma ** index / (self.gamma + 1)
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    def to_dict(self):
+        """JSON serializable form, from_dict restores it (e.g. to merge sketches of several services)."""
+        return {"relative_accuracy": self.relative_accuracy, "min_value": self.min_value,
+                "buckets": [[index, count] for index, count in sorted(self.buckets.items())],
+                "zero_count": self.zero_count, "count": self.count, "sum": self.sum,
+                "min": self.min if self.count else None, "max": self.max if self.count else None}
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data["relative_accuracy"], data["min_value"])
+        sketch.buckets = {index: count for index, count in data["buckets"]}
+        sketch.zero_count = data["zero_count"]
+        sketch.count = data["count"]
+        sketch.sum = data["sum"]
+        if sketch.count:
+            sketch.min = data["min"]
+            sketch.max = data["max"]
+        return sketch
+
+
+class TaskStats:
+    __slots__ = ("sketch", "samples", "ok", "failed", "errors")
+
+    def __init__(self, relative_accuracy=0.01):
+        """Latency sketch and status counters of one task over some time span."""
+        self.sketch = LatencySketch(relative_accuracy)
+        self.samples = 0
+        self.ok = 0
+        self.failed = 0
+        self.errors = 0
+
+    def add(self, latency, status):
+        self.samples += 1
+        if status == STATUS_OK:
+            self.ok += 1
+        elif status == STATUS_FAILED:
+            self.failed += 1
+        else:
+            self.errors += 1
+        if latency is not None:
+            self.sketch.add(latency)
+
+    def merge(self, other):
+        self.sketch.merge(other.sketch)
+        self.samples += other.samples
+        self.ok += other.ok
+        self.failed += other.failed
+        self.errors += other.errors
+
+    def to_dict(self):
+        """JSON serializable form, from_dict restores it (e.g. to merge statistics of several services)."""
+        return {"sketch": self.sketch.to_dict(), "samples": self.samples, "ok": self.ok, "failed": self.failed,
+                "errors": self.errors}
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = LatencySketch.from_dict(data["sketch"])
+        stats = cls(sketch.relative_accuracy)
+        stats.sketch = sketch
+        stats.samples = data["samples"]
+        stats.ok = data["ok"]
+        stats.failed = data["failed"]
+        stats.errors = data["errors"]
+        return stats
+
+    def summary(self):
+        """Counters, loss (failed or errored samples over all samples) and latency percentiles."""
+        sketch = self.sketch
+        summary = {"samples": self.samples, "ok": self.ok, "failed": self.failed, "errors": self.errors,
+                   "loss": (self.failed + self.errors) / self.samples if self.samples else None,
+                   "latency_count": sketch.count,
+                   "latency_min": sketch.min if sketch.count else None,
+                   "latency_max": sketch.max if sketch.count else None,
+                   "latency_mean": sketch.sum / sketch.count if sketch.count else None}
+        for q in QUANTILES:
+            summary[f"p{round(q * 100)}"] = sketch.quantile(q)
+        return summary
+
+
+class LatencyStats:
+    def __init__(self, relative_accuracy=0.01, window_seconds=60, windows=60):
+        """
+        Per-task statistics in total and in fixed time windows.
+
+        :param relative_accuracy: Relative accuracy of the latency sketches
+        :param window_seconds: Length of a time window
+        :param windows: Number of latest windows kept per task
+        """
+        self.relative_accuracy = relative_accuracy
+        self.window_seconds = window_seconds
+        self.windows = windows
+        # service_id -> (total TaskStats, deque of (window start, TaskStats))
+        self.tasks = {}
+        self._lock = threading.Lock()
+
+    def record(self, service_id, record):
+        """
+        Count the samples of a timestamped result record. Used as a result listener.
+
+        :param service_id: Service id the record belongs to
+        :param record: Timestamped result record
+        """
+        samples = extract_samples(record["result"])
+        if samples:
+            self.add(service_id, time.time(), samples)
+
+    def add(self, service_id, epoch, samples):
+        """
+        Count samples taken at the same time.
+
+        :param service_id: Service id of the task
+        :param epoch: Epoch seconds of the samples
+        :param samples: List of (latency_ms or None, status)
+        """
+        window_start = epoch - epoch % self.window_seconds
+        with self._lock:
+            entry = self.tasks.get(service_id)
+            if entry is None:
+                entry = self.tasks[service_id] = (TaskStats(self.relative_accuracy), deque(maxlen=self.windows))
+            total, windows = entry
+            if not windows or windows[-1][0] != window_start:
+                windows.append((window_start, TaskStats(self.relative_accuracy)))
+            window = windows[-1][1]
+            for latency, status in samples:
+                total.add(latency, status)
+                window.add(latency, status)
+
+    def merged(self, service_ids=None, since=None):
+        """
+        Statistics of several tasks and time windows merged into one.
+
+        :param service_ids: Service ids to merge, None for every task
+        :param since: Epoch seconds: only windows ending after it, None for the whole lifetime
+        :return: TaskStats
+        """
+        merged = TaskStats(self.relative_accuracy)
+        with self._lock:
+            for service_id, (total, windows) in self.tasks.items():
+                if service_ids is not None and service_id not in service_ids:
+                    continue
+                if since is None:
+                    merged.merge(total)
+                else:
+                    for window_start, window in windows:
+                        if window_start + self.window_seconds > since:
+                            merged.merge(window)
+        return merged
+
+    def summaries(self, service_ids=None, minutes=None):
+        """
+        Summary per task and of all of them merged.
+
+        :param service_ids: Service ids to report, None for every task
+        :param minutes: Only the windows overlapping the latest minutes, None for the whole lifetime
+        :return: {"tasks": {service_id: summary}, "merged": summary, "state": merged TaskStats.to_dict()}
+        """
+        since = None if minutes is None else time.time() - minutes * 60
+        with self._lock:
+            known = [service_id for service_id in self.tasks if service_ids is None or service_id in service_ids]
+        tasks = {service_id: self.merged([service_id], since).summary() for service_id in known}
+        merged = self.merged(known, since)
+        return {"tasks": tasks, "merged": merged.summary(), "state": merged.to_dict()}
+
+    def discard(self, service_id):
+        """
+        Drop the statistics of a task that was stopped.
+
+        :param service_id: Service id of the task
+        """
+        with self._lock:
+            self.tasks.pop(service_id, None)
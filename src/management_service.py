@@ -1,95 +1,117 @@
-import socket
+import os
 import json
 import time
 import threading
+from collections import deque
 from monitoring_service import start_non_blocking_tcp_server
+from monitoring_pool import MonitoringNode, MonitoringPool, ONLINE
+from latency_sketch import TaskStats
+from result_writer import result_filename, stream_results, tail_results
+from task_registry import TaskRegistry
 
 
 class ManagementService:
-    def __init__(self, server_ip, server_port, max_retries=3):
+    def __init__(self, server_ip, server_port, max_retries=3, workers=0, nodes_file="monitoring_services.json",
+                 placement="hash"):
         self.server_ip = server_ip
         self.server_port = server_port
-        self.client_socket = None
         self.max_retries = max_retries
+        # Worker processes the monitoring service shards its tasks across (0 = run them in process)
+        self.workers = workers
+        # Results pushed by the monitoring services, latest first out
+        self.live_results = deque(maxlen=1000)
+        # Every task created from here, indexed by service ID, task type, status and node (config_file.json)
+        self.registry = TaskRegistry("config_file.json")
 
-    def write_to_json_file(self, services, filename):
-        try:
-            # Attempt to open and read the file
-            with open(filename, 'r') as file:
-                data_to_read = json.load(file)
-        except FileNotFoundError:
-            # If the file doesn't exist, start with an empty dictionary
-            data_to_read = []
-
-        service_id = services['service_id']
-        if services["action"] == "add_task":
-            service_details = {"task": services["task"], "frequency": services["frequency"],
-                               "configuration": services["configuration"], "status": "Running"}
-            data_to_append = {service_id: service_details}
-            data_to_read.append(data_to_append)
+        # Monitoring services to connect to: [{"name": "edge-1", "ip": "10.0.0.5", "port": 9999}, ...],
+        # the local monitoring service when no list is configured
+        if os.path.exists(nodes_file):
+            with open(nodes_file, "r") as file:
+                services = json.load(file)
         else:
-            for my_dict in data_to_read:
-                if service_id in my_dict:
-                    if services["action"] == "pause_task":
-                        my_dict[service_id]["status"] = "Paused"
-                    elif services["action"] == "resume_task":
-                        my_dict[service_id]["status"] = "Resumed"
-                    elif services["action"] == "stop_task":
-                        my_dict[service_id]["status"] = "Stopped"
-
-        # Write updated data back to the file
-        with open(filename, 'w') as file:
-            json.dump(data_to_read, file, indent=4)
+            services = [{"name": "local", "ip": server_ip, "port": server_port}]
+        nodes = [MonitoringNode(service.get("name", f"{service['ip']}:{service['port']}"), service["ip"],
+                                service["port"], max_retries, on_result=self.handle_result)
+                 for service in services]
+        self.pool = MonitoringPool(nodes, placement=placement, on_reassign=self.update_task_node)
+        self.pool.load(self.registered_tasks())
+
+    def record_operations(self, services):
+        """
+        Records task operations in the task registry.
+
+        :param services: add/pause/resume/stop message, or a batch message whose operations are recorded together
+        """
+        # A batch updates the registry once for all of its operations
+        operations = services["operations"] if services["action"] == "batch" else [services]
+        added = []
+        updates = []
+        for operation in operations:
+            service_id = operation['service_id']
+            if operation["action"] == "add_task":
+                service_details = {"task": operation["task"], "frequency": operation["frequency"],
+                                   "configuration": operation["configuration"], "status": "Running",
+                                   "node": self.pool.assign(service_id)}
+                if "schedule" in operation:
+                    service_details["schedule"] = operation["schedule"]
+                added.append((service_id, service_details))
+            elif operation["action"] == "pause_task":
+                updates.append((service_id, {"status": "Paused"}))
+            elif operation["action"] == "resume_task":
+                updates.append((service_id, {"status": "Resumed"}))
+            elif operation["action"] == "stop_task":
+                updates.append((service_id, {"status": "Stopped"}))
+        if added:
+            self.registry.put_many(added)
+        if updates:
+            self.registry.update_many(updates)
+
+    def update_task_node(self, service_id, node):
+        """Records the monitoring service a task was moved to in the task registry."""
+        self.registry.update(service_id, node=node)
+
+    def registered_tasks(self):
+        """
+        Tasks in the registry that were not stopped, so they can be moved if their node dies.
+
+        :return: List of (service_id, add_task message, node name or None, paused)
+        """
+        tasks = []
+        for service_id, details in self.registry.items():
+            if details.get("status") == "Stopped":
+                continue
+            message = {"action": "add_task", "service_id": service_id, "task": details["task"],
+                       "frequency": details["frequency"], "configuration": details["configuration"]}
+            if "schedule" in details:
+                message["schedule"] = details["schedule"]
+            tasks.append((service_id, message, details.get("node"), details.get("status") == "Paused"))
+        return tasks
 
     def server_monitoring_service(self):
         """Set the IP and port for the server to start in the background"""
         print("-" * 50)
         # Only server running on that ip and port
         server_thread = threading.Thread(target=start_non_blocking_tcp_server,
-                                         args=(self.server_ip, self.server_port), daemon=True)
+                                         args=(self.server_ip, self.server_port, self.workers), daemon=True)
         server_thread.start()
 
     def client_socket_and_connect(self):
-        """Attempts to establish a new connection to the server with exponential backoff."""
-        attempt = 0
-        while attempt < self.max_retries:
-            try:
-                if self.client_socket:
-                    self.client_socket.close()
-
-                # Create socket
-                self.client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                # Socket configurations for performance and reliability
-                self.client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
-                self.client_socket.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
-                # Connect to server
-                self.client_socket.connect((self.server_ip, self.server_port))
-                print(f"Client connected to [{self.server_ip}] : {self.server_port}\n")
-
-                return True
-
-            # Handle reconnection
-            except socket.error as e:
-                wait = 2 ** attempt  # Exponential backoff
-                print(f"Connection attempt {attempt + 1} failed: {e}. Retrying in {wait} seconds...")
-                time.sleep(wait)
-                attempt += 1
-        print("Failed to reconnect after several attempts. Exiting.")
-        return False
+        """Connects to every monitoring service; True if at least one of them is online."""
+        return self.pool.connect_all()
+
+    def handle_result(self, node, message):
+        """Keeps a result or task event pushed by a monitoring service (already deduplicated by its node)."""
+        message["node"] = node.name
+        self.live_results.append(message)
+        if message["action"] == "task_event":
+            # Stop and pause requests return at once, this is when they have taken effect
+            print(f"\n**Service ID #{message['service_id']} has {message['event']} on [{node.name}] "
+                  f"after {message.get('iterations')} iterations.\n")
 
     def client_sendall_and_response(self, message_data):
-        """Sends a request to the server and waits for a response, with reconnection attempts."""
+        """Sends a request to the monitoring service owning the task and waits for a response."""
         print("-" * 50)
-        try:
-            self.client_socket.sendall(json.dumps(message_data).encode('utf-8'))
-            response = self.client_socket.recv(1024).decode()
-            return response
-        except (BrokenPipeError, ConnectionResetError, socket.error) as e:
-            print(f"Connection lost: {e}. Attempting to reconnect...")
-            if self.client_socket_and_connect():  # Attempt to reconnect
-                self.client_socket.sendall(json.dumps(message_data).encode('utf-8'))  # Retry sending after reconnecting
-            else:
-                print("Unable to reconnect and send the message. Please try again later.")
+        return self.pool.request(message_data)
 
     def client_management_service(self):
         """Handles the UI and user commands."""
@@ -103,6 +125,11 @@ class ManagementService:
             print("D. Stop Task")
             print("E. Render Task")
             print("F. Render Status")
+            print("G. Batch Tasks")
+            print("H. Render Live Results")
+            print("I. Render Monitoring Services")
+            print("J. Query Recent Results")
+            print("K. Render Statistics")
             print("Q. Quit")
             print("=" * 50)
             print("\nPrompt loading..")
@@ -113,7 +140,7 @@ class ManagementService:
             if choice == 'Q':
                 print("Exiting program.")
                 break
-            elif choice in ['A', 'B', 'C', 'D', 'E', 'F']:
+            elif choice in ['A', 'B', 'C', 'D', 'E', 'F', 'G', 'H', 'I', 'J', 'K']:
                 self.execute_command(choice)
             else:
                 print("Invalid option. Please try again.")
@@ -139,7 +166,7 @@ class ManagementService:
             message_data['configuration'] = configuration
 
             # Register services in file
-            self.write_to_json_file(message_data, "config_file.json")
+            self.record_operations(message_data)
             # Send request
             self.client_sendall_and_response(message_data)
         elif choice == 'B':
@@ -148,7 +175,7 @@ class ManagementService:
                 'action': 'pause_task',
                 'service_id': input("Enter service ID: "),
             }
-            self.write_to_json_file(message_data, "config_file.json")
+            self.record_operations(message_data)
             self.client_sendall_and_response(message_data)
         elif choice == 'C':
             # Resume task
@@ -156,7 +183,7 @@ class ManagementService:
                 'action': 'resume_task',
                 'service_id': input("Enter service ID: ")
             }
-            self.write_to_json_file(message_data, "config_file.json")
+            self.record_operations(message_data)
             self.client_sendall_and_response(message_data)
         elif choice == 'D':
             # Stop task
@@ -164,26 +191,173 @@ class ManagementService:
                 'action': 'stop_task',
                 'service_id': input("Enter service ID: ")
             }
-            self.write_to_json_file(message_data, "config_file.json")
+            self.record_operations(message_data)
             self.client_sendall_and_response(message_data)
         elif choice == 'E':
             # Render task output
             input_file = input("Enter file name: ")
-            filename = f"{input_file}.json"
-            with open(filename, "r") as file:
-                result = json.load(file)
-                for stream in result:
+            last = input("Enter number of latest results (blank for all): ")
+            filename = result_filename(input_file)
+            if os.path.exists(filename):
+                # Tail or stream the JSON lines log without loading the whole file
+                if last:
+                    results = tail_results(filename, int(last))
+                else:
+                    results = stream_results(filename)
+                for stream in results:
                     print(stream)
+            else:
+                # Results written before the JSON lines log was introduced
+                with open(f"{input_file}.json", "r") as file:
+                    result = json.load(file)
+                    if last:
+                        result = result[-int(last):]
+                    for stream in result:
+                        print(stream)
         elif choice == 'F':
             # Render task status
-            service_id = input("Enter service ID: ")
-            filename = "config_file.json"
-            with open(filename, "r") as file:
-                data_to_read = json.load(file)
-                for my_dict in data_to_read:
-                    if service_id in my_dict:
-                        print(f"Service ID: {service_id} | Service: {my_dict[service_id]['task']} | Status: "
-                              f"{my_dict[service_id]['status']}")
+            service_id = input("Enter service ID (blank for a summary): ")
+            if service_id:
+                details = self.registry.get(service_id)
+                if details is not None:
+                    print(f"Service ID: {service_id} | Service: {details['task']} | Status: {details['status']} | "
+                          f"Node: {details.get('node')}")
+            else:
+                # Counts kept by the registry's indexes, no task is visited
+                print(f"Tasks: {len(self.registry)}")
+                for field in ("status", "task", "node"):
+                    counts = self.registry.counts(field)
+                    print(f"By {field}: " + ", ".join(f"{value}: {counts[value]}" for value in sorted(counts, key=str)))
+        elif choice == 'G':
+            # Batch of task operations read from a JSON file:
+            # [{"action": "add_task", "service_id": "0100", "task": "ping", "frequency": 5, "configuration": [...]}, ...]
+            input_file = input("Enter batch file name: ")
+            with open(input_file, "r") as file:
+                operations = json.load(file)
+            response = self.execute_batch(operations)
+            print(f"Batch of {len(operations)} operations {response['status']}.")
+            for result in response["results"]:
+                if "error" in result:
+                    print(f"Service ID: {result['service_id']} | {result['action']} | ERROR: {result['error']}")
+                elif result["ok"]:
+                    print(f"Service ID: {result['service_id']} | {result['action']} | Node: {result['node']} | "
+                          f"{result['message']}")
+        elif choice == 'H':
+            # Render results pushed in real time
+            self.render_live_results(input("Enter service ID (blank for all): "))
+        elif choice == 'I':
+            # Render health and load of every monitoring service
+            self.render_monitoring_services()
+        elif choice == 'J':
+            # Recent results held in memory by the monitoring service running the task
+            message_data = {'action': 'query_task', 'service_id': input("Enter service ID: ")}
+            last = input("Enter number of latest results (blank for all): ")
+            seconds = input("Enter how many seconds back (blank for no limit): ")
+            if last:
+                message_data['last'] = int(last)
+            if seconds:
+                message_data['since'] = time.time() - float(seconds)
+            response = self.client_sendall_and_response(message_data)
+            if response is not None:
+                response = json.loads(response)
+                if "error" in response:
+                    print(f"WARNING: {response['error']}")
+                for stream in response.get("results", []):
+                    print(stream)
+        elif choice == 'K':
+            # Latency percentiles and loss per task and merged
+            service_id = input("Enter service ID (blank for all): ")
+            minutes = input("Enter how many minutes back (blank for all time): ")
+            self.render_statistics(service_id, int(minutes) if minutes else None)
+
+    def render_live_results(self, service_id=None):
+        """Prints the results pushed by the monitoring service, optionally for one service ID."""
+        for message in list(self.live_results):
+            if not service_id or message["service_id"] == service_id:
+                detail = message["record"] if message["action"] == "result" else f"Task {message['event']}"
+                print(f"Service ID: {message['service_id']} | Node: {message['node']} | {detail}")
+
+    def render_statistics(self, service_id=None, minutes=None):
+        """
+        Prints latency percentiles and loss of one task, or of every task merged across all monitoring services.
+
+        :param service_id: Service ID, None for every task
+        :param minutes: Only the latest minutes, None for the whole lifetime
+        """
+        message_data = {'action': 'stats'}
+        if minutes:
+            message_data['minutes'] = minutes
+        if service_id:
+            message_data['service_id'] = service_id
+            nodes = [self.pool.nodes[self.pool.assign(service_id)]]
+        else:
+            nodes = [node for node in self.pool.nodes.values() if node.status == ONLINE]
+
+        merged = None
+        print("-" * 50)
+        for node in nodes:
+            response = node.request(message_data)
+            if response is None:
+                continue
+            response = json.loads(response)
+            for task_id, summary in response["tasks"].items():
+                print(f"Service ID: {task_id} | Node: {node.name} | {self.format_statistics(summary)}")
+            schedule = response.get("schedule", {})
+            for task_id, counters in schedule.items():
+                print(f"Service ID: {task_id} | Node: {node.name} | Schedule: {counters['schedule']} | "
+                      f"Iterations: {counters['iterations']} | Late: {counters['late']} | "
+                      f"Missed: {counters['missed']} | Worst delay: {counters['max_lateness_ms']:.2f} ms")
+            if schedule and not service_id:
+                late = sum(counters["late"] for counters in schedule.values())
+                missed = sum(counters["missed"] for counters in schedule.values())
+                print(f"Node: {node.name} | Late iterations: {late} | Missed deadlines: {missed}")
+            resolver = response.get("resolver")
+            if resolver is not None and not service_id:
+                # Lookups saved by the node's hostname cache
+                print(f"Node: {node.name} | Resolver cache hits: {resolver['hits']} | Misses: {resolver['misses']} | "
+                      f"Negative hits: {resolver['negative_hits']} | Refreshes: {resolver['refreshes']}")
+            # Sketches merge exactly, so the percentiles over every node are as accurate as per task
+            stats = TaskStats.from_dict(response["state"])
+            if merged is None:
+                merged = stats
+            else:
+                merged.merge(stats)
+        if merged is not None and not service_id:
+            print(f"All tasks | {self.format_statistics(merged.summary())}")
+
+    @staticmethod
+    def format_statistics(summary):
+        def ms(value):
+            return "-" if value is None else f"{value:.2f} ms"
+        loss = "-" if summary["loss"] is None else f"{summary['loss']:.1%}"
+        return (f"Samples: {summary['samples']} | Loss: {loss} | Errors: {summary['errors']} | "
+                f"p50: {ms(summary['p50'])} | p95: {ms(summary['p95'])} | p99: {ms(summary['p99'])} | "
+                f"Max: {ms(summary['latency_max'])}")
+
+    def render_monitoring_services(self):
+        """Prints the status and number of tasks of every monitoring service."""
+        assigned = {}
+        for assignment in list(self.pool.assignments.values()):
+            assigned[assignment["node"]] = assigned.get(assignment["node"], 0) + 1
+        for node in self.pool.nodes.values():
+            print(f"Node: {node.name} | Address: [{node.server_ip}] : {node.server_port} | Status: {node.status} | "
+                  f"Tasks: {assigned.get(node.name, 0)} (reported: {node.reported_tasks})")
+
+    def execute_batch(self, operations):
+        """
+        Sends many task operations, one batch message per monitoring service. Each monitoring
+        service applies all of its operations or none, and the task registry is updated once
+        with the operations that were applied.
+
+        :param operations: List of messages shaped like the single add/pause/resume/stop messages
+        :return: Batch response: status "applied", "partial" or "rejected", one result per operation
+        """
+        print("-" * 50)
+        response = self.pool.batch(operations)
+        applied = [operation for operation, result in zip(operations, response["results"]) if result["ok"]]
+        if applied:
+            self.record_operations({'action': 'batch', 'operations': applied})
+        return response
 
     def run_management_service(self):
         """Main method to run the client application."""
@@ -192,13 +366,15 @@ class ManagementService:
             try:
                 self.client_management_service()  # run management service (self.client_sendall_and_response())
             finally:
-                if self.client_socket:
-                    self.client_socket.close()  # close management service
-                    print("Connection closed.")
+                self.pool.close()  # close management service
+                self.registry.close()  # compact the task registry's journal
+                print("Connection closed.")
 
 
 if __name__ == "__main__":
     server_ip = "127.0.0.1"
     server_port = 9999
-    ms_object = ManagementService(server_ip, server_port)
+    # Worker processes for the probes, e.g. os.cpu_count(); 0 runs them in the monitoring service process
+    workers = 0
+    ms_object = ManagementService(server_ip, server_port, workers=workers)
     ms_object.run_management_service()
@@ -0,0 +1,438 @@
+import bisect
+import hashlib
+import json
+import queue
+import socket
+import threading
+import time
+
+"""
+Connections from the management service to many monitoring services.
+
+MonitoringNode is one persistent (keepalive) connection to a monitoring service, with its own
+receiver thread, pushed result sequence and health status. MonitoringPool keeps a node per
+configured monitoring service, places every task on one node (consistent hashing or least
+load), routes later operations on the task to that node, and a supervisor thread tracks
+node health with heartbeats. When a node goes offline its tasks are added again on the
+nodes still online; once it comes back, the tasks it no longer owns are stopped on it.
+"""
+
+ONLINE = "Online"
+RECONNECTING = "Reconnecting"
+OFFLINE = "Offline"
+PLACEMENT_POLICIES = ("hash", "least_load")
+
+
+class MonitoringNode:
+    def __init__(self, name, server_ip, server_port, max_retries=3, on_result=None):
+        """
+        Persistent connection to one monitoring service.
+
+        :param name: Name of the monitoring service, recorded with its tasks
+        :param server_ip: IP address of the monitoring service
+        :param server_port: Port of the monitoring service
+        :param max_retries: Connection attempts (with exponential backoff) before giving up
+        :param on_result: Callable on_result(node, message) for every pushed result and task event
+        """
+        self.name = name
+        self.server_ip = server_ip
+        self.server_port = server_port
+        self.max_retries = max_retries
+        self.on_result = on_result
+        self.client_socket = None
+        self.status = OFFLINE
+        # Responses to our requests, filled by the receiver thread
+        self.responses = queue.Queue()
+        self.response_timeout = 30
+        self.send_lock = threading.Lock()
+        # One request waiting for its response at a time (UI and supervisor share the node)
+        self.request_lock = threading.RLock()
+        # Highest pushed result seq seen: sequence numbers are per monitoring service
+        self.last_seq = 0
+        # Time of the oldest heartbeat not answered yet (None when all are answered),
+        # time of the last heartbeat response and the task count it reported
+        self.heartbeat_sent = None
+        self.last_heartbeat = 0.0
+        self.reported_tasks = None
+
+    def connect(self, max_retries=None, verbose=True):
+        """Attempts to establish a new connection to the server with exponential backoff."""
+        max_retries = self.max_retries if max_retries is None else max_retries
+        attempt = 0
+        while attempt < max_retries:
+            try:
+                if self.client_socket:
+                    self.client_socket.close()
+
+                # Create socket
+                self.client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                # Socket configurations for performance and reliability
+                self.client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                self.client_socket.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+                # Connect to server
+                self.client_socket.connect((self.server_ip, self.server_port))
+                print(f"Client connected to [{self.server_ip}] : {self.server_port}\n")
+
+                # Receive pushed results (and spooled ones held while we were away)
+                threading.Thread(target=self.receive_messages, args=(self.client_socket,), daemon=True).start()
+                self.send_message({"action": "subscribe"})
+
+                self.status = ONLINE
+                self.heartbeat_sent = None
+                return True
+
+            # Handle reconnection
+            except socket.error as e:
+                attempt += 1
+                if attempt < max_retries:
+                    wait = 2 ** (attempt - 1)  # Exponential backoff
+                    print(f"Connection attempt {attempt} to [{self.name}] failed: {e}. "
+                          f"Retrying in {wait} seconds...")
+                    time.sleep(wait)
+        if verbose:
+            print(f"Failed to connect to monitoring service [{self.name}] after {max_retries} attempts.")
+        self.status = OFFLINE
+        return False
+
+    def close(self):
+        """Closes the connection; the receiver thread ends with it."""
+        self.status = OFFLINE
+        if self.client_socket:
+            self.client_socket.close()
+
+    def send_message(self, message_data):
+        """Sends one newline delimited message; the receiver thread sends acknowledgments too."""
+        with self.send_lock:
+            self.client_socket.sendall((json.dumps(message_data) + "\n").encode('utf-8'))
+
+    def receive_messages(self, client_socket):
+        """
+        Receiver thread: splits the stream into messages, handles pushed results and heartbeats
+        and queues responses for request.
+
+        :param client_socket: Socket of this connection, the thread ends when it closes
+        """
+        buffer = b""
+        try:
+            while True:
+                data = client_socket.recv(65536)
+                if not data:
+                    break
+                buffer += data
+                *lines, buffer = buffer.split(b"\n")
+                acknowledge = False
+                for line in lines:
+                    if not line.strip():
+                        continue
+                    message = json.loads(line)
+                    if message.get("action") in ("result", "task_event"):
+                        self.handle_result(message)
+                        acknowledge = True
+                    elif message.get("action") == "heartbeat":
+                        self.last_heartbeat = time.monotonic()
+                        self.heartbeat_sent = None
+                        self.reported_tasks = message.get("tasks")
+                    else:
+                        self.responses.put(message)
+                if acknowledge:
+                    # One cumulative acknowledgment for everything received so far
+                    with self.send_lock:
+                        client_socket.sendall((json.dumps({"action": "ack", "seq": self.last_seq}) + "\n")
+                                              .encode('utf-8'))
+        except (OSError, ValueError):
+            pass
+        # The current connection dropped: let the supervisor reconnect
+        if client_socket is self.client_socket and self.status == ONLINE:
+            self.status = RECONNECTING
+
+    def handle_result(self, message):
+        """Hands on a result pushed by the monitoring service, dropping replayed duplicates."""
+        if message["seq"] <= self.last_seq:
+            return
+        self.last_seq = message["seq"]
+        if self.on_result is not None:
+            self.on_result(self, message)
+
+    def receive_response(self, action):
+        """Waits for the response to our request with the given action."""
+        while True:
+            try:
+                response = self.responses.get(timeout=self.response_timeout)
+            except queue.Empty:
+                raise socket.timeout(f"No response to [{action}] from monitoring service [{self.name}]")
+            # Skip responses left over from requests that were retried
+            if response.get("action") == action:
+                return json.dumps(response)
+
+    def request(self, message_data):
+        """Sends a request to the server and waits for a response, with reconnection attempts."""
+        with self.request_lock:
+            return self._request(message_data)
+
+    def _request(self, message_data):
+        try:
+            self.send_message(message_data)
+            return self.receive_response(message_data['action'])
+        except (BrokenPipeError, ConnectionResetError, socket.error, AttributeError) as e:
+            print(f"Connection to [{self.name}] lost: {e}. Attempting to reconnect...")
+            self.status = RECONNECTING
+            if self.connect():  # Attempt to reconnect
+                try:
+                    self.send_message(message_data)  # Retry sending after reconnecting
+                    return self.receive_response(message_data['action'])
+                except socket.error as e:
+                    print(f"Retry to [{self.name}] failed: {e}.")
+            else:
+                print("Unable to reconnect and send the message. Please try again later.")
+
+    def heartbeat(self):
+        """Sends a heartbeat; the receiver thread records the response."""
+        try:
+            if self.heartbeat_sent is None:
+                self.heartbeat_sent = time.monotonic()
+            self.send_message({"action": "heartbeat"})
+        except (OSError, AttributeError):
+            self.status = RECONNECTING
+
+
+class HashRing:
+    def __init__(self, names, replicas=64):
+        """
+        Consistent hash ring: a key maps to the first node clockwise from its hash, so adding or
+        removing a node only moves the keys of that node.
+
+        :param names: Names of the nodes
+        :param replicas: Points per node on the ring, spreads the keys evenly
+        """
+        self._ring = sorted((self._hash(f"{name}#{replica}"), name) for name in names for replica in range(replicas))
+        self._hashes = [point for point, _ in self._ring]
+
+    @staticmethod
+    def _hash(key):
+        return int.from_bytes(hashlib.md5(key.encode("utf-8")).digest()[:8], "big")
+
+    def lookup(self, key, accept=lambda name: True):
+        """
+        Node owning key, skipping nodes that are not accepted (e.g. offline).
+
+        :param key: Key to place, e.g. a service id
+        :param accept: Predicate on node names
+        :return: Node name, or None if no node is accepted
+        """
+        if not self._ring:
+            return None
+        start = bisect.bisect(self._hashes, self._hash(key))
+        for offset in range(len(self._ring)):
+            name = self._ring[(start + offset) % len(self._ring)][1]
+            if accept(name):
+                return name
+        return None
+
+
+class MonitoringPool:
+    def __init__(self, nodes, placement="hash", heartbeat_interval=5.0, heartbeat_timeout=15.0, on_reassign=None):
+        """
+        Connections to every configured monitoring service, with task placement and health tracking.
+
+        :param nodes: List of MonitoringNode
+        :param placement: "hash" (consistent hashing of service ids) or "least_load" (node with fewest tasks)
+        :param heartbeat_interval: Seconds between heartbeats and reconnection attempts
+        :param heartbeat_timeout: Seconds without a heartbeat response before a node is considered down
+        :param on_reassign: Callable on_reassign(service_id, node_name) when a task moves to another node
+        """
+        if placement not in PLACEMENT_POLICIES:
+            raise ValueError(f"placement must be one of {PLACEMENT_POLICIES}, not {placement!r}")
+        self.nodes = {node.name: node for node in nodes}
+        self.placement = placement
+        self.heartbeat_interval = heartbeat_interval
+        self.heartbeat_timeout = heartbeat_timeout
+        self.on_reassign = on_reassign
+        self.ring = HashRing(self.nodes)
+
+        # service_id -> {"node": name, "message": add_task message, "paused": bool}
+        self.assignments = {}
+        # node name -> service ids moved away while it was down, stopped on it when it returns
+        self.orphaned = {name: set() for name in self.nodes}
+        self.lock = threading.RLock()
+        self._supervisor = None
+        self._stop_event = threading.Event()
+
+    def connect_all(self):
+        """
+        Connects to every monitoring service concurrently and starts the supervisor.
+
+        :return: True if at least one monitoring service is online
+        """
+        threads = [threading.Thread(target=node.connect, daemon=True) for node in self.nodes.values()]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for node in self.nodes.values():
+            if node.status == OFFLINE:
+                self._node_down(node)
+        if self._supervisor is None:
+            self._supervisor = threading.Thread(target=self._supervise, name="pool-supervisor", daemon=True)
+            self._supervisor.start()
+        return bool(self.online_nodes())
+
+    def close(self):
+        """Stops the supervisor and closes every connection."""
+        self._stop_event.set()
+        for node in self.nodes.values():
+            node.close()
+
+    def online_nodes(self):
+        return [name for name, node in self.nodes.items() if node.status == ONLINE]
+
+    def load(self, tasks):
+        """
+        Seeds the placement table with tasks created earlier (e.g. read from config_file.json).
+
+        :param tasks: Iterable of (service_id, add_task message, node name or None, paused)
+        """
+        with self.lock:
+            for service_id, message, node, paused in tasks:
+                if node not in self.nodes:
+                    node = self._place(service_id)
+                self.assignments[service_id] = {"node": node, "message": message, "paused": paused}
+
+    def assign(self, service_id):
+        """
+        Node of a task, placing it first if it has none.
+
+        :param service_id: Service id of the task
+        :return: Node name
+        """
+        with self.lock:
+            if service_id not in self.assignments:
+                self.assignments[service_id] = {"node": self._place(service_id), "message": None, "paused": False}
+            return self.assignments[service_id]["node"]
+
+    def request(self, message_data):
+        """
+        Sends a task operation to the node owning its task.
+
+        :param message_data: add/pause/resume/stop message
+        :return: Response as a JSON string, or None if the node could not be reached
+        """
+        node = self.nodes[self.assign(message_data["service_id"])]
+        response = node.request(message_data)
+        if response is not None:
+            self._record(message_data)
+        return response
+
+    def batch(self, operations):
+        """
+        Sends a batch as one batch message per node. Each node applies its share all or nothing.
+
+        :param operations: List of add/pause/resume/stop messages
+        :return: Batch response: status "applied" only if every node applied its share
+        """
+        by_node = {}
+        for index, operation in enumerate(operations):
+            by_node.setdefault(self.assign(operation.get("service_id")), []).append(index)
+
+        results = [None] * len(operations)
+        statuses = set()
+        for name, indexes in by_node.items():
+            shared = [operations[index] for index in indexes]
+            response = self.nodes[name].request({"action": "batch", "operations": shared})
+            if response is None:
+                statuses.add("rejected")
+                for index in indexes:
+                    results[index] = {"action": operations[index].get("action"),
+                                      "service_id": operations[index].get("service_id"), "ok": False,
+                                      "error": f"Monitoring service [{name}] unreachable"}
+                continue
+            response = json.loads(response)
+            statuses.add(response["status"])
+            for index, result in zip(indexes, response["results"]):
+                result["node"] = name
+                results[index] = result
+                if result["ok"]:
+                    self._record(operations[index])
+        status = "applied" if statuses == {"applied"} else "partial" if "applied" in statuses else "rejected"
+        return {"action": "batch", "status": status, "results": results}
+
+    def _record(self, operation):
+        # Keep what is needed to add the task again on another node
+        with self.lock:
+            assignment = self.assignments.get(operation["service_id"])
+            if assignment is None:
+                return
+            if operation["action"] == "add_task":
+                assignment["message"] = dict(operation)
+                assignment["paused"] = False
+            elif operation["action"] == "pause_task":
+                assignment["paused"] = True
+            elif operation["action"] == "resume_task":
+                assignment["paused"] = False
+            elif operation["action"] == "stop_task":
+                del self.assignments[operation["service_id"]]
+
+    def _place(self, service_id, exclude=()):
+        online = [name for name in self.online_nodes() if name not in exclude]
+        # Nothing online: still place the task, it moves once a node is back
+        candidates = online or [name for name in self.nodes if name not in exclude] or list(self.nodes)
+        if self.placement == "least_load":
+            load = {name: 0 for name in candidates}
+            for assignment in self.assignments.values():
+                if assignment["node"] in load:
+                    load[assignment["node"]] += 1
+            return min(candidates, key=lambda name: load[name])
+        return self.ring.lookup(service_id, lambda name: name in candidates)
+
+    def _supervise(self):
+        while not self._stop_event.wait(self.heartbeat_interval):
+            for node in list(self.nodes.values()):
+                if node.status == ONLINE:
+                    # Only count time since a heartbeat was sent, the supervisor may have been busy
+                    if node.heartbeat_sent is not None and \
+                            time.monotonic() - node.heartbeat_sent > self.heartbeat_timeout:
+                        print(f"WARNING: Monitoring service [{node.name}] stopped answering heartbeats.")
+                        node.status = RECONNECTING
+                    else:
+                        node.heartbeat()
+                if node.status == RECONNECTING:
+                    if not node.connect():
+                        self._node_down(node)
+                elif node.status == OFFLINE:
+                    # Keep trying the node quietly, one attempt per heartbeat interval
+                    if node.connect(max_retries=1, verbose=False):
+                        self._node_up(node)
+
+    def _node_down(self, node):
+        """Adds the tasks of a node that went offline again on the nodes still online."""
+        with self.lock:
+            moved = [(service_id, assignment) for service_id, assignment in self.assignments.items()
+                     if assignment["node"] == node.name and assignment["message"] is not None]
+            if not moved:
+                return
+            if not any(name != node.name for name in self.online_nodes()):
+                print(f"WARNING: Monitoring service [{node.name}] is offline and no other service is online, "
+                      f"{len(moved)} tasks wait for it.")
+                return
+            print(f"WARNING: Monitoring service [{node.name}] is offline, redistributing {len(moved)} tasks.")
+            for service_id, assignment in moved:
+                assignment["node"] = self._place(service_id, exclude=(node.name,))
+                self.orphaned[node.name].add(service_id)
+        # Send outside the lock, requests can wait on the network
+        for service_id, assignment in moved:
+            target = self.nodes[assignment["node"]]
+            if target.request(assignment["message"]) is not None:
+                if assignment["paused"]:
+                    target.request({"action": "pause_task", "service_id": service_id})
+                print(f"Service ID: {service_id} moved from [{node.name}] to [{target.name}]")
+                if self.on_reassign is not None:
+                    self.on_reassign(service_id, target.name)
+
+    def _node_up(self, node):
+        """Stops tasks that were moved away from a node while it was offline."""
+        print(f"Monitoring service [{node.name}] is back online.")
+        with self.lock:
+            stale = [service_id for service_id in self.orphaned[node.name]
+                     if self.assignments.get(service_id, {}).get("node") != node.name]
+            self.orphaned[node.name].clear()
+        for service_id in stale:
+            node.request({"action": "stop_task", "service_id": service_id})
@@ -1,193 +1,525 @@
+import atexit
+import codecs
+import inspect
+import selectors
 import socket
-import select
+import threading
 import typing
 import json
 import time
-import threading
 from monitoring_service_task import *
-
+from task_scheduler import ScheduledTask, TaskScheduler, FIXED_DELAY, FIXED_RATE, SCHEDULES
+from shard_pool import ShardPool
+from result_stream import ResultStream
+from result_buffer import RecentResults
+from timeseries_store import TimeSeriesStore
+from latency_sketch import LatencyStats
+from resolver_cache import resolver_cache
+from journal_store import JournalStore
+
+# Checkpoint of every tracked task (definition, paused or running, iteration), restored on startup
 filename = "thread_file.json"
 thread_tracker = {}
+# Checkpoint store, opened by start_non_blocking_tcp_server
+task_state = None
+# Orders checkpoints taken by the command handlers and the periodic checkpoint thread
+checkpoint_lock = threading.Lock()
+# Seconds between checkpoints of the iteration counters (definitions and states are checkpointed at once)
+CHECKPOINT_INTERVAL = 30.0
+# Seconds over which the first iterations of restored tasks are spread
+RESTORE_WINDOW = 5.0
+# Server accepting management connections, set by start_non_blocking_tcp_server
+monitoring_server = None
+
+# Map task to task_function
+task_mapping = {                    # sample configurations:
+    "ping": ping_task,              # [domain, count] -> [google.com, 1]
+    "traceroute": traceroute_task,  # [domain, count, (mode)] -> [google.com, 1, parallel]
+    "http": http_task,              # [domain, (timeout), (warm|cold)] -> [http://google.com, 5, warm]
+    "https": https_task,            # [domain, (timeout), (warm|cold)] -> [https://google.com, 5, cold]
+    "ntp": ntp_task,                # [domain, (port)] -> [pool.ntp.org]
+    "dns": dns_task,                # [domain, server, record type, (port)] -> [www.google.com, 8.8.8.8, A]
+    "tcp": tcp_task,                # [domain, port] -> [github.com, 22]
+    "tcp_sweep": tcp_sweep_task,    # [hosts, ports, (timeout), (concurrency)] -> ["10.0.0.1-20,github.com", "22,80-89", 3, 256]
+    "udp_sweep": udp_sweep_task,    # [hosts, ports, (timeout), (concurrency), (payload)] -> ["10.0.0.1-20", "53,123,161", 3, 256, ""]
+    "udp": udp_task                 # [domain, port] -> [dns.google.com, 53]
+}
+# Coroutine counterparts run on the probe loop when data['engine'] == 'async'
+async_task_mapping = {
+    "http": async_http_task,
+    "https": async_https_task,
+    "ntp": async_ntp_task,
+    "dns": async_dns_task,
+    "tcp": async_tcp_task,
+    "udp": async_udp_task
+}
+# Task function -> (task name, engine), to checkpoint a task by name
+task_names = {function: (task, "thread") for task, function in task_mapping.items()}
+task_names.update({function: (task, "async") for task, function in async_task_mapping.items()})
+# Pushes every result to the subscribed management service, spools them while none is connected
+result_stream = ResultStream()
+result_listeners.append(result_stream.publish)
+
+
+def report_task_event(task, event):
+    """
+    Push a stop or pause that has taken effect to the management service, the request itself does not wait for it.
+
+    :param task: ScheduledTask that stopped or paused
+    :param event: "stopped" or "paused"
+    """
+    result_stream.publish_event(task.service_id, event, iterations=task.iteration - 1)
+
+
+# Heap of next-due tasks feeding a bounded pool of probe workers
+scheduler = TaskScheduler(max_workers=32, on_event=report_task_event)
+# Worker processes running the tasks instead, set by start_non_blocking_tcp_server when workers > 0
+shard_pool = None
+# Latest results of every task in memory, answers query_task without reading the result files
+recent_results = RecentResults(capacity=1024)
+result_listeners.append(recent_results.record)
+# Latency and status history in compact columnar segments with 1m/1h rollups
+timeseries_store = TimeSeriesStore("timeseries")
+result_listeners.append(timeseries_store.record)
+# Streaming latency percentiles and loss counters per task, in total and per minute
+latency_stats = LatencyStats()
+result_listeners.append(latency_stats.record)
+
+
+class ClientConnection:
+    # Largest request or pending output kept for one connection before it is dropped
+    MAX_BUFFER_SIZE = 16 * 1024 * 1024
+
+    def __init__(self, client_socket, client_address, wake_loop):
+        """
+        State of one management connection: buffered input and a non-blocking write buffer.
+
+        :param client_socket: Accepted non-blocking client socket
+        :param client_address: Address of the client
+        :param wake_loop: Callable waking the server loop so it flushes queued output
+        """
+        self.socket = client_socket
+        self.address = client_address
+        self.inbound = ""
+        self.outbound = bytearray()
+        self.events = selectors.EVENT_READ
+        self.closed = False
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self._lock = threading.Lock()
+        self._wake_loop = wake_loop
+
+    def sendall(self, data):
+        """
+        Queue data for the client; never blocks. Safe to call from any thread.
+
+        :param data: Bytes to send
+        """
+        with self._lock:
+            if self.closed:
+                raise ConnectionError(f"Connection to {self.address} is closed")
+            if len(self.outbound) + len(data) > self.MAX_BUFFER_SIZE:
+                raise ConnectionError(f"Output buffer for {self.address} is full, client is not reading")
+            self.outbound += data
+        self._wake_loop()
+
+    def feed(self, data):
+        """
+        Add received bytes and return every complete JSON message they finish.
+
+        Messages may be newline delimited or simply concatenated.
+
+        :param data: Bytes received from the socket
+        :return: List of decoded messages
+        """
+        self.inbound += self._decoder.decode(data)
+        messages = []
+        decoder = json.JSONDecoder()
+        buffer = self.inbound.lstrip()
+        while buffer:
+            try:
+                message, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                # Incomplete message, wait for more data unless the buffer keeps growing
+                if len(buffer) > self.MAX_BUFFER_SIZE:
+                    raise
+                break
+            messages.append(message)
+            buffer = buffer[end:].lstrip()
+        self.inbound = buffer
+        return messages
+
+    def flush(self):
+        """
+        Send as much queued output as the socket accepts without blocking.
+
+        :return: True if output is still pending
+        """
+        with self._lock:
+            while self.outbound:
+                try:
+                    sent = self.socket.send(self.outbound)
+                except (BlockingIOError, InterruptedError):
+                    break
+                del self.outbound[:sent]
+            return bool(self.outbound)
 
 
-def read_from_json_file(filename):
+class MonitoringServer:
+    def __init__(self, server_ip: str, server_port: int):
+        """
+        Management connections multiplexed with selectors (epoll on Linux).
+
+        The loop blocks in select() until a socket is ready or another thread queues output,
+        so an idle server uses no CPU, and replies are written from per-connection buffers
+        so a slow client never blocks the loop.
+
+        :param server_ip: The IP address the server will listen on.
+        :param server_port: The port number the server will listen on.
+        """
+        self.server_ip = server_ip
+        self.server_port = server_port
+        self.selector = selectors.DefaultSelector()
+        self.connections: typing.Dict[socket.socket, ClientConnection] = {}
+        self._wakeup_receiver, self._wakeup_sender = socket.socketpair()
+        self._wakeup_receiver.setblocking(False)
+        self._wakeup_sender.setblocking(False)
+        self.server_socket = None
+
+    def wake(self):
+        """Interrupt select() so queued output gets registered for writing."""
+        try:
+            self._wakeup_sender.send(b"\0")
+        except (BlockingIOError, InterruptedError):
+            # A wake up is already pending
+            pass
+
+    def serve_forever(self):
+        # Create server socket
+        self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        # Configuration of socket
+        self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        self.server_socket.setblocking(False)
+        # Prepare socket for listening
+        self.server_socket.bind((self.server_ip, self.server_port))
+        self.server_socket.listen(socket.SOMAXCONN)
+
+        self.selector.register(self.server_socket, selectors.EVENT_READ)
+        self.selector.register(self._wakeup_receiver, selectors.EVENT_READ)
+        print(f"\nMonitoring Service on: [{self.server_ip}] : {self.server_port}")
+
+        while True:
+            # Block until a socket is ready, no timeout needed
+            for key, events in self.selector.select():
+                if key.fileobj is self.server_socket:
+                    self._accept()
+                elif key.fileobj is self._wakeup_receiver:
+                    self._drain_wakeups()
+                else:
+                    connection = key.data
+                    if events & selectors.EVENT_READ:
+                        self._read(connection)
+                    if events & selectors.EVENT_WRITE and not connection.closed:
+                        self._write(connection)
+
+    def _accept(self):
+        # Accept every pending connection
+        while True:
+            try:
+                client_socket, client_address = self.server_socket.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            client_socket.setblocking(False)
+            connection = ClientConnection(client_socket, client_address, self.wake)
+            self.connections[client_socket] = connection
+            self.selector.register(client_socket, selectors.EVENT_READ, connection)
+
+    def _drain_wakeups(self):
+        try:
+            while self._wakeup_receiver.recv(4096):
+                pass
+        except (BlockingIOError, InterruptedError):
+            pass
+        # Register output queued by other threads
+        for connection in list(self.connections.values()):
+            if connection.outbound:
+                self._write(connection)
+
+    def _read(self, connection):
+        try:
+            message = connection.socket.recv(65536)
+            if not message:
+                print(f"CLEAN UP: Closing connection to socket: {connection.socket}")
+                self._close(connection)
+                return
+            for client_data in connection.feed(message):
+                handle_monitoring_services(connection, client_data)
+            if connection.outbound:
+                self._write(connection)
+        except (BlockingIOError, InterruptedError):
+            pass
+        except Exception as e:
+            print(f"\n\n**ERROR: {connection.socket}: {e}")
+            print(f"**ERROR: Closing connection to socket: {connection.socket}\n\n")
+            self._close(connection)
+
+    def _write(self, connection):
+        try:
+            pending = connection.flush()
+        except OSError as e:
+            print(f"CLEAN UP: Closing connection to socket: {connection.socket}: {e}")
+            self._close(connection)
+            return
+        # Only ask for write readiness while output is pending
+        events = selectors.EVENT_READ | selectors.EVENT_WRITE if pending else selectors.EVENT_READ
+        if events != connection.events:
+            self.selector.modify(connection.socket, events, connection)
+            connection.events = events
+
+    def _close(self, connection):
+        # Results it did not acknowledge go back to the spool
+        result_stream.unsubscribe(connection)
+        with connection._lock:
+            connection.closed = True
+            connection.outbound.clear()
+        if connection.socket in self.connections:
+            del self.connections[connection.socket]
+            self.selector.unregister(connection.socket)
+        connection.socket.close()
+
+
+def task_checkpoint(service_id):
     """
-    Read from file for user
+    Loadable checkpoint of a tracked task.
 
-    :param filename: Will always be thread_file.json
-    :return: data that will be read to user
+    :param service_id: Service id of the task
+    :return: {"task", "engine", "frequency", "configuration", "schedule", "paused", "iteration"},
+             None if the task is not tracked (or runs a function outside the task mappings)
     """
-    try:
-        # Attempt to read existing data
-        with open(filename, 'r') as file:
-            data_to_read = json.load(file)
-    except FileNotFoundError:
-        # If the file doesn't exist, start with an empty list
-        data_to_read = []
-    return data_to_read
+    tracked = thread_tracker.get(service_id)
+    if tracked is None or tracked['task'].function not in task_names:
+        return None
+    task = tracked['task']
+    name, engine = task_names[task.function]
+    return {"task": name, "engine": engine, "frequency": task.frequency, "configuration": list(task.args),
+            "schedule": task.schedule, "paused": not task.pause_event.is_set(), "iteration": task.iteration}
 
 
-def write_to_json_file(filename, data_to_write):
+def persist_tasks(service_ids):
     """
-    Write updated data back to file for user
+    Checkpoint the current state of some tasks with one journal append, removing the ones no longer tracked.
 
-    :param filename: Will always be thread_file.json
-    :param data_to_write:
+    :param service_ids: Service ids of the tasks that changed
     """
-    with open(filename, 'w') as file:
-        json.dump(data_to_write, file, indent=4)
+    if task_state is None:
+        return
+    # Read and written under one lock, so an older checkpoint never lands after a newer one
+    with checkpoint_lock:
+        changes = []
+        for service_id in dict.fromkeys(service_ids):
+            checkpoint = task_checkpoint(service_id)
+            if checkpoint is not None:
+                thread_tracker[service_id]['checkpointed'] = checkpoint["iteration"]
+            changes.append((service_id, checkpoint))
+        task_state.write(changes)
+
+
+def checkpoint_iterations():
+    """Checkpoint the tasks whose iteration counter moved since their last checkpoint."""
+    changed = [service_id for service_id, tracked in list(thread_tracker.items())
+               if tracked['task'].iteration != tracked.get('checkpointed')]
+    if changed:
+        persist_tasks(changed)
+
+
+def checkpoint_loop():
+    # Iterations advance all the time, they are checkpointed in one append per interval rather than one per result
+    while True:
+        time.sleep(CHECKPOINT_INTERVAL)
+        try:
+            checkpoint_iterations()
+        except Exception as e:
+            print(f"WARNING: Checkpoint of the tasks failed: {e}")
 
 
-def start_non_blocking_tcp_server(server_ip: str, server_port: int) -> None:
+def close_task_state():
+    """Checkpoint the latest iterations and compact the checkpoint journal."""
+    if task_state is not None:
+        checkpoint_iterations()
+        task_state.close()
+
+
+def restore_tasks(window=RESTORE_WINDOW):
+    """
+    Restart the checkpointed tasks, paused ones stay paused and every task carries on from its iteration.
+
+    First iterations are spread over window seconds (over the frequency of tasks running more often), so a
+    node holding many tasks is back to full coverage within seconds without starting them all at once.
+    Fixed-rate tasks keep their own phase stagger.
+
+    :param window: Seconds over which the first iterations are spread
+    :return: Number of tasks restored
+    """
+    checkpoints = list(task_state.data.items())
+    restored = 0
+    paused = 0
+    for index, (service_id, checkpoint) in enumerate(checkpoints):
+        if not isinstance(checkpoint, dict) or "frequency" not in checkpoint or "configuration" not in checkpoint:
+            # Written by an older version or damaged: nothing to restart the task from
+            print(f"WARNING: Checkpoint of service ID #{service_id} cannot be restored: {checkpoint!r}.")
+            continue
+        task = checkpoint.get("task")
+        schedule = checkpoint.get("schedule", FIXED_DELAY)
+        if task not in task_mapping or schedule not in SCHEDULES:
+            print(f"WARNING: Checkpoint of service ID #{service_id} cannot be restored: task [{task}], "
+                  f"schedule [{schedule}].")
+            continue
+        frequency = checkpoint["frequency"]
+        delay = 0.0 if schedule == FIXED_RATE else index / len(checkpoints) * min(window, frequency)
+        add_task(service_id, resolve_task_function(task, checkpoint.get("engine")), frequency,
+                 *checkpoint["configuration"], persist=False, schedule=schedule, delay=delay,
+                 iteration=checkpoint.get("iteration", 1))
+        if service_id not in thread_tracker:
+            continue
+        if checkpoint.get("paused"):
+            pause_task(service_id, persist=False)
+            paused += 1
+        thread_tracker[service_id]['checkpointed'] = checkpoint.get("iteration", 1)
+        restored += 1
+    if checkpoints:
+        print(f"Restored {restored} of {len(checkpoints)} checkpointed tasks ({paused} paused).")
+    return restored
+
+
+def start_non_blocking_tcp_server(server_ip: str, server_port: int, workers: int = 0) -> None:
     """
     Starts a non-blocking TCP server that listens on a specified IP address and port.
-    Uses the select module to manage multiple connections efficiently.
+    Uses the selectors module (epoll on Linux) to manage many connections efficiently.
 
     :param server_ip: The IP address the server will listen on.
     :param server_port: The port number the server will listen on.
+    :param workers: Number of worker processes the tasks are sharded across, 0 runs them in this process.
     """
+    global monitoring_server, shard_pool, task_state
+    if workers > 0:
+        shard_pool = ShardPool(workers, on_event=report_task_event)
+        shard_pool.start()
+        # Workers stop their tasks and exit with the service (after the checkpoint, registered later and so run first)
+        atexit.register(shard_pool.shutdown)
+    # Restart the tasks of the previous run before accepting commands for them
+    task_state = JournalStore(filename)
+    restore_tasks()
+    atexit.register(close_task_state)
+    threading.Thread(target=checkpoint_loop, name="task-checkpoint", daemon=True).start()
+    monitoring_server = MonitoringServer(server_ip, server_port)
+    monitoring_server.serve_forever()
+
+
+def task_runner():
+    """
+    Engine running the tasks: the shard pool when worker processes are enabled, else the in-process scheduler.
 
-    # Create server socket
-    server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    # Configuration of socket
-    server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-    server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
-    server_socket.setblocking(False)
-    # Prepare socket for listening
-    server_socket.bind((server_ip, server_port))
-    server_socket.listen(5)
-
-    print(f"\nMonitoring Service on: [{server_ip}] : {server_port}")
-
-    sockets_list: typing.List[socket.socket] = [server_socket]
+    :return: ShardPool or TaskScheduler, both with add, pause, resume and stop
+    """
+    return shard_pool if shard_pool is not None else scheduler
 
-    while True:
-        read_sockets, _, exception_sockets = select.select(sockets_list, [], sockets_list, 0)
 
-        for notified_socket in read_sockets:
-            if notified_socket == server_socket:
-                client_socket, client_address = server_socket.accept()
-                sockets_list.append(client_socket)
-            else:
-                try:
-                    message = notified_socket.recv(1024)
-                    if message:
-                        client_data = json.loads(message.decode())
-                        handle_monitoring_services(notified_socket, client_data)
-                except Exception as e:
-                    print(f"\n\n**ERROR: {notified_socket}: {e}")
-                    print(f"**ERROR: Closing connection to socket: {notified_socket}\n\n")
-                    if sockets_list:
-                        sockets_list.remove(notified_socket)
-                    notified_socket.close()
-
-        # clean up
-        for notified_socket in exception_sockets:
-            print(f"CLEAN UP: Closing connection to socket: {notified_socket}")
-            if sockets_list:
-                sockets_list.remove(notified_socket)
-            notified_socket.close()
-
-
-def add_task(service_id, task_function, freq, *args):
-    """
-    Adds task by creating a new thread that will be handled
-    using threading events.
+def add_task(service_id, task_function, freq, *args, persist=True, schedule=FIXED_DELAY, delay=0.0, iteration=1):
+    """
+    Adds task by registering it with the task scheduler, which runs
+    its iterations on the shared pool of probe workers (or on the task's shard).
 
     :param service_id: Service id for task to add
     :param task_function: Mapped function to execute task
     :param freq: Frequency in seconds for iteration of task
     :param args: Specific arguments required for task
+    :param persist: Checkpoint the task (False when a batch checkpoints once at the end)
+    :param schedule: 'fixed-delay' (frequency seconds between iterations) or 'fixed-rate' (one iteration every
+                     frequency seconds, phase staggered)
+    :param delay: Seconds before the first iteration
+    :param iteration: Number of the first iteration, a restored task carries on from its checkpoint
     :return:
     """
+    error = configuration_error(task_function, args)
+    if error is not None:
+        print(f"WARNING: Task {service_id} not added: {error}")
+        return
     if service_id not in thread_tracker:
-        # .Event() -> Create event
-        pause_event = threading.Event()
-        pause_event.set()
-        stop_event = threading.Event()
-        # .Thread() -> Create thread
-        thread = threading.Thread(target=persistent_connection, args=(task_function, service_id, freq, pause_event,
-                                                                      stop_event, *args))
-        # Track thread status
-        thread_tracker[service_id] = {'thread': thread, 'pause_event': pause_event, 'stop_event': stop_event}
-
-        # Start thread
-        thread.start()
+        # ScheduledTask -> holds the pause and stop events of the task
+        task = ScheduledTask(service_id, task_function, freq, *args, schedule=schedule)
+        task.iteration = iteration
+        # Track task status
+        thread_tracker[service_id] = {'task': task, 'pause_event': task.pause_event, 'stop_event': task.stop_event}
+
+        # Schedule first iteration
+        task_runner().add(task, delay)
         print(f"\n**Task {service_id} started**\n")
 
-        # Add new thread to JSON file
-        obj_to_str = []
-        for curr_thread in thread_tracker:
-            obj_to_str.append(str(curr_thread))
-        write_to_json_file(filename, obj_to_str)
+        # Checkpoint the task
+        if persist:
+            persist_tasks([service_id])
     else:
         print(f"WARNING: Task {service_id} is already running")
 
 
-def pause_task(service_id):
+def pause_task(service_id, persist=True):
     """
         Pause task by setting threading events
 
         :param service_id: Service id for task to pause
+        :param persist: Checkpoint the task (False when a batch checkpoints once at the end)
         """
     if service_id in thread_tracker and thread_tracker[service_id]['pause_event'].is_set():
         print(f"\n**Task {service_id} pause requested.\n")
-        # .set() -> True == Pause
-        thread_tracker[service_id]['pause_event'].clear()
-
-        # Edit event status on json file
-        obj_to_str = []
-        for curr_thread in thread_tracker:
-            obj_to_str.append(str(curr_thread))
-        write_to_json_file(filename, obj_to_str)
+        # .clear() -> False == Pause
+        task_runner().pause(thread_tracker[service_id]['task'])
+
+        # Checkpoint the task
+        if persist:
+            persist_tasks([service_id])
     else:
         print(f"WARNING: Task {service_id} not found or already paused")
 
 
-def resume_task(service_id):
+def resume_task(service_id, persist=True):
     """
         Resume task by setting threading events
 
         :param service_id: Service id for task to resume
+        :param persist: Checkpoint the task (False when a batch checkpoints once at the end)
         """
     if service_id in thread_tracker and not thread_tracker[service_id]['pause_event'].is_set():
         print(f"\n**Task {service_id} resume requested.\n")
-        # .clear() -> False == Resume
-        thread_tracker[service_id]['pause_event'].set()
-
-        # Edit event status on json file
-        obj_to_str = []
-        for curr_thread in thread_tracker:
-            obj_to_str.append(str(curr_thread))
-        write_to_json_file(filename, obj_to_str)
-        write_to_json_file(filename, str(thread_tracker))
+        # .set() -> True == Resume
+        task_runner().resume(thread_tracker[service_id]['task'])
+
+        # Checkpoint the task
+        if persist:
+            persist_tasks([service_id])
     else:
         print(f"WARNING: Task {service_id} not found or not paused")
 
 
-def stop_task(service_id):
+def stop_task(service_id, persist=True):
     """
     Stop task by setting threading events
 
     :param service_id: Service id for task to stop
+    :param persist: Checkpoint the task (False when a batch checkpoints once at the end)
     """
     if service_id in thread_tracker:
         print(f"\n**Task {service_id} stop and removal requested.\n")
 
-        # Set stop event and pause event and join
-        thread_tracker[service_id]['stop_event'].set()
-        if not thread_tracker[service_id]['pause_event'].is_set():
-            thread_tracker[service_id]['pause_event'].set()
-        # .join() -> waits for thread to end
-        thread_tracker[service_id]['thread'].join()
+        # Set stop event and pause event and cancel an iteration in flight, never waits for it:
+        # a 'stopped' task event is pushed once the task has actually stopped
+        task_runner().stop(thread_tracker[service_id]['task'])
 
-        # delete thread and edit json file
+        # delete thread and its checkpoint
         del thread_tracker[service_id]
-        data = []
-        for curr_thread in thread_tracker:
-            data.append(str(curr_thread))
-        write_to_json_file(filename, data)
-        write_to_json_file(filename, str(thread_tracker))
+        recent_results.discard(service_id)
+        latency_stats.discard(service_id)
+        if persist:
+            persist_tasks([service_id])
     else:
         print(f"WARNING: Task {service_id} not found")
 
@@ -196,35 +528,88 @@ def handle_monitoring_services(client_socket, data):
     """
     Handle different types of data and actions.
 
-    :param client_socket: Current client socket we are working with.
-    :param data: Dictionary: data = { 'action': str , 'service_id': str , 'task': str , 'frequency': int, 'configuration': []}
-    """
-
-    # Map task to task_function
-    task_mapping = {                    # sample configurations:
-        "ping": ping_task,              # [domain, count] -> [google.com, 1]
-        "traceroute": traceroute_task,  # [domain, count] -> [google.com, 1]
-        "http": http_task,              # [domain] -> [http://google.com]
-        "https": https_task,            # [domain] -> [https://google.com]
-        "ntp": ntp_task,                # [domain] -> [pool.ntp.org]
-        "dns": dns_task,                # [server, domain, record type] -> [8.8.8.8, www.google.com, A]
-        "tcp": tcp_task,                # [domain, port] -> [github.com, 22]
-        "udp": udp_task                 # [domain, port] -> [dns.google.com, 53]
-    }
+    :param client_socket: Current client connection we are working with (buffers sendall).
+    :param data: Dictionary: data = { 'action': str , 'service_id': str , 'task': str , 'frequency': int, 'configuration': [],
+                                      'engine': 'thread' (default) or 'async',
+                                      'schedule': 'fixed-delay' (default) or 'fixed-rate' }
+                 or a batch: data = { 'action': 'batch', 'operations': [ data, data, ... ] }
+                 or result reporting: data = { 'action': 'subscribe' } and data = { 'action': 'ack', 'seq': int },
+                    pushed results and task events ('stopped', 'paused') are acknowledged alike
+                 or a health check: data = { 'action': 'heartbeat' }
+                 or recent results: data = { 'action': 'query_task', 'service_id': str, 'last': int (optional),
+                                             'since': epoch seconds or 'YYYY-mm-dd HH:MM:SS' (optional) }
+                 or history: data = { 'action': 'query_series', 'service_id': str, 'resolution': 'raw', '1m' or '1h',
+                                      'start': epoch seconds (optional), 'end': epoch seconds (optional) }
+                 or statistics: data = { 'action': 'stats', 'service_id' or 'service_ids' (optional, default all),
+                                         'minutes': int (optional, default whole lifetime) },
+                    also reporting schedule counters per task and the hostname cache counters of this process
+    """
+
     # Extract data from message
     action = data["action"]
-    service_id = data["service_id"]
+    service_id = data.get("service_id")
 
     # Handle request
+    if action == "batch":
+        response = handle_batch(data["operations"])
+        send_response(client_socket, response)
+        return
+    if action == "ack":
+        # Cumulative acknowledgment of pushed results, no response
+        result_stream.ack(client_socket, data["seq"])
+        return
+    if action == "heartbeat":
+        # Health check of the management service, reports the number of tracked tasks
+        send_response(client_socket, {"action": action, "tasks": len(thread_tracker)})
+        return
+    if action == "query_task":
+        # Recent results from memory, filtered by count and/or time
+        try:
+            results = recent_results.query(service_id, data.get("last"), data.get("since"))
+        except ValueError as e:
+            send_response(client_socket, {"action": action, "service_id": service_id, "error": str(e)})
+            return
+        send_response(client_socket, {"action": action, "service_id": service_id, "results": results})
+        return
+    if action == "query_series":
+        # Rollups (or raw samples) of the latency and status history in a time range
+        resolution = data.get("resolution", "1m")
+        if resolution == "raw":
+            timestamps, latencies, statuses = timeseries_store.scan(service_id, data.get("start"), data.get("end"))
+            # NaN (no latency) is not valid JSON
+            samples = [[ts, None if latency != latency else latency, status]
+                       for ts, latency, status in zip(timestamps, latencies, statuses)]
+        else:
+            samples = timeseries_store.rollups(service_id, resolution, data.get("start"), data.get("end"))
+        send_response(client_socket, {"action": action, "service_id": service_id, "resolution": resolution,
+                                      "samples": samples})
+        return
+    if action == "stats":
+        # Latency percentiles and loss of some (or all) tasks, per task and merged
+        service_ids = data.get("service_ids", [service_id] if service_id else None)
+        summaries = latency_stats.summaries(service_ids, data.get("minutes"))
+        # Late and missed iterations of the tasks, growing counters mean the node is overloaded
+        schedule = {task_id: tracked['task'].schedule_stats() for task_id, tracked in list(thread_tracker.items())
+                    if service_ids is None or task_id in service_ids}
+        send_response(client_socket, {"action": action, **summaries, "schedule": schedule,
+                                      "resolver": resolver_cache.stats()})
+        return
+    if action == "subscribe":
+        # Respond first so the acknowledgment precedes the replayed results
+        send_response(client_socket, {"action": action, "message": "Subscribed to results."})
+        result_stream.subscribe(client_socket)
+        return
     if action == "add_task":
         task = data["task"]
-        if task in task_mapping:
+        schedule = data.get("schedule", FIXED_DELAY)
+        if task not in task_mapping:
+            print(f"WARNING: Task [{task}] does not exist.")
+        elif schedule not in SCHEDULES:
+            print(f"WARNING: Schedule [{schedule}] is not supported.")
+        else:
             freq = data["frequency"]
             config = data["configuration"]
-            task_function = task_mapping[task]
-            add_task(service_id, task_function, freq, *config)
-        else:
-            print(f"WARNING: Task [{task}] does not exist.")
+            add_task(service_id, resolve_task_function(task, data.get("engine")), freq, *config, schedule=schedule)
     elif action == "pause_task":
         pause_task(service_id)
     elif action == "resume_task":
@@ -237,8 +622,152 @@ def handle_monitoring_services(client_socket, data):
 
     # Handle response
     response = {"action": action, "message": f"Action [{action}] for service ID [{service_id}] processed."}
+    send_response(client_socket, response)
+
+
+def send_response(client_socket, response):
+    """
+    Send one newline delimited JSON response to the client.
+
+    :param client_socket: Current client connection we are working with.
+    :param response: Dictionary to send
+    """
     try:
-        response_data = json.dumps(response).encode('utf-8')
+        response_data = (json.dumps(response) + "\n").encode('utf-8')
         client_socket.sendall(response_data)
     except Exception as e:
         print(f"WARNING: Failed to send response: {e}")
+
+
+def configuration_error(task_function, args):
+    """
+    Check a task configuration against the arguments its task function takes.
+
+    :param task_function: Mapped function to execute task
+    :param args: Configuration values, passed as positional arguments
+    :return: Error message, None when the task function accepts the configuration
+    """
+    try:
+        inspect.signature(task_function).bind(*args)
+    except TypeError as e:
+        return f"Configuration {list(args)} does not fit the task: {e}"
+    return None
+
+
+def resolve_task_function(task, engine=None):
+    """
+    Map a task name to its task function.
+
+    :param task: Name of the task, key of task_mapping
+    :param engine: 'async' to run the coroutine counterpart when there is one
+    :return: Task function
+    """
+    # ping and traceroute have no async counterpart and stay on the worker pool
+    if engine == "async" and task in async_task_mapping:
+        return async_task_mapping[task]
+    return task_mapping[task]
+
+
+def validate_batch(operations):
+    """
+    Check every operation of a batch against the tracked tasks and the operations before it.
+
+    :param operations: List of task operations, each shaped like a single action message
+    :return: List with an error message (or None when valid) per operation
+    """
+    # service_id -> 'running' or 'paused' as the batch would leave it
+    states = {}
+    errors = []
+    for operation in operations:
+        action = operation.get("action")
+        service_id = operation.get("service_id")
+        if service_id in states:
+            state = states[service_id]
+        elif service_id in thread_tracker:
+            state = "running" if thread_tracker[service_id]['pause_event'].is_set() else "paused"
+        else:
+            state = None
+
+        error = None
+        if not isinstance(service_id, str):
+            error = "Missing service ID"
+        elif action == "add_task":
+            if state is not None:
+                error = f"Task {service_id} is already running"
+            elif operation.get("task") not in task_mapping:
+                error = f"Task [{operation.get('task')}] does not exist."
+            elif not isinstance(operation.get("frequency"), (int, float)) or operation["frequency"] <= 0:
+                error = "Frequency must be a positive number of seconds"
+            elif not isinstance(operation.get("configuration"), list):
+                error = "Configuration must be a list"
+            elif operation.get("schedule", FIXED_DELAY) not in SCHEDULES:
+                error = f"Schedule [{operation['schedule']}] is not supported."
+            else:
+                error = configuration_error(resolve_task_function(operation["task"], operation.get("engine")),
+                                            operation["configuration"])
+                if error is None:
+                    state = "running"
+        elif action == "pause_task":
+            if state != "running":
+                error = f"Task {service_id} not found or already paused"
+            else:
+                state = "paused"
+        elif action == "resume_task":
+            if state != "paused":
+                error = f"Task {service_id} not found or not paused"
+            else:
+                state = "running"
+        elif action == "stop_task":
+            if state is None:
+                error = f"Task {service_id} not found"
+            else:
+                state = None
+        else:
+            error = f"Action {action} is not supported."
+
+        if error is None:
+            states[service_id] = state
+        errors.append(error)
+    return errors
+
+
+def handle_batch(operations):
+    """
+    Apply a list of task operations atomically: all of them or, if any is invalid, none.
+    The tasks of the batch are checkpointed with one journal append.
+
+    :param operations: List of task operations, each shaped like a single action message
+    :return: Response with the batch status and one result per operation
+    """
+    errors = validate_batch(operations)
+    applied = not any(errors)
+    results = []
+    for operation, error in zip(operations, errors):
+        result = {"action": operation.get("action"), "service_id": operation.get("service_id"), "ok": applied}
+        if error is not None:
+            result["error"] = error
+        elif applied:
+            result["message"] = f"Action [{operation['action']}] for service ID [{operation['service_id']}] processed."
+        else:
+            result["message"] = "Not applied, another operation in the batch is invalid."
+        results.append(result)
+
+    if applied:
+        for operation in operations:
+            action = operation["action"]
+            service_id = operation["service_id"]
+            if action == "add_task":
+                add_task(service_id, resolve_task_function(operation["task"], operation.get("engine")),
+                         operation["frequency"], *operation["configuration"], persist=False,
+                         schedule=operation.get("schedule", FIXED_DELAY))
+            elif action == "pause_task":
+                pause_task(service_id, persist=False)
+            elif action == "resume_task":
+                resume_task(service_id, persist=False)
+            elif action == "stop_task":
+                stop_task(service_id, persist=False)
+        persist_tasks(operation["service_id"] for operation in operations)
+    else:
+        print(f"WARNING: Batch of {len(operations)} operations rejected.")
+
+    return {"action": "batch", "status": "applied" if applied else "rejected", "results": results}
@@ -1,78 +1,89 @@
 from application_layer_services import check_ntp_server, check_dns_server, check_server_http, check_server_https
-from transport_layer_services import check_tcp_port, check_udp_port
+from transport_layer_services import check_tcp_port, check_udp_port, tcp_sweep, udp_sweep
 from network_layer_services import ping, traceroute
-import time
+from async_probe_services import async_check_ntp_server, async_check_dns_server, async_check_server_http, \
+    async_check_server_https, async_check_tcp_port, async_check_udp_port
+from result_writer import ResultWriter
+from probe_timing import PhaseTimer
+from probe_cancel import current_scope
 import datetime
-import json
 
 """
-persistent_connection(function, *args) is the only function called from outside
-which in turn calls the specific task to run indefinitely. 
-Each task will return and dynamically output to its own corresponding json file titled
+run_task_iteration(function, *args) runs a single iteration of a task for the task scheduler.
+The scheduler repeats it at the task's frequency on a shared worker pool.
+The async_*_task coroutines return the same results as their blocking counterparts. They are
+run on the shared probe loop and completed through record_result(service_id, count, result).
+Each task will return and dynamically output to its own corresponding json lines file titled
 by the specific task's service id.
 """
 
+# Shared writer for every task: records are appended to <service_id>.jsonl in batches
+result_writer = ResultWriter()
+# Callables listener(service_id, record) notified of every recorded result
+result_listeners = []
 
-def write_to_json_file(filename, results):
-    try:
-        # Attempt to read existing data
-        with open(filename, 'r') as file:
-            data_to_read = json.load(file)
-    except FileNotFoundError:
-        # If the file doesn't exist, start with an empty list
-        data_to_read = []
 
-        # Append new data
-    data_to_read.append(results)
+def run_task_iteration(function, service_id, count, *args):
+    """
+    Execute one iteration of a task and record its timestamped result.
 
-    # Write updated data back to file
-    with open(filename, 'w') as file:
-        json.dump(data_to_read, file, indent=4)
+    :param function: Mapped function to execute task
+    :param service_id: Service id of the task
+    :param count: Iteration number of this run
+    :param args: Specific arguments required for task
+    :return: The timestamped result record, None if the iteration was cancelled
+    """
+    # Execute the task function and capture its return value
+    result = function(*args)
 
+    # A stopped or paused task's check was interrupted, its result means nothing
+    scope = current_scope()
+    if scope is not None and scope.cancelled:
+        return None
 
-def persistent_connection(function, service_id, frequency, pause_event, stop_event, *args):
-    count = 1
-    try:
-        start_time = time.perf_counter()
-        while not stop_event.is_set():
-            if not pause_event.is_set():  # pause_event.clear()
-                print(f"\n**Service ID #{service_id} has paused.\n")
-                print("-" * 50)
-                # .wait() -> Resumes when pause_event.set()
-                pause_event.wait()
-                if stop_event.is_set():  # stop_event.set()
-                    break
-                print(f"\n**Service ID #{service_id} has resumed.\n")
+    return record_result(service_id, count, result)
 
-            # Execute the task function and capture its return value
-            result = function(*args)
 
-            # Include a timestamp in the result
-            current_time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            result_with_timestamp = {"timestamp": current_time, "iteration": count, "result": result}
+def record_result(service_id, count, result):
+    """
+    Timestamp a task result and hand it to the shared result writer.
 
-            # Dynamically output to a JSON file named after the service ID
-            filename = f"{service_id}.json"
-            write_to_json_file(filename, result_with_timestamp)
+    :param service_id: Service id of the task
+    :param count: Iteration number of this run
+    :param result: Value returned by the task function
+    :return: The timestamped result record
+    """
+    # Include a timestamp in the result
+    current_time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    result_with_timestamp = {"timestamp": current_time, "iteration": count, "result": result}
 
-            # print(f"\n{service_id}: Task iteration count: {count}, Time: {current_time}")
-            count += 1
-            time.sleep(frequency)
+    # Dynamically output to the JSON lines file named after the service ID
+    result_writer.write(service_id, result_with_timestamp)
 
-    except KeyboardInterrupt:
-        print(f"\n{service_id}: Monitoring stopped by user.")
-    finally:
-        end_time = time.perf_counter()
-        print(f"Service ID #{service_id} has stopped:")
-        print(f"    Task iteration count: {count - 1}")
-        print(f"    Total monitoring lasted: {round(end_time - start_time, 2)} seconds.")
+    # Report the result (e.g. push it to the management service)
+    notify_result_listeners(service_id, result_with_timestamp)
 
-    return pause_event, stop_event
+    return result_with_timestamp
+
+
+def notify_result_listeners(service_id, record):
+    """
+    Hand a timestamped result record to every result listener.
+
+    :param service_id: Service id of the task
+    :param record: Timestamped result record
+    """
+    for listener in result_listeners:
+        try:
+            listener(service_id, record)
+        except Exception as e:
+            print(f"WARNING: Result listener failed for service ID #{service_id}: {e}")
 
 
 def ping_task(domain, num_pings):
     results = {}
-    ping_results = ping(domain, num_pings=int(num_pings))
+    timer = PhaseTimer()
+    ping_results = ping(domain, num_pings=int(num_pings), timer=timer)
     domain_results = []
 
     for ping_addr, ping_time in ping_results:
@@ -82,62 +93,143 @@ def ping_task(domain, num_pings):
             result = {"error": "Request timed out or no reply received"}
         domain_results.append(result)
 
-    results[domain] = domain_results
+    # Timings of the whole task next to the per-request replies, inside the domain's entry like every task
+    results[domain] = {"replies": domain_results, "timings": timer.timings()}
 
     return results
 
 
-def traceroute_task(domain, num_query):
+def traceroute_task(domain, num_query, mode="sequential"):
     results = {}
-    traceroute_results = traceroute(domain, num_query_packets=int(num_query))
-    results[domain] = traceroute_results
+    # mode 'parallel' probes every TTL at once instead of one hop after the other
+    timer = PhaseTimer()
+    traceroute_results = traceroute(domain, num_query_packets=int(num_query), parallel=(mode == "parallel"),
+                                    timer=timer)
+    results[domain] = {"table": traceroute_results, "timings": timer.timings()}
 
     return results
 
 
-def http_task(domain):
+def http_task(domain, timeout=5, mode="warm"):
     results = {}
-    status, code = check_server_http(domain)
-    results[domain] = {"status": status, "code": code}
+    timer = PhaseTimer()
+    # mode 'warm' reuses a pooled keep-alive connection, 'cold' measures a new handshake every time
+    status, code = check_server_http(domain, timeout=float(timeout), reuse_connection=(mode != "cold"), timer=timer)
+    results[domain] = {"status": status, "code": code, "timings": timer.timings()}
 
     return results
 
 
-def https_task(domain):
+def https_task(domain, timeout=5, mode="warm"):
     results = {}
-    status, code, description = check_server_https(domain)
-    results[domain] = {"status": status, "code": code, "description": description}
+    timer = PhaseTimer()
+    status, code, description = check_server_https(domain, timeout=float(timeout), reuse_connection=(mode != "cold"),
+                                                   timer=timer)
+    results[domain] = {"status": status, "code": code, "description": description, "timings": timer.timings()}
 
     return results
 
 
-def ntp_task(server):
+def ntp_task(server, port=123):
     results = {}
-    status, time = check_ntp_server(server)
-    results[server] = {"status": status, "time": time}
+    timer = PhaseTimer()
+    status, time = check_ntp_server(server, port=int(port), timer=timer)
+    results[server] = {"status": status, "time": time, "timings": timer.timings()}
 
     return results
 
 
-def dns_task(domain, server, record_type):
+def dns_task(domain, server, record_type, port=53):
     results = {}
-    status, query_results = check_dns_server(server, domain, record_type)
-    results[f"{domain}_{server}_{record_type}"] = {"status": status, "query_results": query_results}
+    timer = PhaseTimer()
+    status, query_results = check_dns_server(server, domain, record_type, port=int(port), timer=timer)
+    results[f"{domain}_{server}_{record_type}"] = {"status": status, "query_results": query_results,
+                                                   "timings": timer.timings()}
 
     return results
 
 
 def tcp_task(domain, port):
     results = {}
-    status, description = check_tcp_port(domain, int(port))
-    results[domain] = {"port": port, "status": status, "description": description}
+    timer = PhaseTimer()
+    status, description = check_tcp_port(domain, int(port), timer=timer)
+    results[domain] = {"port": port, "status": status, "description": description, "timings": timer.timings()}
 
     return results
 
 
+def tcp_sweep_task(hosts, ports, timeout=3, concurrency=256):
+    # One record for the whole sweep, one entry per host:port
+    return tcp_sweep(hosts, ports, timeout=float(timeout), concurrency=int(concurrency))
+
+
 def udp_task(domain, port):
     results = {}
-    status, description = check_udp_port(domain, int(port))
-    results[domain] = {"port": port, "status": status, "description": description}
+    timer = PhaseTimer()
+    status, description = check_udp_port(domain, int(port), timer=timer)
+    results[domain] = {"port": port, "status": status, "description": description, "timings": timer.timings()}
+
+    return results
+
+
+def udp_sweep_task(hosts, ports, timeout=3, concurrency=256, payload=""):
+    # One record for the whole sweep, one entry per host:port
+    return udp_sweep(hosts, ports, timeout=float(timeout), concurrency=int(concurrency), payload=payload)
+
+
+async def async_http_task(domain, timeout=5, mode="warm"):
+    results = {}
+    timer = PhaseTimer()
+    # mode 'warm' reuses a pooled keep-alive connection, 'cold' measures a new handshake every time
+    status, code = await async_check_server_http(domain, timeout=float(timeout), reuse_connection=(mode != "cold"),
+                                                 timer=timer)
+    results[domain] = {"status": status, "code": code, "timings": timer.timings()}
+
+    return results
+
+
+async def async_https_task(domain, timeout=5, mode="warm"):
+    results = {}
+    timer = PhaseTimer()
+    status, code, description = await async_check_server_https(domain, timeout=float(timeout),
+                                                               reuse_connection=(mode != "cold"), timer=timer)
+    results[domain] = {"status": status, "code": code, "description": description, "timings": timer.timings()}
+
+    return results
+
+
+async def async_ntp_task(server, port=123):
+    results = {}
+    timer = PhaseTimer()
+    status, time = await async_check_ntp_server(server, port=int(port), timer=timer)
+    results[server] = {"status": status, "time": time, "timings": timer.timings()}
+
+    return results
+
+
+async def async_dns_task(domain, server, record_type, port=53):
+    results = {}
+    timer = PhaseTimer()
+    status, query_results = await async_check_dns_server(server, domain, record_type, port=int(port), timer=timer)
+    results[f"{domain}_{server}_{record_type}"] = {"status": status, "query_results": query_results,
+                                                   "timings": timer.timings()}
+
+    return results
+
+
+async def async_tcp_task(domain, port):
+    results = {}
+    timer = PhaseTimer()
+    status, description = await async_check_tcp_port(domain, int(port), timer=timer)
+    results[domain] = {"port": port, "status": status, "description": description, "timings": timer.timings()}
+
+    return results
+
+
+async def async_udp_task(domain, port):
+    results = {}
+    timer = PhaseTimer()
+    status, description = await async_check_udp_port(domain, int(port), timer=timer)
+    results[domain] = {"port": port, "status": status, "description": description, "timings": timer.timings()}
 
     return results
@@ -1,12 +1,45 @@
+import array
+import functools
 import os
 import socket
 import struct
+import sys
 import threading
 import zlib
 import random
 import string
 import time
-from typing import Any
+from typing import Any, Optional
+from probe_cancel import cancel_callback, check_cancelled
+from probe_timing import timer_phase
+from resolver_cache import resolver_cache
+
+
+def _ones_complement_sum(data: bytes) -> int:
+    """
+    Sum the 16-bit big-endian words of data with end-around carry.
+
+    The words are summed in native byte order by array('H') in C, which is valid because the one's
+    complement sum is byte order independent (RFC 1071): swapping the bytes of the folded native sum
+    gives the big-endian sum.
+
+    Args:
+    data (bytes): The data to sum. An odd trailing byte is padded with a zero byte.
+
+    Returns:
+    int: The folded 16-bit sum, not complemented.
+    """
+    if len(data) % 2:
+        data += b'\x00'
+    s: int = sum(array.array('H', data))
+
+    # Fold the carries back into the low 16 bits until none are left.
+    while s >> 16:
+        s = (s >> 16) + (s & 0xffff)
+
+    if sys.byteorder == 'little':
+        s = ((s & 0xff) << 8) | (s >> 8)
+    return s
 
 
 def calculate_icmp_checksum(data: bytes) -> int:
@@ -19,6 +52,24 @@ def calculate_icmp_checksum(data: bytes) -> int:
     Args:
     data (bytes): The data for which the checksum is to be calculated.
 
+    Returns:
+    int: The calculated checksum.
+    """
+    return ~_ones_complement_sum(data) & 0xffff
+
+
+def calculate_icmp_checksum_bytewise(data: bytes) -> int:
+    """
+    Calculate the checksum for the ICMP packet one byte pair at a time.
+
+    Reference implementation kept for comparison with calculate_icmp_checksum (see benchmark_icmp_packets.py).
+
+    The checksum is calculated by summing the 16-bit words of the entire packet,
+    carrying any overflow bits around, and then complementing the result.
+
+    Args:
+    data (bytes): The data for which the checksum is to be calculated.
+
     Returns:
     int: The calculated checksum.
     """
@@ -38,8 +89,9 @@ def calculate_icmp_checksum(data: bytes) -> int:
     # If the sum is larger than 16 bits, the overflow will be in the higher bits.
     # (s >> 16) extracts the overflow by shifting right by 16 bits.
     # (s & 0xffff) keeps only the lower 16 bits of the sum.
-    # The two parts are then added together.
-    s = (s >> 16) + (s & 0xffff)
+    # The two parts are then added together, again while the addition itself carries.
+    while s >> 16:
+        s = (s >> 16) + (s & 0xffff)
 
     # Complement the result.
     # ~s performs a bitwise complement (inverting all the bits).
@@ -49,7 +101,61 @@ def calculate_icmp_checksum(data: bytes) -> int:
     return s  # Return the calculated checksum.
 
 
-def create_icmp_packet(icmp_type: int = 8, icmp_code: int = 0, sequence_number: int = 1, data_size: int = 192) -> bytes:
+# 'bbHHh': type, code, checksum, identifier, sequence number (see create_icmp_packet)
+ICMP_HEADER = struct.Struct('bbHHh')
+
+
+class IcmpPacketTemplate:
+    """
+    Precomputed ICMP packet for one (type, code, identifier, payload size).
+
+    The payload and the one's complement sum of everything but the sequence number are computed once,
+    so building a packet only adds the sequence word to the partial sum and packs the header.
+    """
+    __slots__ = ("icmp_type", "icmp_code", "icmp_id", "data", "partial_sum")
+
+    def __init__(self, icmp_type: int, icmp_code: int, icmp_id: int, data_size: int):
+        self.icmp_type = icmp_type
+        self.icmp_code = icmp_code
+        self.icmp_id = icmp_id
+
+        # The data payload is a single randomly chosen alphanumeric character (uppercase or lowercase),
+        # repeated to match the total length specified by data_size.
+        random_char: str = random.choice(string.ascii_letters + string.digits)
+        self.data: bytes = (random_char * data_size).encode()
+
+        # Sum of the header (checksum and sequence number set to 0) and the payload.
+        self.partial_sum: int = _ones_complement_sum(ICMP_HEADER.pack(icmp_type, icmp_code, 0, icmp_id, 0) + self.data)
+
+    def packet(self, sequence_number: int) -> bytes:
+        """
+        Build the packet for a sequence number, updating the checksum incrementally.
+
+        Args:
+        sequence_number (int): The sequence number of the ICMP packet.
+
+        Returns:
+        bytes: The complete ICMP packet.
+        """
+        # The sequence number is packed natively ('h'); the checksum reads its bytes as a big-endian word.
+        sequence_bytes = struct.pack('h', sequence_number)
+        s: int = self.partial_sum + ((sequence_bytes[0] << 8) | sequence_bytes[1])
+        s = (s >> 16) + (s & 0xffff)
+        chksum: int = ~s & 0xffff
+
+        # socket.htons ensures the checksum is in network byte order.
+        header = ICMP_HEADER.pack(self.icmp_type, self.icmp_code, socket.htons(chksum), self.icmp_id, sequence_number)
+        return header + self.data
+
+
+@functools.lru_cache(maxsize=1024)
+def get_icmp_packet_template(icmp_type: int, icmp_code: int, icmp_id: int, data_size: int) -> IcmpPacketTemplate:
+    """Return the cached IcmpPacketTemplate for these header fields and payload size."""
+    return IcmpPacketTemplate(icmp_type, icmp_code, icmp_id, data_size)
+
+
+def create_icmp_packet(icmp_type: int = 8, icmp_code: int = 0, sequence_number: int = 1, data_size: int = 192,
+                       icmp_id: Optional[int] = None) -> bytes:
     """
     Creates an ICMP (Internet Control Message Protocol) packet with specified parameters.
 
@@ -58,119 +164,299 @@ def create_icmp_packet(icmp_type: int = 8, icmp_code: int = 0, sequence_number:
     icmp_code (int): The code of the ICMP packet. Default is 0.
     sequence_number (int): The sequence number of the ICMP packet. Default is 1.
     data_size (int): The size of the data payload in the ICMP packet. Default is 192 bytes.
+    icmp_id (Optional[int]): The ICMP identifier. Default derives one from the thread and process ids.
 
     Returns:
     bytes: A bytes object representing the complete ICMP packet.
 
     Description:
     The function generates a unique ICMP packet by combining the specified ICMP type, code, and sequence number
-    with a data payload of a specified size. It calculates a checksum for the packet and ensures that the packet
-    is in the correct format for network transmission.
+    with a data payload of a specified size. The payload and the partial checksum come from a cached
+    IcmpPacketTemplate, so only the sequence number is added to the checksum for each packet.
     """
 
-    # Get the current thread identifier and process identifier.
-    # These are used to create a unique ICMP identifier.
-    thread_id = threading.get_ident()
-    process_id = os.getpid()
+    if icmp_id is None:
+        # Get the current thread identifier and process identifier.
+        # These are used to create a unique ICMP identifier.
+        thread_id = threading.get_ident()
+        process_id = os.getpid()
+
+        # Generate a unique ICMP identifier using CRC32 over the concatenation of thread_id and process_id.
+        # The & 0xffff ensures the result is within the range of an unsigned 16-bit integer (0-65535).
+        icmp_id = zlib.crc32(f"{thread_id}{process_id}".encode()) & 0xffff
 
-    # Generate a unique ICMP identifier using CRC32 over the concatenation of thread_id and process_id.
-    # The & 0xffff ensures the result is within the range of an unsigned 16-bit integer (0-65535).
-    icmp_id = zlib.crc32(f"{thread_id}{process_id}".encode()) & 0xffff
+    return get_icmp_packet_template(icmp_type, icmp_code, icmp_id, data_size).packet(sequence_number)
 
-    # Pack the ICMP header fields into a bytes object.
-    # 'bbHHh' is the format string for struct.pack, which means:
-    # b - signed char (1 byte) for ICMP type
-    # b - signed char (1 byte) for ICMP code
-    # H - unsigned short (2 bytes) for checksum, initially set to 0
-    # H - unsigned short (2 bytes) for ICMP identifier
-    # h - short (2 bytes) for sequence number
-    header: bytes = struct.pack('bbHHh', icmp_type, icmp_code, 0, icmp_id, sequence_number)
 
-    # Create the data payload for the ICMP packet.
-    # It's a sequence of a single randomly chosen alphanumeric character (uppercase or lowercase),
-    # repeated to match the total length specified by data_size.
-    random_char: str = random.choice(string.ascii_letters + string.digits)
-    data: bytes = (random_char * data_size).encode()
+class PendingEcho:
+    """
+    An Echo Request sent by the IcmpEngine that is waiting for its reply.
+
+    The reply may be an Echo Reply from the target, or a Time Exceeded / Destination Unreachable
+    message from a router which quotes the original request.
+    """
+    __slots__ = ("key", "sent_at_ns", "event", "addr", "rtt_ms", "icmp_type", "icmp_code")
 
-    # Calculate the checksum of the header and data.
-    chksum: int = calculate_icmp_checksum(header + data)
+    def __init__(self, key: tuple[int, int]):
+        self.key = key
+        self.sent_at_ns: int = 0  # time.perf_counter_ns() when sent
+        self.event = threading.Event()
+        self.addr = None
+        self.rtt_ms: Optional[float] = None
+        self.icmp_type: Optional[int] = None
+        self.icmp_code: Optional[int] = None
 
-    # Repack the header with the correct checksum.
-    # socket.htons ensures the checksum is in network byte order.
-    header = struct.pack('bbHHh', icmp_type, icmp_code, socket.htons(chksum), icmp_id, sequence_number)
 
-    # Return the complete ICMP packet by concatenating the header and data.
-    return header + data
+class IcmpEngine:
+    """
+    Process-wide ICMP engine that owns a single raw socket.
 
+    Every thread sends its Echo Requests through this engine. Each request gets a unique
+    (identifier, sequence) pair; one receiver thread reads every ICMP message that arrives on
+    the host and completes only the request whose identifier and sequence number it carries,
+    so a reply is never attributed to the wrong ping.
+    """
 
-def ping(host: str, ttl: int = 64, timeout: int = 1, sequence_number: int = 1, num_pings: int = 1) -> list[
-    tuple[Any, float]]:
+    # Sequence numbers are packed as a signed short ('h'), so they wrap below 0x8000.
+    MAX_SEQUENCE = 0x7fff
+
+    def __init__(self, data_size: int = 192):
+        """
+        Args:
+        data_size (int): The size of the data payload of each Echo Request. Default is 192 bytes.
+        """
+        self.data_size = data_size
+        # One identifier for the whole process, the sequence number tells requests apart.
+        self.identifier = os.getpid() & 0xffff
+        self._sequence = 0
+        self._socket = None
+        self._ttl = None
+        self._pending: dict[tuple[int, int], PendingEcho] = {}
+        self._lock = threading.Lock()       # guards _pending and _sequence
+        self._send_lock = threading.Lock()  # guards the TTL option and sendto
+        self._receiver = None
+
+    def start(self) -> None:
+        """Open the raw socket and start the receiver thread if they are not running yet."""
+        with self._lock:
+            if self._socket is None:
+                # socket.SOCK_RAW with socket.IPPROTO_ICMP receives every ICMP message on the host.
+                self._socket = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_ICMP)
+                self._receiver = threading.Thread(target=self._receive, name="icmp-receiver", daemon=True)
+                self._receiver.start()
+
+    def send(self, host: str, ttl: int = 64) -> PendingEcho:
+        """
+        Send one Echo Request without waiting for the reply.
+
+        Args:
+        host (str): The IP address or hostname of the target host.
+        ttl (int): Time-To-Live for the ICMP packet.
+
+        Returns:
+        PendingEcho: The outstanding request, completed by the receiver thread.
+        """
+        self.start()
+        with self._lock:
+            # Allocate the next free sequence number for our identifier.
+            for _ in range(self.MAX_SEQUENCE):
+                self._sequence = self._sequence % self.MAX_SEQUENCE + 1
+                key = (self.identifier, self._sequence)
+                if key not in self._pending:
+                    break
+            else:
+                raise RuntimeError("No free ICMP sequence numbers, too many requests in flight.")
+            pending = PendingEcho(key)
+            self._pending[key] = pending
+
+        # Echo Request built from the cached template: only the sequence number changes.
+        packet: bytes = get_icmp_packet_template(8, 0, key[0], self.data_size).packet(key[1])
+        try:
+            with self._send_lock:
+                # Only touch the TTL option when it changes between requests.
+                if ttl != self._ttl:
+                    self._socket.setsockopt(socket.IPPROTO_IP, socket.IP_TTL, ttl)
+                    self._ttl = ttl
+                pending.sent_at_ns = time.perf_counter_ns()
+                self._socket.sendto(packet, (host, 1))
+        except Exception:
+            self._discard(pending)
+            raise
+        return pending
+
+    def wait(self, pending: PendingEcho, timeout: float) -> tuple[Any, Optional[float]]:
+        """
+        Wait for the reply to a request sent with send().
+
+        Args:
+        pending (PendingEcho): The outstanding request.
+        timeout (float): The time in seconds to wait for the reply.
+
+        Returns:
+        Tuple[Any, float] | Tuple[None, None]: The address of the replier and the round-trip time in milliseconds.
+
+        Raises:
+        ProbeCancelled: The task of the current iteration was stopped or paused while waiting.
+        """
+        # Stopping the task releases the wait at once, like a timeout
+        with cancel_callback(pending.event.set):
+            pending.event.wait(timeout)
+        self._discard(pending)
+        check_cancelled()
+        if pending.rtt_ms is not None:
+            return pending.addr, pending.rtt_ms
+        return None, None
+
+    def ping(self, host: str, ttl: int = 64, timeout: float = 1) -> tuple[Any, Optional[float]]:
+        """Send one Echo Request and wait for its reply, see send() and wait()."""
+        return self.wait(self.send(host, ttl=ttl), timeout)
+
+    def ping_many(self, hosts: list[str], ttl: int = 64, timeout: float = 1) -> list[tuple[Any, Optional[float]]]:
+        """
+        Send one Echo Request to every host at once and wait for all replies within one timeout.
+
+        Returns:
+        list: One (address, round-trip time) tuple per host, in the order of hosts.
+        """
+        sent = [self.send(host, ttl=ttl) for host in hosts]
+        deadline_ns = time.perf_counter_ns() + int(timeout * 1e9)
+        return [self.wait(pending, _remaining(deadline_ns)) for pending in sent]
+
+    def _discard(self, pending: PendingEcho) -> None:
+        with self._lock:
+            if self._pending.get(pending.key) is pending:
+                del self._pending[pending.key]
+
+    def _receive(self) -> None:
+        while True:
+            try:
+                data, addr = self._socket.recvfrom(2048)
+            except OSError as e:
+                print(f"WARNING: ICMP receiver stopped: {e}")
+                return
+            received_at_ns = time.perf_counter_ns()
+
+            key = self._match(data)
+            if key is None:
+                continue
+            with self._lock:
+                pending = self._pending.get(key)
+            if pending is None or pending.event.is_set():
+                continue
+            pending.addr = addr
+            # Integer nanoseconds, converted once so the difference keeps full resolution
+            pending.rtt_ms = (received_at_ns - pending.sent_at_ns) / 1e6
+            ip_header_length = (data[0] & 0x0f) * 4
+            pending.icmp_type, pending.icmp_code = data[ip_header_length], data[ip_header_length + 1]
+            pending.event.set()
+
+    @staticmethod
+    def _match(data: bytes) -> Optional[tuple[int, int]]:
+        """
+        Extract the (identifier, sequence) of the Echo Request a received ICMP message answers.
+
+        Raw sockets deliver the IP header too; its length is the low nibble of the first byte in 32-bit words.
+        """
+        ip_header_length = (data[0] & 0x0f) * 4
+        icmp = data[ip_header_length:]
+        if len(icmp) < 8:
+            return None
+        icmp_type = icmp[0]
+
+        if icmp_type == 0:
+            # Echo Reply: identifier and sequence are in its own header.
+            _, _, _, icmp_id, sequence = struct.unpack('bbHHh', icmp[:8])
+            return icmp_id, sequence
+
+        if icmp_type in (3, 11):
+            # Destination Unreachable / Time Exceeded: the original IP header and the first
+            # 8 bytes of the original ICMP Echo Request follow the 8 byte ICMP header.
+            original = icmp[8:]
+            if len(original) < 20 or original[9] != socket.IPPROTO_ICMP:
+                return None
+            original_header_length = (original[0] & 0x0f) * 4
+            original_icmp = original[original_header_length:original_header_length + 8]
+            if len(original_icmp) < 8 or original_icmp[0] != 8:
+                return None
+            _, _, _, icmp_id, sequence = struct.unpack('bbHHh', original_icmp)
+            return icmp_id, sequence
+
+        # Echo Requests (including our own on loopback) and other types are not replies.
+        return None
+
+
+# Shared by every ping and traceroute in the process; the socket is opened on first use.
+icmp_engine = IcmpEngine()
+
+
+def _remaining(deadline_ns: int) -> float:
+    """Seconds left until a time.perf_counter_ns() deadline, 0 once it has passed."""
+    return max(0, deadline_ns - time.perf_counter_ns()) / 1e9
+
+
+def ping(host: str, ttl: int = 64, timeout: int = 1, sequence_number: int = 1, num_pings: int = 1,
+         timer=None) -> list[tuple[Any, float]]:
     """
     Send an ICMP Echo Request to a specified host and measure the round-trip time.
 
-    This function creates a raw socket to send an ICMP Echo Request packet to the given host.
-    It then waits for an Echo Reply, measuring the time taken for the round trip. If the
-    specified timeout is exceeded before receiving a reply, the function returns None for the ping time.
+    The request is sent through the shared IcmpEngine, which owns the process' only raw ICMP socket
+    and matches replies by identifier and sequence number. It then waits for the reply, measuring
+    the time taken for the round trip. If the specified timeout is exceeded before receiving a reply,
+    the function returns None for the ping time.
 
     Args:
     host (str): The IP address or hostname of the target host.
     ttl (int): Time-To-Live for the ICMP packet. Determines how many hops (routers) the packet can pass through.
     timeout (int): The time in seconds that the function will wait for a reply before giving up.
-    sequence_number (int): The sequence number for the ICMP packet. Useful for matching requests with replies.
+    sequence_number (int): Kept for compatibility; the engine assigns a unique sequence number to every request.
+    num_pings (int): Number of Echo Requests to send one after the other.
+    timer (PhaseTimer): Records the resolve and reply phases. Optional.
 
     Returns:
-    Tuple[Any, float] | Tuple[Any, None]: A tuple containing the address of the replier and the total ping time in milliseconds.
-    If the request times out, the function returns None for the ping time. The address part of the tuple is also None if no reply is received.
+    list[Tuple[Any, float] | Tuple[Any, None]]: One tuple per request containing the address of the replier and
+    the total ping time in milliseconds. If a request times out, the tuple is (None, None).
     """
-
-    # Create a raw socket with the Internet Protocol (IPv4) and ICMP.
-    # socket.AF_INET specifies the IPv4 address family.
-    # socket.SOCK_RAW allows sending raw packets (including ICMP).
-    # socket.IPPROTO_ICMP specifies the ICMP protocol.
     ping_results = []
 
-    for _ in range(num_pings):
-        with socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_ICMP) as sock:
-            # Set the Time-To-Live (TTL) for the ICMP packet.
-            sock.setsockopt(socket.IPPROTO_IP, socket.IP_TTL, ttl)
-
-            # Set the timeout for the socket's blocking operations (e.g., recvfrom).
-            sock.settimeout(timeout)
-
-            # Create an ICMP Echo Request packet.
-            # icmp_type=8 and icmp_code=0 are standard for Echo Request.
-            # sequence_number is used to match Echo Requests with Replies.
-            packet: bytes = create_icmp_packet(icmp_type=8, icmp_code=0, sequence_number=sequence_number)
+    # Resolved through the shared cache, sendto() would look the hostname up for every request
+    with timer_phase(timer, "resolve"):
+        address = resolver_cache.resolve(host)
+    with timer_phase(timer, "reply"):
+        for _ in range(num_pings):
+            ping_results.append(icmp_engine.ping(address, ttl=ttl, timeout=timeout))
+    return ping_results
 
-            # Send the ICMP packet to the target host.
-            # The second argument of sendto is a tuple (host, port).
-            # For raw sockets, the port number is irrelevant, hence set to 1.
-            sock.sendto(packet, (host, 1))
 
-            # Record the current time to measure the round-trip time later.
-            start: float = time.time()
+def _format_hop_row(ttl: int, addr: Any, ping_times: list[float]) -> str:
+    """
+    Format one row of the traceroute table.
 
-            try:
-                # Wait to receive data from the socket (up to 1024 bytes).
-                # This will be the ICMP Echo Reply if the target host is reachable.
-                data, addr = sock.recvfrom(1025)
+    Args:
+    ttl (int): The hop number.
+    addr (Any): The address of the last replier for this hop, or None.
+    ping_times (list[float]): The round-trip times in milliseconds of the successful queries.
 
-                # Record the time when the reply is received.
-                end: float = time.time()
+    Returns:
+    str: The formatted row with min/avg/max statistics, or asterisks if no query succeeded.
+    """
+    # If there are valid ping responses, calculate and format the statistics.
+    if ping_times:
+        min_time = min(ping_times)  # Minimum ping time.
+        avg_time = sum(ping_times) / len(ping_times)  # Average ping time.
+        max_time = max(ping_times)  # Maximum ping time.
+        count = len(ping_times)  # Count of successful pings.
 
-                # Calculate the round-trip time in milliseconds.
-                total_ping_time = (end - start) * 1000
+        data_format = "{:>4}: {:<15} {:>10.2f}ms {:>10.2f}ms {:>10.2f}ms {:>17}"
+        return data_format.format(ttl, addr[0] if addr else '*', min_time, avg_time, max_time, count)
 
-                # Append the address of the replier and the total ping time.
-                ping_results.append((addr, total_ping_time))
-            except socket.timeout:
-                # If no reply is received within the timeout period, return None for the ping time.
-                ping_results.append((None, None))
-    return ping_results
+    # If no valid responses, return a row of asterisks and zero count.
+    data_format = "{:>4}: {:<15} {:>10} {:>10} {:>10} {:>23}"
+    return data_format.format(ttl, "*", "*", "*", "*", "0")
 
 
 def traceroute(host: str, max_hops: int = 30, pings_per_hop: int = 1, verbose: bool = False,
-               num_query_packets: int = 1) -> str:
+               num_query_packets: int = 1, parallel: bool = False, window: int = 0, timeout: float = 1,
+               timer=None) -> str:
     """
     Perform a traceroute to the specified host, with multiple pings per hop.
 
@@ -179,10 +465,23 @@ def traceroute(host: str, max_hops: int = 30, pings_per_hop: int = 1, verbose: b
     max_hops (int): Maximum number of hops to try before stopping.
     pings_per_hop (int): Number of pings to perform at each hop.
     verbose (bool): If True, print additional details during execution.
+    num_query_packets (int): Number of Echo Requests sent by each ping.
+    parallel (bool): If True, probe all TTLs at once instead of one hop after the other (see parallel_traceroute).
+    window (int): With parallel, number of TTLs probed at once. 0 probes all max_hops TTLs in one window.
+    timeout (float): The time in seconds to wait for the replies of each ping (or each window when parallel).
+    timer (PhaseTimer): Records the resolve and reply (every probe and its wait) phases. Optional.
 
     Returns:
     str: The results of the traceroute, including statistics for each hop.
     """
+    if parallel:
+        return parallel_traceroute(host, max_hops=max_hops, pings_per_hop=pings_per_hop, verbose=verbose,
+                                   num_query_packets=num_query_packets, window=window, timeout=timeout, timer=timer)
+
+    # Replies carry addresses, so compare them with the resolved destination rather than the hostname.
+    with timer_phase(timer, "resolve"):
+        destination = resolver_cache.resolve(host)
+
     # Header row for the results. Each column is formatted for alignment and width.
     header_format = "{:>4} {:<13} {:>16} {:>12} {:>12} {:>24}"
     results = [header_format.format('Hop', 'Address', 'Min (ms)', 'Avg (ms)', 'Max (ms)', 'Successful Queries')]
@@ -200,36 +499,91 @@ def traceroute(host: str, max_hops: int = 30, pings_per_hop: int = 1, verbose: b
         for _ in range(pings_per_hop):
             # Ping the host with the current TTL and sequence number.
             # The sequence number is incremented with TTL for each ping.
-            ping_results = ping(host, ttl=ttl, sequence_number=ttl, num_pings=num_query_packets)
+            ping_results = ping(destination, ttl=ttl, timeout=timeout, sequence_number=ttl,
+                                num_pings=num_query_packets, timer=timer)
             for addr, response in ping_results:
                 # If a response is received (not None), append it to ping_times.
                 if response is not None:
                     ping_times.append(response)
 
-        # If there are valid ping responses, calculate and format the statistics.
-        if ping_times:
-            min_time = min(ping_times)  # Minimum ping time.
-            avg_time = sum(ping_times) / len(ping_times)  # Average ping time.
-            max_time = max(ping_times)  # Maximum ping time.
-            count = len(ping_times)  # Count of successful pings.
-
-            # Append the formatted results for this TTL to the results list.
-            data_format = "{:>4}: {:<15} {:>10.2f}ms {:>10.2f}ms {:>10.2f}ms {:>17}"
-            data_row = data_format.format(ttl, addr[0] if addr else '*', min_time, avg_time, max_time, count)
-            results.append(data_row)
-        else:
-            # If no valid responses, append a row of asterisks and zero count.
-            data_format = "{:>4}: {:<15} {:>10} {:>10} {:>10} {:>23}"
-            data_row = data_format.format(ttl, "*", "*", "*", "*", "0")
-            results.append(data_row)
+        # Append the formatted results for this TTL to the results list.
+        results.append(_format_hop_row(ttl, addr, ping_times))
 
         # Print the last entry in the results if verbose mode is enabled.
         if verbose and results:
             print(f"\tResult: {results[-1]}")
 
         # If the address of the response matches the target host, stop the traceroute.
-        if addr and addr[0] == host:
+        if addr and addr[0] == destination:
+            break
+
+    # Join all results into a single string with newline separators and return.
+    return '\n'.join(results)
+
+
+def parallel_traceroute(host: str, max_hops: int = 30, pings_per_hop: int = 1, verbose: bool = False,
+                        num_query_packets: int = 1, window: int = 0, timeout: float = 1, timer=None) -> str:
+    """
+    Perform a traceroute by sending the probes for all TTLs at once.
+
+    Every probe goes through the shared IcmpEngine, which matches each Time Exceeded or Echo Reply
+    back to the probe (and so the TTL) it answers. A window costs one round trip plus at most one
+    timeout, instead of one timeout per silent hop as in the sequential traceroute.
+
+    Args:
+    host (str): The IP address or hostname of the target host.
+    max_hops (int): Maximum number of hops to try.
+    pings_per_hop (int): Number of pings to perform at each hop.
+    verbose (bool): If True, print additional details during execution.
+    num_query_packets (int): Number of Echo Requests sent by each ping.
+    window (int): Number of TTLs probed at once. 0 probes all max_hops TTLs in one window.
+    timeout (float): The time in seconds to wait for the replies of a window.
+    timer (PhaseTimer): Records the resolve and reply (every window) phases. Optional.
+
+    Returns:
+    str: The results of the traceroute in the same table format as traceroute().
+    """
+    # Resolve once so replies from the destination can be recognised by address.
+    with timer_phase(timer, "resolve"):
+        destination = resolver_cache.resolve(host)
+    probes_per_hop = pings_per_hop * num_query_packets
+    window = window or max_hops
+
+    # TTL -> list of (address, round-trip time) for each probe sent with that TTL.
+    hop_replies: dict[int, list] = {}
+    last_hop = max_hops
+
+    for first_ttl in range(1, max_hops + 1, window):
+        ttls = range(first_ttl, min(first_ttl + window, max_hops + 1))
+        if verbose:
+            print(f"pinging {host} with ttl: {ttls[0]}-{ttls[-1]}")
+
+        with timer_phase(timer, "reply"):
+            # Send every probe of the window before waiting for any reply.
+            sent = [(ttl, icmp_engine.send(destination, ttl=ttl)) for ttl in ttls for _ in range(probes_per_hop)]
+            deadline_ns = time.perf_counter_ns() + int(timeout * 1e9)
+            for ttl, pending in sent:
+                reply = icmp_engine.wait(pending, _remaining(deadline_ns))
+                hop_replies.setdefault(ttl, []).append(reply)
+
+        # The first TTL answered by the destination itself ends the path.
+        reached = [ttl for ttl in ttls if any(addr and addr[0] == destination for addr, _ in hop_replies[ttl])]
+        if reached:
+            last_hop = reached[0]
             break
 
+    # Header row for the results. Each column is formatted for alignment and width.
+    header_format = "{:>4} {:<13} {:>16} {:>12} {:>12} {:>24}"
+    results = [header_format.format('Hop', 'Address', 'Min (ms)', 'Avg (ms)', 'Max (ms)', 'Successful Queries')]
+
+    for ttl in range(1, last_hop + 1):
+        replies = hop_replies.get(ttl, [])
+        ping_times = [response for _, response in replies if response is not None]
+        # Report the address of the last probe of the hop that got a reply.
+        addr = next((addr for addr, response in reversed(replies) if response is not None), None)
+        results.append(_format_hop_row(ttl, addr, ping_times))
+        if verbose:
+            print(f"\tResult: {results[-1]}")
+
     # Join all results into a single string with newline separators and return.
     return '\n'.join(results)
@@ -0,0 +1,153 @@
+import contextlib
+import selectors
+import socket
+import threading
+import time
+
+"""
+Cancellation of probes in flight.
+
+The scheduler runs every iteration inside a CancelScope and cancels it when the task is
+stopped or paused, so the control server never waits on a probe. What a check is blocked
+on decides how it is interrupted:
+
+- sockets the check polls itself wait through wait_socket(), in slices of at most
+  CANCEL_POLL_INTERVAL, and raise ProbeCancelled once the scope is cancelled;
+- connected sockets owned by a library (e.g. a keep-alive HTTP connection) are registered
+  with register_socket() and shut down on cancel, which wakes a blocked recv at once;
+- anything else (e.g. an ICMP request waiting for its reply) registers a callback.
+
+Checks that block inside a library without exposing a socket still end within their own timeout.
+A cancelled iteration's result is never recorded.
+"""
+
+# Longest time a check polling its own socket takes to notice it was cancelled
+CANCEL_POLL_INTERVAL = 0.1
+
+_active = threading.local()
+
+
+class ProbeCancelled(Exception):
+    """Raised inside a check whose task was stopped or paused."""
+
+
+class CancelScope:
+    __slots__ = ("cancelled", "_callbacks", "_lock")
+
+    def __init__(self):
+        """Cancellation state of one task iteration."""
+        self.cancelled = False
+        self._callbacks = {}  # token -> callable run on cancel
+        self._lock = threading.Lock()
+
+    def add_callback(self, callback):
+        """
+        Run callback when the scope is cancelled (at once if it already is).
+
+        :param callback: Callable without arguments, must not block
+        :return: Token for remove_callback
+        """
+        token = object()
+        with self._lock:
+            if not self.cancelled:
+                self._callbacks[token] = callback
+                return token
+        callback()
+        return token
+
+    def remove_callback(self, token):
+        with self._lock:
+            self._callbacks.pop(token, None)
+
+    def cancel(self):
+        """Mark the scope cancelled and interrupt whatever its check is blocked on. Safe from any thread."""
+        with self._lock:
+            if self.cancelled:
+                return
+            self.cancelled = True
+            callbacks = list(self._callbacks.values())
+            self._callbacks.clear()
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(f"WARNING: Cancelling a probe failed: {e}")
+
+
+def current_scope():
+    """CancelScope of the iteration running on this thread, or None."""
+    return getattr(_active, "scope", None)
+
+
+@contextlib.contextmanager
+def active_scope(scope):
+    """Make scope the current scope of this thread for the enclosed block."""
+    previous = current_scope()
+    _active.scope = scope
+    try:
+        yield scope
+    finally:
+        _active.scope = previous
+
+
+def check_cancelled():
+    """Raise ProbeCancelled if the current iteration was cancelled."""
+    scope = current_scope()
+    if scope is not None and scope.cancelled:
+        raise ProbeCancelled()
+
+
+@contextlib.contextmanager
+def cancel_callback(callback):
+    """Run callback if the current iteration is cancelled while in the enclosed block."""
+    scope = current_scope()
+    if scope is None:
+        yield
+        return
+    token = scope.add_callback(callback)
+    try:
+        yield
+    finally:
+        scope.remove_callback(token)
+
+
+def register_socket(sock):
+    """
+    Shut down a connected socket if the current iteration is cancelled while in the enclosed block.
+
+    :param sock: Connected socket a library blocks on, None registers nothing
+    """
+    if sock is None:
+        return contextlib.nullcontext()
+
+    def shutdown():
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+    return cancel_callback(shutdown)
+
+
+def wait_socket(sock, write=False, timeout=None):
+    """
+    Wait until sock is readable (or writable), noticing cancellation within CANCEL_POLL_INTERVAL.
+
+    :param sock: Socket to wait on
+    :param write: True to wait until it is writable (e.g. a non-blocking connect finished)
+    :param timeout: Seconds to wait, None for no limit
+    :return: True when the socket is ready, False on timeout
+    """
+    scope = current_scope()
+    deadline = None if timeout is None else time.monotonic() + timeout
+    with selectors.DefaultSelector() as selector:
+        selector.register(sock, selectors.EVENT_WRITE if write else selectors.EVENT_READ)
+        while True:
+            if scope is not None and scope.cancelled:
+                raise ProbeCancelled()
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return False
+            if scope is not None:
+                remaining = CANCEL_POLL_INTERVAL if remaining is None else min(remaining, CANCEL_POLL_INTERVAL)
+            if selector.select(remaining):
+                return True
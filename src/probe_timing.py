@@ -0,0 +1,79 @@
+import contextlib
+import threading
+import time
+
+"""
+Per-phase timing of probes.
+
+A PhaseTimer collects monotonic, nanosecond-resolution durations (time.perf_counter_ns) of the
+phases of one check: resolve, connect, tls, first_byte, reply, and so on. The checks take an
+optional timer and wrap each phase in timer_phase(timer, name); the task functions create the
+timer and attach timer.timings() to their result. Code that cannot be handed a timer (the
+connection classes used by requests) finds the timer of the current check with current_timer().
+"""
+
+_active = threading.local()
+
+
+class PhaseTimer:
+    __slots__ = ("start_ns", "end_ns", "durations")
+
+    def __init__(self):
+        """Durations of the phases of one check, the total runs from creation to stop()."""
+        self.start_ns = time.perf_counter_ns()
+        self.end_ns = None
+        self.durations = {}  # phase -> nanoseconds, summed when a phase repeats (e.g. redirects)
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """Time the enclosed block as phase name."""
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter_ns() - start)
+
+    def add(self, name, nanoseconds):
+        self.durations[name] = self.durations.get(name, 0) + nanoseconds
+
+    def stop(self):
+        """End the total; later phases are still recorded but the total stays."""
+        if self.end_ns is None:
+            self.end_ns = time.perf_counter_ns()
+
+    def timings(self):
+        """
+        Phase durations in milliseconds for the result record.
+
+        :return: {"<phase>_ms": ms, ..., "total_ms": ms}
+        """
+        self.stop()
+        timings = {f"{name}_ms": round(nanoseconds / 1e6, 3) for name, nanoseconds in self.durations.items()}
+        timings["total_ms"] = round((self.end_ns - self.start_ns) / 1e6, 3)
+        return timings
+
+
+def timer_phase(timer, name):
+    """
+    Context manager timing phase name on timer, doing nothing when timer is None.
+
+    :param timer: PhaseTimer or None
+    :param name: Name of the phase
+    """
+    return timer.phase(name) if timer is not None else contextlib.nullcontext()
+
+
+def current_timer():
+    """PhaseTimer of the check running on this thread, or None."""
+    return getattr(_active, "timer", None)
+
+
+@contextlib.contextmanager
+def active_timer(timer):
+    """Make timer the current timer of this thread for the enclosed block."""
+    previous = current_timer()
+    _active.timer = timer
+    try:
+        yield timer
+    finally:
+        _active.timer = previous
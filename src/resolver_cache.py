@@ -0,0 +1,190 @@
+import queue
+import socket
+import threading
+import time
+
+"""
+Process-wide cache of hostname resolutions shared by every probe.
+
+A check names its target by hostname, and passing that hostname to connect(), sendto() or
+gethostbyname() costs a blocking getaddrinfo() (often a DNS query) per probe. Probes resolve
+through resolver_cache instead: an address is reused for ttl seconds, a failed lookup is
+remembered for negative_ttl seconds, and a name that is still being probed is looked up again
+on a background thread shortly before it expires, so a busy target never waits on a lookup.
+Concurrent misses for the same name share one lookup. getaddrinfo() does not report record
+TTLs, so the cache uses fixed ones.
+"""
+
+# Seconds a resolved address is reused
+DEFAULT_TTL = 60.0
+# Seconds a failed lookup is remembered
+DEFAULT_NEGATIVE_TTL = 10.0
+# Fraction of the TTL before expiry in which a hit refreshes the entry in the background
+REFRESH_AHEAD = 0.2
+
+
+class _Entry:
+    __slots__ = ("addresses", "error", "expires", "refreshing")
+
+    def __init__(self, addresses, error, expires):
+        self.addresses = addresses  # list of address strings, None for a failed lookup
+        self.error = error          # socket.gaierror of a failed lookup (other errors are wrapped in one)
+        self.expires = expires
+        self.refreshing = False
+
+
+class ResolverCache:
+    def __init__(self, ttl=DEFAULT_TTL, negative_ttl=DEFAULT_NEGATIVE_TTL, max_entries=4096):
+        """
+        Hostname to address cache with negative caching and refresh ahead of expiry.
+
+        :param ttl: Seconds a resolved address is reused
+        :param negative_ttl: Seconds a failed lookup is remembered
+        :param max_entries: Names kept, the oldest are dropped beyond this
+        """
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self._entries = {}   # (host, family) -> _Entry
+        self._inflight = {}  # (host, family) -> threading.Event set when the lookup is done
+        self._lock = threading.Lock()
+        self._refresh_queue = None
+        # Counters for stats(): hits include negative hits, refreshes are background lookups
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.refresh_failures = 0
+
+    def resolve(self, host, family=socket.AF_INET):
+        """
+        Address of host, from the cache while it is fresh.
+
+        :param host: Hostname or IP address
+        :param family: socket.AF_INET, or socket.AF_UNSPEC for the first address of any family
+        :return: Address string; IP addresses are returned as they are
+        :raises socket.gaierror: The name does not resolve (also while a failed lookup is cached)
+        """
+        if self._is_address(host, family):
+            return host
+        return self.resolve_all(host, family)[0]
+
+    def resolve_all(self, host, family=socket.AF_INET):
+        """
+        Every address of host, in getaddrinfo() order, from the cache while it is fresh.
+
+        :param host: Hostname
+        :param family: socket.AF_INET, or socket.AF_UNSPEC for addresses of any family
+        :return: Non-empty list of address strings
+        :raises socket.gaierror: The name does not resolve
+        """
+        key = (host, family)
+        while True:
+            now = time.monotonic()
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and entry.expires > now:
+                    self.hits += 1
+                    if entry.addresses is None:
+                        self.negative_hits += 1
+                        raise socket.gaierror(*entry.error.args)
+                    if not entry.refreshing and entry.expires - now < self.ttl * REFRESH_AHEAD:
+                        entry.refreshing = True
+                        self._schedule_refresh(key)
+                    return entry.addresses
+                inflight = self._inflight.get(key)
+                if inflight is None:
+                    # This thread looks the name up, others asking meanwhile wait for it
+                    self.misses += 1
+                    inflight = self._inflight[key] = threading.Event()
+                    break
+            # .wait() -> returns once the other thread's lookup is cached
+            inflight.wait()
+
+        try:
+            entry = self._lookup(key)
+            with self._lock:
+                self._store(key, entry)
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            inflight.set()
+        if entry.addresses is None:
+            raise socket.gaierror(*entry.error.args)
+        return entry.addresses
+
+    def stats(self):
+        """Hit, miss and refresh counters and the number of cached names."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"entries": len(self._entries), "hits": self.hits, "negative_hits": self.negative_hits,
+                    "misses": self.misses, "hit_ratio": self.hits / lookups if lookups else None,
+                    "refreshes": self.refreshes, "refresh_failures": self.refresh_failures}
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _lookup(self, key):
+        host, family = key
+        try:
+            address_info = socket.getaddrinfo(host, None, family, socket.SOCK_STREAM)
+        except socket.gaierror as e:
+            return _Entry(None, e, time.monotonic() + self.negative_ttl)
+        except Exception as e:
+            # e.g. UnicodeError for a name IDNA cannot encode: cached like any failed lookup, and raised as
+            # the socket.gaierror the probes handle (on the refresh thread it would end every refresh)
+            error = socket.gaierror(socket.EAI_NONAME, f"{host}: {e}")
+            return _Entry(None, error, time.monotonic() + self.negative_ttl)
+        addresses = []
+        for _, _, _, _, sockaddr in address_info:
+            if sockaddr[0] not in addresses:
+                addresses.append(sockaddr[0])
+        return _Entry(addresses, None, time.monotonic() + self.ttl)
+
+    def _store(self, key, entry):
+        # Called with the lock held
+        self._entries.pop(key, None)
+        self._entries[key] = entry
+        if len(self._entries) > self.max_entries:
+            now = time.monotonic()
+            for stale in [name for name, cached in self._entries.items() if cached.expires <= now]:
+                del self._entries[stale]
+            while len(self._entries) > self.max_entries:
+                # Oldest stored first
+                del self._entries[next(iter(self._entries))]
+
+    def _schedule_refresh(self, key):
+        # Called with the lock held
+        if self._refresh_queue is None:
+            self._refresh_queue = queue.Queue()
+            threading.Thread(target=self._refresh, name="resolver-refresh", daemon=True).start()
+        self._refresh_queue.put(key)
+
+    def _refresh(self):
+        while True:
+            key = self._refresh_queue.get()
+            entry = self._lookup(key)
+            with self._lock:
+                self.refreshes += 1
+                if entry.addresses is None:
+                    # Keep serving the old addresses until they expire (no further refresh), then a probe
+                    # looks the name up itself
+                    self.refresh_failures += 1
+                else:
+                    self._store(key, entry)
+
+    @staticmethod
+    def _is_address(host, family):
+        families = (socket.AF_INET, socket.AF_INET6) if family == socket.AF_UNSPEC else (family,)
+        for address_family in families:
+            try:
+                socket.inet_pton(address_family, host)
+                return True
+            except (OSError, ValueError):
+                pass
+        return False
+
+
+# Shared by every probe in the process (each shard worker process has its own)
+resolver_cache = ResolverCache()
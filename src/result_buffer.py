@@ -0,0 +1,122 @@
+import datetime
+import itertools
+import threading
+import time
+from collections import deque
+
+"""
+Recent results of every task, kept in memory.
+
+Each task gets a fixed-capacity ring buffer holding its latest results, stamped with their
+epoch time. A record holds the result exactly as the task returned it (the object handed to
+every result listener, not a copy), since query_task answers with whole results: memory grows
+with capacity times the size of a task's result, so sweeps with many endpoints cost the most.
+Queries walk the buffer backwards from the newest record, so asking for the last N results or
+those since a time costs O(results returned), never O(history) and never a file read.
+"""
+
+
+class ResultRecord:
+    __slots__ = ("epoch", "timestamp", "iteration", "result")
+
+    def __init__(self, epoch, timestamp, iteration, result):
+        self.epoch = epoch
+        self.timestamp = timestamp
+        self.iteration = iteration
+        self.result = result
+
+    def to_dict(self):
+        """Same shape as the records in the result files."""
+        return {"timestamp": self.timestamp, "iteration": self.iteration, "result": self.result}
+
+
+class ResultRingBuffer:
+    def __init__(self, capacity=1024):
+        """
+        Latest results of one task; the oldest is dropped once capacity is reached.
+
+        :param capacity: Number of results kept
+        """
+        self.records = deque(maxlen=capacity)
+
+    def append(self, record):
+        self.records.append(record)
+
+    def query(self, last=None, since=None):
+        """
+        Newest results of the task, oldest first.
+
+        :param last: Return at most this many results
+        :param since: Only results recorded at or after this epoch time
+        :return: List of ResultRecord
+        """
+        newest_first = reversed(self.records)
+        if since is not None:
+            newest_first = itertools.takewhile(lambda record: record.epoch >= since, newest_first)
+        if last is not None:
+            newest_first = itertools.islice(newest_first, last)
+        selected = list(newest_first)
+        selected.reverse()
+        return selected
+
+
+class RecentResults:
+    def __init__(self, capacity=1024):
+        """
+        Ring buffer of recent results per service id.
+
+        :param capacity: Number of results kept per task
+        """
+        self.capacity = capacity
+        self.buffers = {}
+        self._lock = threading.Lock()
+
+    def record(self, service_id, record):
+        """
+        Keep a timestamped result record. Used as a result listener.
+
+        :param service_id: Service id the record belongs to
+        :param record: Timestamped result record
+        """
+        entry = ResultRecord(time.time(), record["timestamp"], record["iteration"], record["result"])
+        with self._lock:
+            buffer = self.buffers.get(service_id)
+            if buffer is None:
+                buffer = self.buffers[service_id] = ResultRingBuffer(self.capacity)
+            buffer.append(entry)
+
+    def query(self, service_id, last=None, since=None):
+        """
+        Recent results of a task as result file records, oldest first.
+
+        :param service_id: Service id of the task
+        :param last: Return at most this many results, a non-negative integer
+        :param since: Epoch seconds, or a "%Y-%m-%d %H:%M:%S" local time like the record timestamps
+        :return: List of records, empty if the task has no results in memory
+        :raises ValueError: last or since is not of the form above
+        """
+        # bool is an int, but {"last": true} is a malformed request rather than 1
+        if last is not None and (isinstance(last, bool) or not isinstance(last, int) or last < 0):
+            raise ValueError(f"last must be a non-negative integer, not {last!r}")
+        if isinstance(since, str):
+            try:
+                since = datetime.datetime.strptime(since, "%Y-%m-%d %H:%M:%S").timestamp()
+            except ValueError:
+                raise ValueError(f"since must be epoch seconds or 'YYYY-mm-dd HH:MM:SS', not {since!r}")
+        elif since is not None and (isinstance(since, bool) or not isinstance(since, (int, float))):
+            raise ValueError(f"since must be epoch seconds or 'YYYY-mm-dd HH:MM:SS', not {since!r}")
+        with self._lock:
+            buffer = self.buffers.get(service_id)
+            if buffer is None:
+                return []
+            records = buffer.query(last, since)
+        return [record.to_dict() for record in records]
+
+    def discard(self, service_id):
+        """
+        Drop the results of a task that was stopped.
+
+        :param service_id: Service id of the task
+        """
+        with self._lock:
+            self.buffers.pop(service_id, None)
@@ -0,0 +1,281 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+"""
+Push-based result reporting to the management service.
+
+Every task result gets a sequence number and is pushed over the subscribed management
+connection as soon as it is recorded. The management service acknowledges what it has
+received ({"action": "ack", "seq": n}, cumulative). While no management service is subscribed,
+or while it is catching up, results are held in a bounded on-disk spool of JSON Lines
+segments and replayed in order, a window of unacknowledged results at a time, once it
+(re)subscribes. Delivery is at-least-once: sequence numbers only grow, also across restarts,
+so the management service drops anything at or below the last sequence number it has seen.
+Task events ({"action": "task_event"}, e.g. a stop that has taken effect) share the sequence
+numbers, window and spool of the results.
+"""
+
+SPOOL_SEGMENT_PREFIX = "spool-"
+SPOOL_SEGMENT_EXTENSION = ".jsonl"
+
+
+class ResultStream:
+    def __init__(self, spool_directory="result_spool", window=1000, max_segment_bytes=4 * 1024 * 1024,
+                 max_spool_bytes=64 * 1024 * 1024):
+        """
+        Result publisher with an acknowledged send window and an on-disk spool.
+
+        :param spool_directory: Directory holding the spool segments
+        :param window: Largest number of pushed results waiting for an acknowledgment
+        :param max_segment_bytes: Size at which the spool starts a new segment
+        :param max_spool_bytes: Size at which the oldest spooled results are dropped
+        """
+        self.spool_directory = spool_directory
+        self.window = window
+        self.max_segment_bytes = max_segment_bytes
+        self.max_spool_bytes = max_spool_bytes
+        self.dropped = 0
+
+        self.subscriber = None
+        # seq -> (line, True if it was read from the spool)
+        self._unacked = OrderedDict()
+        self._acked_seq = 0
+        self._next_seq = None
+
+        # Spool segments oldest first: path -> last seq written to it
+        self._segments = OrderedDict()
+        self._write_file = None
+        self._write_path = None
+        # Replay cursor: index into the segment list and byte offset in that segment
+        self._read_index = 0
+        self._read_offset = 0
+        self._live_pushed = False
+        self._lock = threading.RLock()
+
+    def publish(self, service_id, record):
+        """
+        Push a result to the subscriber, or spool it. Used as a result listener.
+
+        :param service_id: Service id the record belongs to
+        :param record: Timestamped result record
+        """
+        self._publish({"action": "result", "service_id": service_id, "record": record})
+
+    def publish_event(self, service_id, event, **details):
+        """
+        Push a task event to the subscriber, or spool it, in order with the results.
+
+        :param service_id: Service id of the task
+        :param event: What happened, e.g. "stopped" or "paused"
+        :param details: Further JSON serializable fields of the event
+        """
+        self._publish({"action": "task_event", "service_id": service_id, "event": event, **details})
+
+    def _publish(self, message):
+        with self._lock:
+            self._load_spool()
+            seq = self._next_seq
+            self._next_seq += 1
+            line = json.dumps({"seq": seq, **message}, separators=(",", ":")) + "\n"
+
+            # Push directly only when nothing older is waiting in the spool
+            if self.subscriber is not None and not self._spool_pending() and len(self._unacked) < self.window:
+                self._unacked[seq] = (line, False)
+                self._live_pushed = True
+                self._send(line)
+            else:
+                self._append_to_spool(seq, line)
+
+    def subscribe(self, connection):
+        """
+        Make connection the subscriber and start replaying the spool to it.
+
+        :param connection: Management connection with a sendall method
+        """
+        with self._lock:
+            self._load_spool()
+            if self.subscriber is not None and self.subscriber is not connection:
+                self._release_unacked()
+            self.subscriber = connection
+            self._read_index = 0
+            self._read_offset = 0
+            self._fill_window()
+
+    def unsubscribe(self, connection):
+        """
+        Stop pushing to connection; results it did not acknowledge will be replayed.
+
+        :param connection: Management connection that closed
+        """
+        with self._lock:
+            if self.subscriber is connection:
+                self.subscriber = None
+                self._release_unacked()
+
+    def ack(self, connection, seq):
+        """
+        Acknowledge every result up to and including seq, then push more.
+
+        :param connection: Management connection sending the acknowledgment
+        :param seq: Highest sequence number received
+        """
+        with self._lock:
+            if connection is not self.subscriber:
+                return
+            self._acked_seq = max(self._acked_seq, seq)
+            while self._unacked and next(iter(self._unacked)) <= seq:
+                self._unacked.popitem(last=False)
+            self._delete_acked_segments()
+            self._fill_window()
+
+    def status(self):
+        """Return counters describing the spool and the send window."""
+        with self._lock:
+            self._load_spool()
+            return {"subscribed": self.subscriber is not None, "unacked": len(self._unacked),
+                    "spool_segments": len(self._segments), "spool_bytes": self._spool_bytes(),
+                    "dropped": self.dropped, "acked_seq": self._acked_seq}
+
+    def _send(self, line):
+        try:
+            self.subscriber.sendall(line.encode("utf-8"))
+        except Exception as e:
+            print(f"WARNING: Failed to push result: {e}")
+            self.subscriber = None
+            self._release_unacked()
+
+    def _fill_window(self):
+        # Replay spooled results until the window is full or the spool is exhausted
+        while self.subscriber is not None and len(self._unacked) < self.window and self._spool_pending():
+            paths = list(self._segments)
+            if not self._replay_segment(paths[self._read_index]):
+                return
+            # End of this segment, move on to the next one
+            if self._read_index == len(paths) - 1:
+                return
+            self._read_index += 1
+            self._read_offset = 0
+
+    def _replay_segment(self, path):
+        """Send results from the replay cursor on; True once the end of the segment is reached."""
+        if path == self._write_path:
+            self._write_file.flush()
+        with open(path, "r", encoding="utf-8") as file:
+            file.seek(self._read_offset)
+            while len(self._unacked) < self.window:
+                line = file.readline()
+                if not line:
+                    return True
+                self._read_offset = file.tell()
+                seq = json.loads(line)["seq"]
+                if seq > self._acked_seq and seq not in self._unacked:
+                    self._unacked[seq] = (line, True)
+                    self._send(line)
+                    if self.subscriber is None:
+                        return False
+        return False
+
+    def _spool_pending(self):
+        if not self._segments:
+            return False
+        paths = list(self._segments)
+        if self._read_index < len(paths) - 1:
+            return True
+        return self._read_offset < self._segment_size(paths[self._read_index])
+
+    def _release_unacked(self):
+        # Results read from the spool are still in it; live results go back to the spool,
+        # in a segment named by its first seq, so it sorts before anything spooled later.
+        live = [(seq, line) for seq, (line, from_spool) in self._unacked.items() if not from_spool]
+        self._unacked.clear()
+        if live:
+            os.makedirs(self.spool_directory, exist_ok=True)
+            path = self._segment_path(live[0][0])
+            with open(path, "a", encoding="utf-8") as file:
+                file.write("".join(line for _, line in live))
+            self._segments[path] = live[-1][0]
+            self._segments = OrderedDict(sorted(self._segments.items()))
+        self._read_index = 0
+        self._read_offset = 0
+
+    def _append_to_spool(self, seq, line):
+        # Results pushed live since the last segment started may come back to the spool on a
+        # disconnect, in a segment that has to sort before this result: start a new segment.
+        if self._write_file is None or self._write_file.tell() >= self.max_segment_bytes or self._live_pushed:
+            self._start_segment(seq)
+            self._live_pushed = False
+        self._write_file.write(line)
+        self._segments[self._write_path] = seq
+
+        # Keep the spool bounded by dropping its oldest segment
+        while self._spool_bytes() > self.max_spool_bytes and len(self._segments) > 1:
+            oldest = next(iter(self._segments))
+            with open(oldest, "rb") as file:
+                dropped_lines = sum(1 for _ in file)
+            self._remove_segment(oldest)
+            self.dropped += dropped_lines
+            print(f"WARNING: Result spool full, dropped {dropped_lines} oldest results.")
+
+    def _start_segment(self, first_seq):
+        if self._write_file is not None:
+            self._write_file.close()
+        os.makedirs(self.spool_directory, exist_ok=True)
+        self._write_path = self._segment_path(first_seq)
+        self._write_file = open(self._write_path, "a", encoding="utf-8")
+        self._segments[self._write_path] = first_seq
+
+    def _delete_acked_segments(self):
+        # A segment can go once every result in it is acknowledged and fully replayed
+        while self._segments:
+            oldest, last_seq = next(iter(self._segments.items()))
+            if last_seq > self._acked_seq:
+                return
+            self._remove_segment(oldest)
+
+    def _remove_segment(self, path):
+        index = list(self._segments).index(path)
+        if path == self._write_path:
+            self._write_file.close()
+            self._write_file = None
+            self._write_path = None
+        del self._segments[path]
+        os.remove(path)
+        # Keep the replay cursor on the same segment
+        if index < self._read_index:
+            self._read_index -= 1
+        elif index == self._read_index:
+            self._read_offset = 0
+
+    def _segment_path(self, first_seq):
+        return os.path.join(self.spool_directory, f"{SPOOL_SEGMENT_PREFIX}{first_seq:020d}{SPOOL_SEGMENT_EXTENSION}")
+
+    def _segment_size(self, path):
+        if path == self._write_path:
+            return self._write_file.tell()
+        return os.path.getsize(path)
+
+    def _spool_bytes(self):
+        return sum(self._segment_size(path) for path in self._segments)
+
+    def _load_spool(self):
+        # Pick up segments left by a previous run, once
+        if self._next_seq is not None:
+            return
+        last_seq = 0
+        if os.path.isdir(self.spool_directory):
+            for name in sorted(os.listdir(self.spool_directory)):
+                if not (name.startswith(SPOOL_SEGMENT_PREFIX) and name.endswith(SPOOL_SEGMENT_EXTENSION)):
+                    continue
+                path = os.path.join(self.spool_directory, name)
+                with open(path, "r", encoding="utf-8") as file:
+                    lines = [line for line in file if line.endswith("\n")]
+                if not lines:
+                    os.remove(path)
+                    continue
+                self._segments[path] = json.loads(lines[-1])["seq"]
+                last_seq = max(last_seq, self._segments[path])
+        # Sequence numbers keep growing across restarts: start above both the spool and the clock
+        self._next_seq = max(last_seq + 1, time.time_ns() // 1000)
@@ -0,0 +1,197 @@
+import atexit
+import json
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict, deque
+
+"""
+Append-only result log shared by every monitoring task.
+
+Each task result is one JSON object per line (JSON Lines) in a file titled by the
+task's service id (<service_id>.jsonl). Records are never re-read or re-written:
+task loops only hand them to a single background writer thread, which groups the
+records of all tasks into batches and commits each batch with one write per file
+(group commit), followed by an fsync according to the configured policy.
+"""
+
+RESULT_FILE_EXTENSION = ".jsonl"
+FSYNC_POLICIES = ("never", "batch", "interval")
+
+
+def result_filename(service_id, directory="."):
+    """
+    Build the path of the result log for a service id.
+
+    :param service_id: Service id of the task
+    :param directory: Directory holding the result logs
+    :return: Path to <service_id>.jsonl
+    """
+    return os.path.join(directory, f"{service_id}{RESULT_FILE_EXTENSION}")
+
+
+class ResultWriter:
+    def __init__(self, directory=".", flush_interval=1.0, max_batch=1000, fsync_policy="never",
+                 fsync_interval=5.0, max_open_files=256):
+        """
+        Shared writer that batches task results into append-only JSON Lines files.
+
+        :param directory: Directory where <service_id>.jsonl files are written
+        :param flush_interval: Longest time in seconds a record may wait in memory before being written
+        :param max_batch: Largest number of records committed in one batch
+        :param fsync_policy: "never" (leave it to the OS), "batch" (fsync after every batch) or
+                             "interval" (fsync at most once every fsync_interval seconds)
+        :param fsync_interval: Seconds between fsyncs when fsync_policy is "interval"
+        :param max_open_files: Number of result files kept open between batches
+        """
+        if fsync_policy not in FSYNC_POLICIES:
+            raise ValueError(f"fsync_policy must be one of {FSYNC_POLICIES}, not {fsync_policy!r}")
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.fsync_policy = fsync_policy
+        self.fsync_interval = fsync_interval
+        self.max_open_files = max_open_files
+
+        self._queue = queue.Queue()
+        self._open_files = OrderedDict()  # service_id -> file object, least recently used first
+        self._last_fsync = time.monotonic()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start the background writer thread if it is not already running."""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="result-writer", daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+
+    def write(self, service_id, record):
+        """
+        Queue one result record for the service id. Never blocks on disk I/O.
+
+        :param service_id: Service id the record belongs to
+        :param record: JSON serializable result record
+        """
+        if self._thread is None:
+            self.start()
+        line = json.dumps(record, separators=(",", ":")) + "\n"
+        self._queue.put((service_id, line))
+
+    def flush(self):
+        """Block until every record queued so far has been written."""
+        if self._thread is not None:
+            self._queue.join()
+
+    def close(self):
+        """Write any queued records and close all result files."""
+        self.flush()
+        with self._lock:
+            for file in self._open_files.values():
+                file.close()
+            self._open_files.clear()
+
+    def _run(self):
+        while True:
+            # Wait for the first record of a batch, then collect more until the batch
+            # is full or the flush interval has passed.
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self._commit(batch)
+            except Exception as e:
+                print(f"WARNING: Failed to write results: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _commit(self, batch):
+        # Group the lines by service id so every file gets a single write per batch
+        lines_by_service = {}
+        for service_id, line in batch:
+            lines_by_service.setdefault(service_id, []).append(line)
+
+        with self._lock:
+            written = []
+            for service_id, lines in lines_by_service.items():
+                file = self._get_file(service_id)
+                file.write("".join(lines))
+                file.flush()
+                written.append(file)
+
+            now = time.monotonic()
+            if self.fsync_policy == "batch" or (self.fsync_policy == "interval"
+                                                and now - self._last_fsync >= self.fsync_interval):
+                for file in written:
+                    os.fsync(file.fileno())
+                self._last_fsync = now
+
+    def _get_file(self, service_id):
+        file = self._open_files.get(service_id)
+        if file is not None:
+            self._open_files.move_to_end(service_id)
+            return file
+        # Close the least recently used file when too many are open
+        if len(self._open_files) >= self.max_open_files:
+            _, oldest = self._open_files.popitem(last=False)
+            oldest.close()
+        file = open(result_filename(service_id, self.directory), "a", encoding="utf-8")
+        self._open_files[service_id] = file
+        return file
+
+
+def stream_results(filename):
+    """
+    Yield the records of a result log one at a time without loading the whole file.
+
+    :param filename: Path to a <service_id>.jsonl file
+    """
+    with open(filename, "r", encoding="utf-8") as file:
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
+
+
+def tail_results(filename, count, block_size=65536):
+    """
+    Return the last records of a result log by reading the file backwards from the end.
+
+    :param filename: Path to a <service_id>.jsonl file
+    :param count: Number of records to return
+    :param block_size: Bytes read per step while scanning backwards
+    :return: List of at most count records, oldest first
+    """
+    if count <= 0:
+        return []
+    with open(filename, "rb") as file:
+        file.seek(0, os.SEEK_END)
+        position = file.tell()
+        buffer = b""
+        lines = deque()
+        # Read blocks from the end until enough complete lines have been seen
+        while position > 0 and len(lines) < count:
+            read_size = min(block_size, position)
+            position -= read_size
+            file.seek(position)
+            buffer = file.read(read_size) + buffer
+            parts = buffer.split(b"\n")
+            # The first part may be an incomplete line, keep it for the next block
+            buffer = parts.pop(0)
+            for part in reversed(parts):
+                if part.strip():
+                    lines.appendleft(part)
+        if position == 0 and buffer.strip():
+            lines.appendleft(buffer)
+
+    records = list(lines)[-count:]
+    return [json.loads(line) for line in records]
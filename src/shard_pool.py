@@ -0,0 +1,211 @@
+import multiprocessing
+import queue
+import threading
+import zlib
+from monitoring_service_task import result_listeners, notify_result_listeners
+from task_scheduler import ScheduledTask, TaskScheduler, PhaseStagger, FIXED_RATE
+
+"""
+Multi-process sharding of probe execution.
+
+The monitoring service process keeps the management connections, the task bookkeeping and the
+result stream, while every task runs on one of N worker processes, each with its own interpreter,
+GIL and TaskScheduler. Service ids are hashed to a shard (CRC32, stable across processes), so all
+operations on a task land on the same worker. Workers write their tasks' result files themselves
+and send the timestamped records back in batches over a single multiprocessing queue, where the
+parent hands them to its result listeners exactly like results recorded in process.
+Each record travels with the schedule counters of its task, which the parent copies to its
+ScheduledTask so the stats action reports them as for tasks run in process. Stop and pause
+completions come back the same way and are passed to the pool's on_event. Phase offsets of
+fixed-rate tasks are handed out by the parent, staggering same-frequency tasks across shards.
+"""
+
+# Records a worker packs into one message back to the parent
+RESULT_BATCH_SIZE = 256
+
+
+def shard_for(service_id, num_shards):
+    """
+    Shard index of a service id.
+
+    :param service_id: Service id of the task
+    :param num_shards: Number of worker processes
+    :return: Index in range(num_shards)
+    """
+    return zlib.crc32(str(service_id).encode("utf-8")) % num_shards
+
+
+class ShardPool:
+    def __init__(self, num_workers, on_event=None):
+        """
+        Pool of worker processes, each running the tasks of one shard.
+
+        :param num_workers: Number of worker processes, usually the number of cores
+        :param on_event: Callable on_event(task, event) once a stop or pause has taken effect on the worker
+        """
+        self.num_workers = num_workers
+        self.on_event = on_event
+        # spawn: workers must not inherit the server's sockets, threads and locks
+        self._context = multiprocessing.get_context("spawn")
+        self._command_queues = []
+        self._result_queue = None
+        self._processes = []
+        self._collector = None
+        self._lock = threading.Lock()
+        self._stagger = PhaseStagger()
+        self._tasks = {}  # service_id -> ScheduledTask of the parent, updated with the worker's counters
+
+    def start(self):
+        """Start the worker processes and the result collector if they are not running yet."""
+        with self._lock:
+            if self._processes:
+                return
+            self._result_queue = self._context.Queue()
+            for index in range(self.num_workers):
+                command_queue = self._context.Queue()
+                process = self._context.Process(target=_worker_main, args=(index, command_queue, self._result_queue),
+                                                name=f"probe-shard-{index}", daemon=True)
+                process.start()
+                self._command_queues.append(command_queue)
+                self._processes.append(process)
+            self._collector = threading.Thread(target=self._collect, name="shard-results", daemon=True)
+            self._collector.start()
+
+    def add(self, task, delay=0.0):
+        """
+        Start task on its shard. Same interface as TaskScheduler.add.
+
+        :param task: ScheduledTask holding the task definition; its events mirror the task state
+        :param delay: Seconds before the first iteration
+        """
+        self.start()
+        phase = self._stagger.offset(task.frequency) if task.schedule == FIXED_RATE else None
+        self._tasks[task.service_id] = task
+        self._send(task.service_id, ("add", task.service_id, task.function, task.frequency, task.args, delay,
+                                     task.schedule, phase, task.iteration))
+
+    def pause(self, task):
+        """
+        Pause task on its shard.
+
+        :param task: ScheduledTask to pause
+        """
+        task.pause_event.clear()
+        self._send(task.service_id, ("pause", task.service_id))
+
+    def resume(self, task):
+        """
+        Resume task on its shard.
+
+        :param task: ScheduledTask to resume
+        """
+        task.pause_event.set()
+        self._send(task.service_id, ("resume", task.service_id))
+
+    def stop(self, task):
+        """
+        Stop task on its shard. Returns without waiting, the worker reports when it has stopped.
+
+        :param task: ScheduledTask to stop
+        """
+        task.stop_event.set()
+        task.pause_event.set()
+        self._send(task.service_id, ("stop", task.service_id))
+
+    def shutdown(self):
+        """Stop every worker after its tasks have stopped."""
+        with self._lock:
+            for command_queue in self._command_queues:
+                command_queue.put(("shutdown",))
+            for process in self._processes:
+                process.join()
+            self._command_queues = []
+            self._processes = []
+
+    def _send(self, service_id, command):
+        self._command_queues[shard_for(service_id, self.num_workers)].put(command)
+
+    def _collect(self):
+        # Hand the records of every worker to the result listeners of this process
+        while True:
+            batch = self._result_queue.get()
+            for kind, service_id, payload, counters in batch:
+                task = self._tasks.get(service_id)
+                if task is not None:
+                    task.update_counters(counters)
+                if kind == "result":
+                    notify_result_listeners(service_id, payload)
+                    continue
+                # Stop or pause completed on the worker
+                if payload == "stopped":
+                    self._tasks.pop(service_id, None)
+                if task is not None and self.on_event is not None:
+                    try:
+                        self.on_event(task, payload)
+                    except Exception as e:
+                        print(f"WARNING: Task event listener failed for service ID #{service_id}: {e}")
+
+
+def _worker_main(index, command_queue, result_queue):
+    """Entry point of a worker process: run the tasks of one shard and forward their results."""
+    pending = queue.Queue()
+    tasks = {}
+
+    def forward(service_id, record):
+        task = tasks.get(service_id)
+        if task is None:
+            counters = (record["iteration"] + 1, 0, 0, 0.0)
+        else:
+            # The iteration counter only advances after the record is handed to the listeners
+            counters = (record["iteration"] + 1,) + task.schedule_counters()[1:]
+        pending.put(("result", service_id, record, counters))
+
+    def forward_event(task, event):
+        pending.put(("event", task.service_id, event, task.schedule_counters()))
+
+    scheduler = TaskScheduler(on_event=forward_event)
+
+    # Only forward results from here; listeners registered while importing the parent's modules
+    # (e.g. the result stream) belong to the parent
+    result_listeners[:] = [forward]
+    threading.Thread(target=_forward_results, args=(pending, result_queue), name="shard-forwarder",
+                     daemon=True).start()
+
+    while True:
+        command = command_queue.get()
+        action = command[0]
+        if action == "add":
+            _, service_id, function, frequency, args, delay, schedule, phase, iteration = command
+            tasks[service_id] = ScheduledTask(service_id, function, frequency, *args, schedule=schedule)
+            # Restored tasks carry on from their checkpointed iteration
+            tasks[service_id].iteration = iteration
+            scheduler.add(tasks[service_id], delay, phase)
+        elif action == "pause" and command[1] in tasks:
+            scheduler.pause(tasks[command[1]])
+        elif action == "resume" and command[1] in tasks:
+            scheduler.resume(tasks[command[1]])
+        elif action == "stop" and command[1] in tasks:
+            scheduler.stop(tasks.pop(command[1]))
+        elif action == "shutdown":
+            for task in list(tasks.values()):
+                scheduler.stop(task)
+            for task in tasks.values():
+                # .wait() -> returns once the cancelled iteration has ended
+                task.idle_event.wait()
+            # Let the forwarder send the last results before the process exits
+            pending.join()
+            return
+
+
+def _forward_results(pending, result_queue):
+    # Batch records so a busy shard pays one pickle and one pipe write per RESULT_BATCH_SIZE results
+    while True:
+        batch = [pending.get()]
+        while len(batch) < RESULT_BATCH_SIZE:
+            try:
+                batch.append(pending.get_nowait())
+            except queue.Empty:
+                break
+        result_queue.put(batch)
+        for _ in batch:
+            pending.task_done()
@@ -0,0 +1,149 @@
+import threading
+from journal_store import JournalStore, DEFAULT_COMPACT_MIN
+
+"""
+Management-side registry of every task created through the management service.
+
+Task definitions and their status live in memory, keyed by service ID, with secondary
+indexes by task type, status and monitoring service (node), so looking up a task or listing
+the tasks in a state does not scan them all. Every change is persisted through a JournalStore
+(config_file.json plus its journal): recording a command appends one line rather than
+re-reading and re-writing the whole file.
+"""
+
+
+class TaskRegistry:
+    def __init__(self, path="config_file.json", compact_min=DEFAULT_COMPACT_MIN, fsync=False):
+        """
+        Registry of task definitions persisted in path.
+
+        :param path: Snapshot of the registry, a config_file.json written as a list by older versions is read too
+        :param compact_min: Journal lines always allowed before the snapshot is rewritten
+        :param fsync: True to fsync every change
+        """
+        self.store = JournalStore(path, compact_min=compact_min, fsync=fsync)
+        self._lock = threading.RLock()
+        # Secondary indexes: value -> set of service IDs
+        self._by_task = {}
+        self._by_status = {}
+        self._by_node = {}
+        for service_id, details in self.store.data.items():
+            self._index(service_id, details)
+
+    def __len__(self):
+        return len(self.store.data)
+
+    def __contains__(self, service_id):
+        return service_id in self.store.data
+
+    def get(self, service_id):
+        """
+        Details of a task.
+
+        :param service_id: Service ID of the task
+        :return: {"task", "frequency", "configuration", "status", "node"[, "schedule"]}, None if unknown
+        """
+        return self.store.get(service_id)
+
+    def items(self):
+        """(service_id, details) of every task, as a list."""
+        with self._lock:
+            return list(self.store.data.items())
+
+    def by_task(self, task):
+        """Service IDs of the tasks of a task type (e.g. "ping")."""
+        with self._lock:
+            return set(self._by_task.get(task, ()))
+
+    def by_status(self, status):
+        """Service IDs of the tasks with a status (e.g. "Paused")."""
+        with self._lock:
+            return set(self._by_status.get(status, ()))
+
+    def by_node(self, node):
+        """Service IDs of the tasks placed on a monitoring service."""
+        with self._lock:
+            return set(self._by_node.get(node, ()))
+
+    def counts(self, field):
+        """
+        Number of tasks per value of an indexed field.
+
+        :param field: "task", "status" or "node"
+        :return: {value: number of tasks}
+        """
+        index = {"task": self._by_task, "status": self._by_status, "node": self._by_node}[field]
+        with self._lock:
+            return {value: len(service_ids) for value, service_ids in index.items()}
+
+    def put(self, service_id, details):
+        """
+        Record a task, replacing an earlier task with the same service ID.
+
+        :param service_id: Service ID of the task
+        :param details: Task details, see get()
+        """
+        self.put_many([(service_id, details)])
+
+    def update(self, service_id, **changes):
+        """
+        Change fields of a recorded task.
+
+        :param service_id: Service ID of the task
+        :param changes: Fields to set, e.g. status="Paused"
+        :return: True if the task is recorded
+        """
+        return self.update_many([(service_id, changes)]) == 1
+
+    def put_many(self, tasks):
+        """
+        Record several tasks with one journal append.
+
+        :param tasks: Iterable of (service_id, details)
+        """
+        with self._lock:
+            tasks = list(tasks)
+            for service_id, details in tasks:
+                self._unindex(service_id)
+                self._index(service_id, details)
+            self.store.write(tasks)
+
+    def update_many(self, updates):
+        """
+        Change fields of several tasks with one journal append. Unknown service IDs are skipped.
+
+        :param updates: Iterable of (service_id, {field: value})
+        :return: Number of tasks updated
+        """
+        with self._lock:
+            tasks = []
+            for service_id, changes in updates:
+                details = self.store.get(service_id)
+                if details is None:
+                    continue
+                # Stored values are never modified in place, the journal records the new value
+                details = dict(details, **changes)
+                self._unindex(service_id)
+                self._index(service_id, details)
+                tasks.append((service_id, details))
+            self.store.write(tasks)
+            return len(tasks)
+
+    def close(self):
+        """Compact the journal into the snapshot."""
+        self.store.close()
+
+    def _index(self, service_id, details):
+        for index, field in ((self._by_task, "task"), (self._by_status, "status"), (self._by_node, "node")):
+            index.setdefault(details.get(field), set()).add(service_id)
+
+    def _unindex(self, service_id):
+        details = self.store.get(service_id)
+        if details is None:
+            return
+        for index, field in ((self._by_task, "task"), (self._by_status, "status"), (self._by_node, "node")):
+            service_ids = index.get(details.get(field))
+            if service_ids is not None:
+                service_ids.discard(service_id)
+                if not service_ids:
+                    del index[details.get(field)]
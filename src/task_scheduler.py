@@ -0,0 +1,356 @@
+import asyncio
+import heapq
+import itertools
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from monitoring_service_task import run_task_iteration, record_result
+from async_probe_services import probe_loop
+from probe_cancel import CancelScope, ProbeCancelled, active_scope
+
+"""
+Scheduler engine for monitoring tasks.
+
+Instead of one OS thread per task sleeping between iterations, every task is an entry
+in a priority queue ordered by the time its next iteration is due. A single dispatcher
+thread waits for the earliest due time and hands due tasks to a fixed-size pool of
+probe workers, so idle tasks cost a heap entry rather than a thread and its stack.
+Coroutine task functions are started on the shared probe loop instead, so their checks
+hold no worker at all while they wait on the network.
+
+Tasks run fixed-delay (the next iteration is due frequency seconds after the previous one
+ended, so the period stretches with the probe duration) or fixed-rate (iterations are due
+on a grid of monotonic deadlines anchor + k * frequency, whatever the probe duration).
+Fixed-rate tasks sharing a frequency are spread over the period by golden-ratio phase
+offsets, so tasks added together do not fire in lockstep. Iterations starting well after
+their deadline are counted as late, deadlines skipped because the task was still running
+(or no worker was free) as missed: both growing is the sign of an overloaded node.
+
+Stopping or pausing a task never waits for it: the iteration in flight is cancelled through
+its CancelScope (or its future on the probe loop) and on_event(task, "stopped"/"paused") is
+called once it has actually ended, so a control request returns in milliseconds whatever
+the task is blocked on.
+"""
+
+FIXED_DELAY = "fixed-delay"
+FIXED_RATE = "fixed-rate"
+SCHEDULES = (FIXED_DELAY, FIXED_RATE)
+# An iteration is late when it starts more than this fraction of its period after its deadline...
+LATE_FRACTION = 0.1
+# ...and at least this many seconds after it
+LATE_MIN_SECONDS = 0.05
+# Fractional part of the golden ratio: consecutive multiples are spread evenly over [0, 1)
+GOLDEN_RATIO_FRACTION = (math.sqrt(5) - 1) / 2
+
+
+class PhaseStagger:
+    def __init__(self):
+        """Hands out phase offsets spreading the tasks of each frequency over their period."""
+        self._counts = {}  # frequency -> number of offsets handed out
+        self._lock = threading.Lock()
+
+    def offset(self, frequency):
+        """
+        Phase offset of the next task with this frequency.
+
+        :param frequency: Period of the task in seconds
+        :return: Offset in seconds, in [0, frequency)
+        """
+        with self._lock:
+            count = self._counts.get(frequency, 0)
+            self._counts[frequency] = count + 1
+        return (count * GOLDEN_RATIO_FRACTION) % 1.0 * frequency
+
+
+class ScheduledTask:
+    def __init__(self, service_id, function, frequency, *args, schedule=FIXED_DELAY):
+        """
+        State of one task held by the scheduler.
+
+        :param service_id: Service id of the task
+        :param function: Mapped function to execute task
+        :param frequency: Frequency in seconds for iteration of task
+        :param args: Specific arguments required for task
+        :param schedule: FIXED_DELAY or FIXED_RATE
+        """
+        self.service_id = service_id
+        self.function = function
+        self.frequency = frequency
+        self.args = args
+        self.schedule = schedule
+
+        # pause_event set == running, cleared while paused
+        self.pause_event = threading.Event()
+        self.pause_event.set()
+        self.stop_event = threading.Event()
+        # Set while no iteration is in flight
+        self.idle_event = threading.Event()
+        self.idle_event.set()
+
+        self.iteration = 1
+        self.next_due = 0.0
+        self.scheduled = False  # True while the task has an entry in the heap
+        self.running = False    # True while an iteration is in flight on a worker
+        self.start_time = time.perf_counter()
+        # Cancellation handles of the iteration in flight
+        self.scope = None
+        self.future = None
+
+        # Schedule health: iterations started late, deadlines skipped, worst start delay
+        self.late = 0
+        self.missed = 0
+        self.max_lateness = 0.0
+
+    def schedule_counters(self):
+        """Iteration and schedule health counters, update_counters applies them to another copy of the task."""
+        return self.iteration, self.late, self.missed, self.max_lateness
+
+    def update_counters(self, counters):
+        self.iteration, self.late, self.missed, self.max_lateness = counters
+
+    def schedule_stats(self):
+        """Schedule mode and health counters for the stats action."""
+        return {"schedule": self.schedule, "frequency": self.frequency, "iterations": self.iteration - 1,
+                "late": self.late, "missed": self.missed, "max_lateness_ms": round(self.max_lateness * 1000, 3)}
+
+    def late_threshold(self):
+        return max(LATE_MIN_SECONDS, LATE_FRACTION * self.frequency)
+
+
+class TaskScheduler:
+    def __init__(self, max_workers=32, on_event=None):
+        """
+        Priority queue of next-due times feeding a bounded pool of probe workers.
+
+        :param max_workers: Number of worker threads executing task iterations
+        :param on_event: Callable on_event(task, event) once a stop ("stopped") or pause ("paused") has taken effect
+        """
+        self.max_workers = max_workers
+        self.on_event = on_event
+        self._heap = []  # (next_due, tie breaker, ScheduledTask)
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._executor = None
+        self._dispatcher = None
+        self._stagger = PhaseStagger()
+
+    def start(self):
+        """Start the dispatcher thread and the worker pool if they are not running yet."""
+        with self._condition:
+            if self._dispatcher is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="probe-worker")
+                self._dispatcher = threading.Thread(target=self._dispatch, name="task-dispatcher", daemon=True)
+                self._dispatcher.start()
+
+    def add(self, task, delay=0.0, phase=None):
+        """
+        Schedule a new task, first iteration due after delay seconds (plus its phase offset if fixed-rate).
+
+        :param task: ScheduledTask to run
+        :param delay: Seconds before the first iteration
+        :param phase: Phase offset of a fixed-rate task, None to take the next staggered offset
+        """
+        self.start()
+        if task.schedule == FIXED_RATE:
+            delay += self._stagger.offset(task.frequency) if phase is None else phase
+        with self._condition:
+            self._push(task, time.monotonic() + delay)
+
+    def pause(self, task):
+        """
+        Pause task: its next due entry is parked instead of dispatched and an iteration in flight is cancelled.
+
+        :param task: ScheduledTask to pause
+        """
+        with self._condition:
+            task.pause_event.clear()
+            running = task.running
+            if running:
+                self._cancel_iteration(task)
+        if not running:
+            self._notify(task, "paused")
+
+    def resume(self, task):
+        """
+        Resume a paused task, first iteration due immediately (fixed-rate: at its next deadline).
+
+        :param task: ScheduledTask to resume
+        """
+        with self._condition:
+            task.pause_event.set()
+            print(f"\n**Service ID #{task.service_id} has resumed.\n")
+            if not task.scheduled and not task.running:
+                now = time.monotonic()
+                if task.schedule == FIXED_RATE:
+                    # Next deadline on the task's grid, keeping its phase; deadlines while paused are not missed
+                    periods = max(0, math.ceil((now - task.next_due) / task.frequency))
+                    self._push(task, task.next_due + periods * task.frequency)
+                else:
+                    self._push(task, now)
+
+    def stop(self, task):
+        """
+        Stop task without waiting: an iteration in flight is cancelled and reported stopped once it has ended.
+
+        :param task: ScheduledTask to stop; task.idle_event is set once it has stopped
+        """
+        with self._condition:
+            task.stop_event.set()
+            task.pause_event.set()
+            running = task.running
+            if running:
+                self._cancel_iteration(task)
+            self._condition.notify()
+        if not running:
+            self._stopped(task)
+
+    @staticmethod
+    def _cancel_iteration(task):
+        # Called with the condition held while task.running
+        task.scope.cancel()
+        if task.future is not None:
+            task.future.cancel()
+
+    def _push(self, task, due):
+        task.next_due = due
+        task.scheduled = True
+        heapq.heappush(self._heap, (due, next(self._sequence), task))
+        # Wake the dispatcher in case this entry is now the earliest
+        self._condition.notify()
+
+    def _dispatch(self):
+        while True:
+            with self._condition:
+                # Sleep until the earliest entry is due or a new entry arrives
+                while not self._heap or self._heap[0][0] > time.monotonic():
+                    timeout = self._heap[0][0] - time.monotonic() if self._heap else None
+                    self._condition.wait(timeout)
+                _, _, task = heapq.heappop(self._heap)
+                task.scheduled = False
+                if task.stop_event.is_set():
+                    continue
+                if not task.pause_event.is_set():
+                    # Park the task, resume() puts it back in the heap
+                    print(f"\n**Service ID #{task.service_id} has paused.\n")
+                    print("-" * 50)
+                    continue
+                task.running = True
+                task.idle_event.clear()
+                task.scope = CancelScope()
+            try:
+                if asyncio.iscoroutinefunction(task.function):
+                    self._started(task)
+                    try:
+                        coroutine = task.function(*task.args)
+                    except Exception as e:
+                        # e.g. a configuration not matching the task's arguments: fail this iteration only,
+                        # never the dispatcher that runs every task
+                        print(f"WARNING: Service ID #{task.service_id} iteration failed: {e}")
+                        self._reschedule(task)
+                        continue
+                    future = probe_loop.submit(coroutine)
+                    with self._condition:
+                        task.future = future
+                        # Stopped or paused between dispatch and submit
+                        if task.scope.cancelled:
+                            future.cancel()
+                    future.add_done_callback(lambda done, t=task: self._complete(t, done))
+                else:
+                    self._executor.submit(self._execute, task)
+            except RuntimeError:
+                # Worker pool shut down with the interpreter
+                return
+
+    def _execute(self, task):
+        scope = task.scope
+        try:
+            # Stopped or paused while waiting for a worker
+            if scope.cancelled:
+                return
+            self._started(task)
+            with active_scope(scope):
+                if run_task_iteration(task.function, task.service_id, task.iteration, *task.args) is not None:
+                    task.iteration += 1
+        except ProbeCancelled:
+            pass
+        except Exception as e:
+            print(f"WARNING: Service ID #{task.service_id} iteration failed: {e}")
+        finally:
+            self._reschedule(task)
+
+    def _complete(self, task, future):
+        # Called on the probe loop thread when an async iteration finishes (or was cancelled)
+        try:
+            if future.cancelled() or task.scope.cancelled:
+                return
+            record_result(task.service_id, task.iteration, future.result())
+            task.iteration += 1
+        except Exception as e:
+            print(f"WARNING: Service ID #{task.service_id} iteration failed: {e}")
+        finally:
+            self._reschedule(task)
+
+    @staticmethod
+    def _started(task):
+        # Delay between the deadline and the start of the iteration (waiting for a free worker)
+        lateness = time.monotonic() - task.next_due
+        if lateness > task.late_threshold():
+            task.late += 1
+        if lateness > task.max_lateness:
+            task.max_lateness = lateness
+
+    def _reschedule(self, task):
+        event = None
+        with self._condition:
+            task.running = False
+            task.scope = None
+            task.future = None
+            if task.stop_event.is_set():
+                event = "stopped"
+            elif task.pause_event.is_set():
+                self._push(task, self._next_due(task))
+            else:
+                print(f"\n**Service ID #{task.service_id} has paused.\n")
+                print("-" * 50)
+                event = "paused"
+            task.idle_event.set()
+        # Report outside the condition, listeners may take their time
+        if event == "stopped":
+            self._stopped(task)
+        elif event == "paused":
+            self._notify(task, event)
+
+    def _stopped(self, task):
+        self._report_stopped(task)
+        self._notify(task, "stopped")
+
+    def _notify(self, task, event):
+        if self.on_event is None:
+            return
+        try:
+            self.on_event(task, event)
+        except Exception as e:
+            print(f"WARNING: Task event listener failed for service ID #{task.service_id}: {e}")
+
+    @staticmethod
+    def _next_due(task):
+        now = time.monotonic()
+        if task.schedule != FIXED_RATE:
+            # Wait frequency after the iteration ends
+            return now + task.frequency
+        due = task.next_due + task.frequency
+        behind = now - due
+        if behind > task.late_threshold():
+            # The iteration overran its period: skip the deadlines already passed, keeping the phase
+            skipped = math.floor(behind / task.frequency) + 1
+            task.missed += skipped
+            due += skipped * task.frequency
+        return due
+
+    @staticmethod
+    def _report_stopped(task):
+        end_time = time.perf_counter()
+        print(f"Service ID #{task.service_id} has stopped:")
+        print(f"    Task iteration count: {task.iteration - 1}")
+        print(f"    Total monitoring lasted: {round(end_time - task.start_time, 2)} seconds.")
@@ -0,0 +1,86 @@
+import json
+import pytest
+from journal_store import JournalStore
+
+"""
+Behaviour of the snapshot + journal store, including the files written by older versions.
+"""
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "thread_file.json")
+
+
+def write_snapshot(path, content):
+    with open(path, "w") as file:
+        file.write(content)
+
+
+@pytest.mark.parametrize("content, expected", [
+    # thread_file.json of the old stop/resume: json.dump(str(thread_tracker)), a single JSON string
+    (json.dumps(str({"1": {"thread": "<Thread(Thread-1, started)>"}})), {}),
+    # thread_file.json of the old add/pause: a list of service IDs
+    (json.dumps(["1", "2"]), {}),
+    # config_file.json of the old management service: a list of single-key objects
+    (json.dumps([{"1": {"task": "ping"}}, {"2": {"task": "tcp"}}, {"1": {"task": "dns"}}]),
+     {"1": {"task": "dns"}, "2": {"task": "tcp"}}),
+    (json.dumps({"1": {"task": "ping"}}), {"1": {"task": "ping"}}),
+    (json.dumps(None), {}),
+    (json.dumps(42), {}),
+    ("", {}),
+    ("{not json", {}),
+])
+def test_legacy_and_damaged_snapshots_load(path, content, expected):
+    write_snapshot(path, content)
+    store = JournalStore(path)
+    assert store.data == expected
+
+    # The store keeps working on top of what it could read
+    store.put("3", {"task": "udp"})
+    store.close()
+    assert JournalStore(path).data == dict(expected, **{"3": {"task": "udp"}})
+
+
+def test_changes_are_journaled_and_replayed(path):
+    store = JournalStore(path, compact_min=100)
+    store.put("1", {"task": "ping"})
+    store.write([("2", {"task": "tcp"}), ("1", {"task": "dns"})])
+    store.delete("2")
+
+    # Nothing compacted yet: the snapshot does not exist, the journal holds one line per change
+    with open(path + ".journal") as file:
+        assert len(file.readlines()) == 4
+    assert JournalStore(path).data == {"1": {"task": "dns"}}
+
+
+def test_compaction_rewrites_the_snapshot_and_empties_the_journal(path):
+    store = JournalStore(path, compact_min=3)
+    # Rewriting two keys: the journal outgrows both compact_min and the entries on the fourth line
+    for index in range(4):
+        store.put(str(index % 2), {"iteration": index})
+    with open(path) as file:
+        assert json.load(file) == {"0": {"iteration": 2}, "1": {"iteration": 3}}
+    with open(path + ".journal") as file:
+        assert file.read() == ""
+
+    store.put("0", {"iteration": 10})
+    store.close()
+    assert JournalStore(path).data["0"] == {"iteration": 10}
+
+
+def test_torn_journal_line_is_skipped_and_compacted_away(path):
+    store = JournalStore(path)
+    store.put("1", {"task": "ping"})
+    store.put("2", {"task": "tcp"})
+    store.close()
+    with open(path + ".journal", "a") as file:
+        file.write(json.dumps({"key": "3", "value": {"task": "udp"}}) + "\n")
+        # Crash in the middle of the next append
+        file.write('{"key": "4", "val')
+
+    reloaded = JournalStore(path)
+    assert reloaded.data == {"1": {"task": "ping"}, "2": {"task": "tcp"}, "3": {"task": "udp"}}
+    # Appends after the reload land on a clean journal
+    reloaded.put("5", {"task": "dns"})
+    assert sorted(JournalStore(path).data) == ["1", "2", "3", "5"]
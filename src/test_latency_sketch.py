@@ -0,0 +1,78 @@
+import math
+import random
+import pytest
+from latency_sketch import LatencySketch, LatencyStats, TaskStats
+from timeseries_store import STATUS_ERROR, STATUS_FAILED, STATUS_OK
+
+"""
+Behaviour of the latency sketch: quantiles within the relative accuracy, exact merges, and the
+per-task statistics built on it.
+"""
+
+
+def true_quantile(values, q):
+    # Same rank as LatencySketch.quantile: the value at index floor(q * (n - 1)) of the sorted values
+    ordered = sorted(values)
+    return ordered[int(q * (len(ordered) - 1))]
+
+
+@pytest.mark.parametrize("relative_accuracy", [0.01, 0.05])
+def test_quantiles_are_within_the_relative_accuracy(relative_accuracy):
+    generator = random.Random(7)
+    # Latencies over several orders of magnitude, from sub-millisecond to seconds
+    values = [generator.lognormvariate(math.log(20), 1.5) for _ in range(20000)]
+    sketch = LatencySketch(relative_accuracy)
+    for value in values:
+        sketch.add(value)
+
+    for q in (0.0, 0.01, 0.25, 0.5, 0.9, 0.95, 0.99, 0.999, 1.0):
+        expected = true_quantile(values, q)
+        assert abs(sketch.quantile(q) - expected) <= relative_accuracy * expected + 1e-9
+    assert sketch.count == len(values)
+    assert sketch.min == min(values) and sketch.max == max(values)
+
+
+def test_merge_equals_one_sketch_of_every_value():
+    generator = random.Random(11)
+    values = [generator.expovariate(1 / 50) for _ in range(5000)] + [0.0] * 10
+    whole, first, second = LatencySketch(), LatencySketch(), LatencySketch()
+    for index, value in enumerate(values):
+        whole.add(value)
+        (first if index % 2 else second).add(value)
+
+    first.merge(second)
+    assert first.buckets == whole.buckets
+    assert (first.zero_count, first.count, first.min, first.max) == (whole.zero_count, whole.count, whole.min,
+                                                                     whole.max)
+    for q in (0.5, 0.9, 0.99):
+        assert first.quantile(q) == whole.quantile(q)
+
+
+def test_merge_needs_the_same_accuracy_and_survives_serialisation():
+    with pytest.raises(ValueError):
+        LatencySketch(0.01).merge(LatencySketch(0.02))
+
+    sketch = LatencySketch()
+    for value in (0.5, 3.0, 3.1, 250.0):
+        sketch.add(value)
+    restored = LatencySketch.from_dict(sketch.to_dict())
+    assert restored.quantile(0.5) == sketch.quantile(0.5)
+    assert LatencySketch().quantile(0.5) is None
+
+
+def test_task_stats_loss_and_windows():
+    stats = LatencyStats(window_seconds=60)
+    stats.add("1", 120.0, [(10.0, STATUS_OK), (None, STATUS_ERROR)])
+    stats.add("1", 185.0, [(30.0, STATUS_FAILED)])
+    stats.add("2", 185.0, [(20.0, STATUS_OK)])
+
+    summary = stats.merged(["1"]).summary()
+    assert (summary["samples"], summary["ok"], summary["failed"], summary["errors"]) == (3, 1, 1, 1)
+    assert summary["loss"] == pytest.approx(2 / 3)
+    assert summary["latency_count"] == 2
+    # Only the window starting at 180 ends after 181
+    assert stats.merged(["1", "2"], since=181.0).summary()["samples"] == 2
+    assert TaskStats.from_dict(stats.merged().to_dict()).summary() == stats.merged().summary()
+
+    stats.discard("1")
+    assert stats.merged().samples == 1
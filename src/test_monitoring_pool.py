@@ -0,0 +1,114 @@
+import json
+from monitoring_pool import HashRing, MonitoringNode, MonitoringPool, OFFLINE, ONLINE
+
+"""
+Behaviour of task placement over several monitoring services: consistent hashing, routing to
+the owning node, and failover when a node goes offline and comes back. Nodes answer from
+memory, nothing is sent over the network.
+"""
+
+
+class _FakeNode(MonitoringNode):
+    def __init__(self, name):
+        super().__init__(name, "127.0.0.1", 0)
+        self.status = ONLINE
+        self.requests = []
+
+    def request(self, message_data):
+        if self.status != ONLINE:
+            return None
+        self.requests.append(message_data)
+        if message_data["action"] == "batch":
+            results = [{"action": operation["action"], "service_id": operation["service_id"], "ok": True}
+                       for operation in message_data["operations"]]
+            return json.dumps({"action": "batch", "status": "applied", "results": results})
+        return json.dumps({"action": message_data["action"], "service_id": message_data["service_id"]})
+
+    def actions(self):
+        return [(message["action"], message.get("service_id")) for message in self.requests]
+
+
+def make_pool(names=("node-a", "node-b", "node-c"), **kwargs):
+    nodes = [_FakeNode(name) for name in names]
+    return MonitoringPool(nodes, **kwargs), {node.name: node for node in nodes}
+
+
+def add_message(service_id):
+    return {"action": "add_task", "service_id": service_id, "task": "ping", "frequency": 5,
+            "configuration": ["example.com"]}
+
+
+def test_hash_ring_spreads_keys_and_only_moves_those_of_a_removed_node():
+    keys = [str(index) for index in range(3000)]
+    ring = HashRing(["node-a", "node-b", "node-c"])
+    placement = {key: ring.lookup(key) for key in keys}
+    assert placement == {key: HashRing(["node-c", "node-b", "node-a"]).lookup(key) for key in keys}
+    for name in ("node-a", "node-b", "node-c"):
+        assert 600 < list(placement.values()).count(name) < 1400
+
+    # Without node-b its keys spread over the others, every other key stays put
+    without_b = {key: ring.lookup(key, lambda name: name != "node-b") for key in keys}
+    assert all(without_b[key] == placement[key] for key in keys if placement[key] != "node-b")
+    assert "node-b" not in without_b.values()
+    assert ring.lookup("1", lambda name: False) is None
+
+
+def test_operations_go_to_the_node_owning_the_task():
+    pool, nodes = make_pool()
+    for service_id in map(str, range(30)):
+        pool.request(add_message(service_id))
+    assert {assignment["node"] for assignment in pool.assignments.values()} == set(nodes)
+
+    owner = nodes[pool.assign("7")]
+    pool.request({"action": "pause_task", "service_id": "7"})
+    assert owner.actions()[-1] == ("pause_task", "7") and pool.assignments["7"]["paused"]
+    pool.request({"action": "stop_task", "service_id": "7"})
+    assert "7" not in pool.assignments
+
+    # A batch becomes one message per node, with the results in the order of the operations
+    operations = [{"action": "pause_task", "service_id": service_id} for service_id in map(str, range(10))]
+    response = pool.batch(operations)
+    assert response["status"] == "applied"
+    assert [result["service_id"] for result in response["results"]] == [str(index) for index in range(10)]
+    assert all(result["node"] == pool.assign(result["service_id"]) for result in response["results"])
+
+
+def test_tasks_of_an_offline_node_move_and_are_stopped_when_it_returns():
+    reassigned = []
+    pool, nodes = make_pool(on_reassign=lambda service_id, name: reassigned.append((service_id, name)))
+    for service_id in map(str, range(30)):
+        pool.request(add_message(service_id))
+    down = nodes[pool.assign("3")]
+    pool.request({"action": "pause_task", "service_id": "3"})
+    owned = {service_id for service_id, assignment in pool.assignments.items() if assignment["node"] == down.name}
+
+    down.status = OFFLINE
+    pool._node_down(down)
+    assert {service_id for service_id, _ in reassigned} == owned
+    for service_id, name in reassigned:
+        assert name != down.name and pool.assignments[service_id]["node"] == name
+        assert ("add_task", service_id) in nodes[name].actions()
+    # The paused task stays paused where it landed
+    moved_to = nodes[pool.assign("3")].actions()
+    assert moved_to[moved_to.index(("add_task", "3")) + 1] == ("pause_task", "3")
+
+    down.status = ONLINE
+    pool._node_up(down)
+    assert sorted(down.actions()[-len(owned):]) == sorted(("stop_task", service_id) for service_id in owned)
+    assert pool.orphaned[down.name] == set()
+
+
+def test_offline_node_keeps_its_tasks_when_no_other_node_is_online():
+    pool, nodes = make_pool(names=("node-a",))
+    pool.request(add_message("1"))
+    nodes["node-a"].status = OFFLINE
+    pool._node_down(nodes["node-a"])
+    assert pool.assignments["1"]["node"] == "node-a"
+
+
+def test_least_load_placement_fills_the_emptiest_node():
+    pool, nodes = make_pool(placement="least_load")
+    pool.load([("1", add_message("1"), "node-a", False), ("2", add_message("2"), "node-a", False),
+               ("3", add_message("3"), "node-b", False)])
+    assert pool.assign("4") == "node-c"
+    assert pool.assign("5") in ("node-b", "node-c")
@@ -0,0 +1,125 @@
+import json
+import pytest
+import monitoring_service
+from journal_store import JournalStore
+
+"""
+Behaviour of the monitoring service: the task checkpoints add, pause and stop record, how
+restore_tasks restarts them, and the replies of the query actions. Tasks go to a recording runner
+instead of the scheduler, so no probe runs.
+"""
+
+
+class _RecordingRunner:
+    """Stands in for the TaskScheduler / ShardPool, same add, pause, resume and stop methods."""
+
+    def __init__(self):
+        self.added = []
+
+    def add(self, task, delay=0.0):
+        self.added.append((task, delay))
+
+    def pause(self, task):
+        task.pause_event.clear()
+
+    def resume(self, task):
+        task.pause_event.set()
+
+    def stop(self, task):
+        task.stop_event.set()
+
+
+@pytest.fixture
+def runner(monkeypatch):
+    runner = _RecordingRunner()
+    monkeypatch.setattr(monitoring_service, "scheduler", runner)
+    monkeypatch.setattr(monitoring_service, "shard_pool", None)
+    monkeypatch.setattr(monitoring_service, "thread_tracker", {})
+    return runner
+
+
+@pytest.fixture
+def checkpoint_path(tmp_path, monkeypatch):
+    path = str(tmp_path / "thread_file.json")
+    monkeypatch.setattr(monitoring_service, "task_state", JournalStore(path))
+    yield path
+    monitoring_service.task_state.close()
+
+
+def test_checkpoints_follow_add_pause_and_stop(runner, checkpoint_path):
+    monitoring_service.add_task("1", monitoring_service.tcp_task, 10, "example.com", 22)
+    monitoring_service.add_task("2", monitoring_service.async_dns_task, 30, "example.com", "1.1.1.1", "A",
+                                schedule=monitoring_service.FIXED_RATE)
+    monitoring_service.pause_task("2")
+    monitoring_service.add_task("3", monitoring_service.udp_task, 10, "example.com", 53)
+    monitoring_service.stop_task("3")
+
+    checkpoints = JournalStore(checkpoint_path).data
+    assert checkpoints == {
+        "1": {"task": "tcp", "engine": "thread", "frequency": 10, "configuration": ["example.com", 22],
+              "schedule": "fixed-delay", "paused": False, "iteration": 1},
+        "2": {"task": "dns", "engine": "async", "frequency": 30, "configuration": ["example.com", "1.1.1.1", "A"],
+              "schedule": "fixed-rate", "paused": True, "iteration": 1},
+    }
+
+
+def test_restore_carries_on_and_skips_what_cannot_be_restored(runner, checkpoint_path):
+    monitoring_service.task_state.write([
+        ("1", {"task": "tcp", "engine": "thread", "frequency": 10, "configuration": ["example.com", 22],
+               "schedule": "fixed-delay", "paused": False, "iteration": 7}),
+        ("2", {"task": "dns", "engine": "async", "frequency": 30, "configuration": ["example.com", "1.1.1.1", "A"],
+               "schedule": "fixed-delay", "paused": True, "iteration": 3}),
+        ("3", {"task": "no-such-task", "frequency": 10, "configuration": []}),
+        ("4", {"task": "tcp", "frequency": 10, "configuration": ["too", "many", "arguments"]}),
+        ("5", "written by an older version"),
+    ])
+
+    assert monitoring_service.restore_tasks(window=5) == 2
+    tracker = monitoring_service.thread_tracker
+    assert sorted(tracker) == ["1", "2"]
+    assert tracker["1"]["task"].iteration == 7
+    assert tracker["1"]["task"].function is monitoring_service.tcp_task
+    assert tracker["2"]["task"].function is monitoring_service.async_dns_task
+    assert tracker["2"]["task"].iteration == 3
+    assert not tracker["2"]["pause_event"].is_set()
+    # First iterations are spread over the restore window
+    delays = [delay for _, delay in runner.added]
+    assert delays[0] == 0.0 and 0.0 < delays[1] < 5
+
+
+def test_node_with_a_legacy_checkpoint_file_starts_empty(runner, tmp_path, monkeypatch):
+    path = str(tmp_path / "thread_file.json")
+    # What stop_task and resume_task of older versions wrote
+    with open(path, "w") as file:
+        json.dump(str({"1": {"thread": "<Thread(Thread-1, started)>"}}), file)
+    monkeypatch.setattr(monitoring_service, "task_state", JournalStore(path))
+
+    assert monitoring_service.restore_tasks() == 0
+    assert monitoring_service.thread_tracker == {}
+    monitoring_service.task_state.close()
+
+
+class _RecordingConnection:
+    def __init__(self):
+        self.sent = b""
+
+    def sendall(self, data):
+        self.sent += data
+
+    def responses(self):
+        return [json.loads(line) for line in self.sent.decode("utf-8").splitlines()]
+
+
+def test_query_task_answers_malformed_arguments_with_an_error(monkeypatch):
+    monkeypatch.setattr(monitoring_service, "recent_results", monitoring_service.RecentResults(capacity=4))
+    monitoring_service.recent_results.record("1", {"timestamp": "2026-01-01 00:00:00", "iteration": 1,
+                                                   "result": {"example.com": {"status": True}}})
+    connection = _RecordingConnection()
+    for arguments in ({"last": -1}, {"since": "not a time"}, {"last": 1}):
+        monitoring_service.handle_monitoring_services(connection, {"action": "query_task", "service_id": "1",
+                                                                   **arguments})
+
+    malformed_last, malformed_since, valid = connection.responses()
+    assert "non-negative integer" in malformed_last["error"] and "results" not in malformed_last
+    assert "since" in malformed_since["error"]
+    assert [entry["iteration"] for entry in valid["results"]] == [1]
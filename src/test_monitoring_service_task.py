@@ -0,0 +1,48 @@
+import monitoring_service_task
+from async_probe_services import probe_loop
+from monitoring_service_task import async_tcp_task, ping_task, tcp_task, traceroute_task
+
+"""
+Shape of the task results: every task keeps its timings inside the entry of its target, so
+a caller iterating over the targets of a result never meets anything else.
+"""
+
+
+def fake_ping(host, num_pings=1, timer=None):
+    timer.add("reply", 2_000_000)
+    return [(("127.0.0.1", 0), 0.5), (None, None)][:num_pings]
+
+
+def fake_traceroute(host, num_query_packets=1, parallel=False, timer=None):
+    timer.add("reply", 1_000_000)
+    return " Hop Address ..."
+
+
+def test_ping_task_nests_replies_and_timings(monkeypatch):
+    monkeypatch.setattr(monitoring_service_task, "ping", fake_ping)
+    result = ping_task("example.com", "2")
+
+    assert list(result) == ["example.com"]
+    assert result["example.com"]["replies"] == [{"query": ("127.0.0.1", 0), "time_ms": 0.5},
+                                                {"error": "Request timed out or no reply received"}]
+    assert result["example.com"]["timings"]["reply_ms"] == 2.0
+
+
+def test_traceroute_task_nests_table_and_timings(monkeypatch):
+    monkeypatch.setattr(monitoring_service_task, "traceroute", fake_traceroute)
+    result = traceroute_task("example.com", "1", "parallel")
+
+    assert list(result) == ["example.com"]
+    assert result["example.com"]["table"] == " Hop Address ..."
+    assert result["example.com"]["timings"]["reply_ms"] == 1.0
+
+
+def test_sync_and_async_checks_share_their_shape():
+    # Port 1 on loopback: refused at once
+    sync_result = tcp_task("127.0.0.1", "1")
+    async_result = probe_loop.run(async_tcp_task("127.0.0.1", "1"), timeout=5)
+
+    assert list(sync_result) == list(async_result) == ["127.0.0.1"]
+    assert sync_result["127.0.0.1"].keys() == async_result["127.0.0.1"].keys()
+    assert set(sync_result["127.0.0.1"]["timings"]) == set(async_result["127.0.0.1"]["timings"]) == \
+        {"resolve_ms", "connect_ms", "total_ms"}
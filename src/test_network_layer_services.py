@@ -0,0 +1,53 @@
+import random
+import struct
+import pytest
+from network_layer_services import IcmpPacketTemplate, calculate_icmp_checksum, calculate_icmp_checksum_bytewise, \
+    create_icmp_packet, ICMP_HEADER
+
+"""
+Behaviour of the ICMP packet templates: the incrementally updated checksum must equal a full
+recompute over the packet for every sequence number.
+"""
+
+
+def full_checksum(packet):
+    # Checksum over the packet with its checksum field zeroed, by the byte pair reference implementation
+    zeroed = packet[:2] + b"\x00\x00" + packet[4:]
+    if len(zeroed) % 2:
+        zeroed += b"\x00"
+    return calculate_icmp_checksum_bytewise(zeroed)
+
+
+@pytest.mark.parametrize("icmp_type, icmp_code, icmp_id, data_size", [
+    (8, 0, 0x1234, 192), (8, 0, 0, 0), (8, 0, 0xffff, 56), (13, 0, 0xbeef, 33), (8, 0, 0x00ff, 1),
+])
+def test_template_checksum_matches_full_recompute(icmp_type, icmp_code, icmp_id, data_size):
+    template = IcmpPacketTemplate(icmp_type, icmp_code, icmp_id, data_size)
+    generator = random.Random(icmp_id)
+    sequences = [0, 1, 0x00ff, 0x0100, 0x7fff, -1, -0x8000] + [generator.randint(-0x8000, 0x7fff) for _ in range(500)]
+    for sequence in sequences:
+        packet = template.packet(sequence)
+        _, _, _, packed_id, packed_sequence = ICMP_HEADER.unpack(packet[:8])
+        assert (packed_id, packed_sequence) == (icmp_id, sequence)
+        # Checksum field in network byte order
+        assert struct.unpack("!H", packet[2:4])[0] == full_checksum(packet)
+        # A packet with a valid checksum sums to 0xffff, so its checksum is 0
+        assert calculate_icmp_checksum(packet) == 0
+        assert packet[8:] == template.data
+
+
+def test_array_checksum_matches_bytewise_reference():
+    generator = random.Random(3)
+    for size in (0, 2, 8, 64, 200, 1500):
+        data = bytes(generator.randrange(256) for _ in range(size))
+        assert calculate_icmp_checksum(data) == calculate_icmp_checksum_bytewise(data)
+    # An odd trailing byte counts as the high byte of a word padded with zero
+    assert calculate_icmp_checksum(b"\x12\x34\x56") == calculate_icmp_checksum_bytewise(b"\x12\x34\x56\x00")
+
+
+def test_create_icmp_packet_uses_the_cached_template():
+    first = create_icmp_packet(sequence_number=1, data_size=64, icmp_id=42)
+    second = create_icmp_packet(sequence_number=2, data_size=64, icmp_id=42)
+    # Same payload from the cached template, only the sequence number and checksum differ
+    assert first[8:] == second[8:] and len(first) == 72
+    assert calculate_icmp_checksum(first) == calculate_icmp_checksum(second) == 0
@@ -0,0 +1,96 @@
+import socket
+import threading
+import time
+import pytest
+import resolver_cache as resolver_cache_module
+from resolver_cache import ResolverCache
+
+"""
+Behaviour of the hostname cache: hits, negative caching (including lookups failing with errors
+other than socket.gaierror), shared concurrent misses and refresh ahead of expiry. getaddrinfo is
+replaced by a counting fake, no lookup leaves the host.
+"""
+
+
+class _FakeGetaddrinfo:
+    def __init__(self, answers):
+        self.answers = answers  # host -> list of addresses, or an exception to raise
+        self.calls = []
+        self.delay = 0.0
+
+    def __call__(self, host, port, family=0, type=0):
+        self.calls.append(host)
+        time.sleep(self.delay)
+        answer = self.answers[host]
+        if isinstance(answer, BaseException):
+            raise answer
+        return [(socket.AF_INET, socket.SOCK_STREAM, 6, "", (address, 0)) for address in answer]
+
+
+@pytest.fixture
+def getaddrinfo(monkeypatch):
+    fake = _FakeGetaddrinfo({"example.com": ["192.0.2.1", "192.0.2.2", "192.0.2.1"],
+                             "missing.example": socket.gaierror(socket.EAI_NONAME, "Name or service not known"),
+                             "a" * 70 + ".example": UnicodeError("label too long")})
+    monkeypatch.setattr(resolver_cache_module.socket, "getaddrinfo", fake)
+    return fake
+
+
+def test_addresses_are_cached_until_they_expire(getaddrinfo):
+    cache = ResolverCache(ttl=0.2)
+    assert cache.resolve_all("example.com") == ["192.0.2.1", "192.0.2.2"]
+    assert cache.resolve("example.com") == "192.0.2.1"
+    # IP addresses never reach getaddrinfo
+    assert cache.resolve("198.51.100.7") == "198.51.100.7"
+    assert getaddrinfo.calls == ["example.com"]
+
+    time.sleep(0.25)
+    cache.resolve("example.com")
+    assert getaddrinfo.calls == ["example.com", "example.com"]
+
+
+@pytest.mark.parametrize("host", ["missing.example", "a" * 70 + ".example"])
+def test_failed_lookups_are_cached_and_raised_as_gaierror(getaddrinfo, host):
+    cache = ResolverCache(negative_ttl=60)
+    for _ in range(3):
+        with pytest.raises(socket.gaierror):
+            cache.resolve(host)
+    assert getaddrinfo.calls == [host]
+    stats = cache.stats()
+    assert (stats["misses"], stats["hits"], stats["negative_hits"]) == (1, 2, 2)
+
+
+def test_concurrent_misses_share_one_lookup(getaddrinfo):
+    cache = ResolverCache()
+    getaddrinfo.delay = 0.1
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.resolve("example.com"))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == ["192.0.2.1"] * 8
+    assert getaddrinfo.calls == ["example.com"]
+
+
+def test_refresh_ahead_of_expiry_and_failed_refresh(getaddrinfo):
+    cache = ResolverCache(ttl=1.0)
+    cache.resolve("example.com")
+    time.sleep(0.9)
+    # Within the last 20 % of the TTL a hit is served at once and refreshed in the background
+    assert cache.resolve("example.com") == "192.0.2.1"
+    deadline = time.monotonic() + 2
+    while cache.stats()["refreshes"] < 1 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert getaddrinfo.calls == ["example.com", "example.com"]
+    assert cache.stats()["refresh_failures"] == 0
+
+    # A refresh failing with any error keeps the old addresses, and the refresh thread keeps going
+    getaddrinfo.answers["example.com"] = UnicodeError("label too long")
+    time.sleep(0.9)
+    assert cache.resolve("example.com") == "192.0.2.1"
+    deadline = time.monotonic() + 2
+    while cache.stats()["refresh_failures"] < 1 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert cache.stats()["refresh_failures"] == 1
+    assert cache.resolve("example.com") == "192.0.2.1"
@@ -0,0 +1,51 @@
+import datetime
+import pytest
+from result_buffer import RecentResults
+
+"""
+Behaviour of the in-memory recent results answering query_task.
+"""
+
+
+def record(iteration, timestamp="2026-01-01 00:00:00"):
+    return {"timestamp": timestamp, "iteration": iteration, "result": {"example.com": {"status": True}}}
+
+
+def test_query_returns_latest_results_oldest_first():
+    recent = RecentResults(capacity=3)
+    for iteration in range(1, 6):
+        recent.record("1", record(iteration))
+
+    # Only the latest capacity results are kept
+    assert [entry["iteration"] for entry in recent.query("1")] == [3, 4, 5]
+    assert [entry["iteration"] for entry in recent.query("1", last=2)] == [4, 5]
+    assert recent.query("1", last=1)[0] == record(5)
+
+
+def test_query_since_and_unknown_task(monkeypatch):
+    recent = RecentResults()
+    clock = iter([100.0, 200.0, 300.0])
+    monkeypatch.setattr("result_buffer.time.time", lambda: next(clock))
+    for iteration in range(1, 4):
+        recent.record("1", record(iteration))
+
+    assert [entry["iteration"] for entry in recent.query("1", since=200.0)] == [2, 3]
+    assert [entry["iteration"] for entry in recent.query("1", last=1, since=100.0)] == [3]
+    # A record timestamp string is read as local time
+    since = datetime.datetime.fromtimestamp(250.0).strftime("%Y-%m-%d %H:%M:%S")
+    assert [entry["iteration"] for entry in recent.query("1", since=since)] == [3]
+    assert recent.query("2") == []
+
+    recent.discard("1")
+    assert recent.query("1") == []
+
+
+@pytest.mark.parametrize("last, since", [
+    (-1, None), (1.5, None), ("2", None), (True, None),
+    (None, "yesterday"), (None, "2026-13-01 00:00:00"), (None, [1]), (None, False),
+])
+def test_malformed_arguments_are_rejected(last, since):
+    recent = RecentResults()
+    recent.record("1", record(1))
+    with pytest.raises(ValueError):
+        recent.query("1", last=last, since=since)
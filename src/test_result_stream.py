@@ -0,0 +1,122 @@
+import json
+import os
+import pytest
+from result_stream import ResultStream
+
+"""
+Behaviour of the result stream: results spooled while nobody listens are replayed in order, a
+window at a time, acknowledged segments are deleted, and unacknowledged results come back after
+a disconnect or a restart.
+"""
+
+
+class _RecordingConnection:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.messages = []
+
+    def sendall(self, data):
+        if self.fail:
+            raise ConnectionResetError("connection reset by peer")
+        self.messages.append(json.loads(data.decode("utf-8")))
+
+    def seqs(self):
+        return [message["seq"] for message in self.messages]
+
+    def values(self):
+        return [message["record"]["value"] for message in self.messages if message["action"] == "result"]
+
+
+@pytest.fixture
+def spool_directory(tmp_path):
+    return str(tmp_path / "result_spool")
+
+
+def segments(spool_directory):
+    return sorted(os.listdir(spool_directory)) if os.path.isdir(spool_directory) else []
+
+
+def test_spooled_results_are_replayed_a_window_at_a_time(spool_directory):
+    stream = ResultStream(spool_directory=spool_directory, window=3)
+    for value in range(7):
+        stream.publish("1", {"value": value})
+    assert len(segments(spool_directory)) == 1
+
+    connection = _RecordingConnection()
+    stream.subscribe(connection)
+    assert connection.values() == [0, 1, 2]
+    seqs = connection.seqs()
+    assert seqs == sorted(seqs) and len(set(seqs)) == 3
+
+    # Each acknowledgment opens the window again; results published meanwhile queue up behind the spool
+    stream.ack(connection, seqs[1])
+    stream.publish("1", {"value": 7})
+    assert connection.values() == [0, 1, 2, 3, 4]
+    while stream.status()["unacked"]:
+        stream.ack(connection, connection.seqs()[-1])
+    assert connection.values() == list(range(8))
+    assert connection.seqs() == sorted(connection.seqs())
+
+    # Everything acknowledged: the spool is gone and new results are pushed live
+    assert segments(spool_directory) == []
+    stream.publish_event("1", "stopped")
+    assert connection.messages[-1]["event"] == "stopped" and stream.status()["spool_segments"] == 0
+
+
+def test_unacknowledged_results_are_replayed_to_the_next_subscriber(spool_directory):
+    stream = ResultStream(spool_directory=spool_directory, window=10)
+    first = _RecordingConnection()
+    stream.subscribe(first)
+    for value in range(4):
+        stream.publish("1", {"value": value})
+    stream.ack(first, first.seqs()[0])
+    stream.unsubscribe(first)
+    stream.publish("1", {"value": 4})
+    # An acknowledgment from a connection that is no longer subscribed changes nothing
+    stream.ack(first, first.seqs()[-1])
+
+    second = _RecordingConnection()
+    stream.subscribe(second)
+    assert second.values() == [1, 2, 3, 4]
+    assert second.seqs() == first.seqs()[1:] + [second.seqs()[-1]]
+
+
+def test_failed_push_keeps_the_result(spool_directory):
+    stream = ResultStream(spool_directory=spool_directory)
+    stream.subscribe(_RecordingConnection(fail=True))
+    stream.publish("1", {"value": 0})
+    assert not stream.status()["subscribed"]
+
+    connection = _RecordingConnection()
+    stream.subscribe(connection)
+    assert connection.values() == [0]
+
+
+def test_spool_survives_a_restart(spool_directory):
+    stream = ResultStream(spool_directory=spool_directory)
+    for value in range(3):
+        stream.publish("1", {"value": value})
+    # The process exits: its spool segment is flushed by the interpreter
+    stream._write_file.close()
+
+    restarted = ResultStream(spool_directory=spool_directory)
+    restarted.publish("1", {"value": 3})
+    connection = _RecordingConnection()
+    restarted.subscribe(connection)
+    assert connection.values() == [0, 1, 2, 3]
+    # Sequence numbers keep growing across the restart
+    assert connection.seqs() == sorted(connection.seqs())
+
+
+def test_full_spool_drops_the_oldest_segment(spool_directory, capsys):
+    stream = ResultStream(spool_directory=spool_directory, max_segment_bytes=200, max_spool_bytes=600)
+    for value in range(40):
+        stream.publish("1", {"value": value})
+    assert stream.status()["dropped"] > 0
+    assert stream.status()["spool_bytes"] <= 600
+    assert "WARNING: Result spool full" in capsys.readouterr().out
+
+    connection = _RecordingConnection()
+    stream.subscribe(connection)
+    # Only the newest results are left, still in order and ending with the last one
+    assert connection.values() == list(range(40 - len(connection.values()), 40))
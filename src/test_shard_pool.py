@@ -0,0 +1,70 @@
+import threading
+import time
+import monitoring_service_task
+from shard_pool import ShardPool, shard_for
+from task_scheduler import ScheduledTask, FIXED_RATE
+
+"""
+Behaviour of the worker process pool: stable shard placement of service ids, and tasks run on
+worker processes with their results, counters and stop events coming back to the parent.
+"""
+
+
+def echo(value):
+    # Task function of the worker tests, importable by the spawned workers
+    return {"value": value}
+
+
+def wait_for(condition, timeout=20.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.02)
+    return condition()
+
+
+def test_shard_for_is_stable_and_spreads_service_ids():
+    # CRC32, not hash(): the same in every process whatever PYTHONHASHSEED is
+    assert [shard_for(service_id, 4) for service_id in ("1", "2", "3", "42")] == [3, 1, 3, 0]
+    assert shard_for(42, 4) == shard_for("42", 4)
+
+    counts = [0] * 4
+    for service_id in range(4000):
+        counts[shard_for(service_id, 4)] += 1
+    assert all(800 < count < 1200 for count in counts)
+
+
+def test_tasks_run_on_workers_and_report_back(tmp_path, monkeypatch):
+    # Workers inherit the working directory and write their result files there
+    monkeypatch.chdir(tmp_path)
+    received = {}
+    lock = threading.Lock()
+
+    def listener(service_id, record):
+        with lock:
+            received.setdefault(service_id, []).append(record)
+
+    monkeypatch.setattr(monitoring_service_task, "result_listeners", [listener])
+    events = []
+    pool = ShardPool(2, on_event=lambda task, event: events.append((task.service_id, event)))
+    # Service ids 1 and 4 land on different shards
+    assert shard_for("1", 2) != shard_for("4", 2)
+    tasks = {service_id: ScheduledTask(service_id, echo, 0.05, service_id, schedule=FIXED_RATE)
+             for service_id in ("1", "4")}
+    try:
+        for task in tasks.values():
+            pool.add(task)
+        assert wait_for(lambda: all(len(received.get(service_id, [])) >= 3 for service_id in tasks))
+        assert received["1"][0]["result"] == {"value": "1"}
+        assert [record["iteration"] for record in received["4"][:3]] == [1, 2, 3]
+
+        pool.stop(tasks["1"])
+        assert wait_for(lambda: ("1", "stopped") in events)
+        # The parent's copy of the task carries the worker's counters
+        assert tasks["1"].iteration - 1 >= len(received["1"]) >= 3
+        stopped_count = len(received["1"])
+        time.sleep(0.2)
+        assert len(received["1"]) == stopped_count
+        assert len(received["4"]) > 3
+    finally:
+        pool.shutdown()
+    assert (tmp_path / "4.jsonl").exists()
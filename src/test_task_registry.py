@@ -0,0 +1,52 @@
+import json
+from task_registry import TaskRegistry
+
+"""
+Behaviour of the management-side task registry: secondary indexes kept in step with every
+change, and the registry restored from its snapshot and journal.
+"""
+
+
+def details(task, status="Running", node="node-a"):
+    return {"task": task, "frequency": 5, "configuration": ["example.com"], "status": status, "node": node}
+
+
+def test_indexes_follow_puts_and_updates(tmp_path):
+    registry = TaskRegistry(str(tmp_path / "config_file.json"))
+    registry.put_many([("1", details("ping")), ("2", details("tcp")), ("3", details("ping", node="node-b"))])
+
+    assert registry.by_task("ping") == {"1", "3"}
+    assert registry.by_node("node-a") == {"1", "2"}
+    assert registry.counts("status") == {"Running": 3}
+
+    assert registry.update("1", status="Paused")
+    assert not registry.update("missing", status="Paused")
+    assert registry.by_status("Paused") == {"1"}
+    assert registry.by_status("Running") == {"2", "3"}
+    # Replacing a task moves it between indexes
+    registry.put("3", details("udp", node="node-a"))
+    assert registry.by_task("ping") == {"1"}
+    assert registry.by_node("node-b") == set()
+    assert registry.counts("node") == {"node-a": 3}
+
+
+def test_registry_is_restored_from_snapshot_and_journal(tmp_path):
+    path = str(tmp_path / "config_file.json")
+    registry = TaskRegistry(path, compact_min=2)
+    registry.put_many([("1", details("ping")), ("2", details("tcp")), ("3", details("dns"))])
+    registry.update("2", status="Stopped")
+
+    restored = TaskRegistry(path)
+    assert restored.get("2")["status"] == "Stopped"
+    assert len(restored) == 3 and "3" in restored
+    assert restored.by_status("Stopped") == {"2"}
+
+
+def test_legacy_config_file_is_read(tmp_path):
+    path = str(tmp_path / "config_file.json")
+    with open(path, "w") as file:
+        json.dump([{"1": details("ping")}, {"2": details("tcp", status="Paused")}], file)
+
+    registry = TaskRegistry(path)
+    assert registry.by_task("tcp") == {"2"}
+    assert registry.by_status("Paused") == {"2"}
@@ -0,0 +1,115 @@
+import threading
+import time
+import pytest
+import monitoring_service_task
+from task_scheduler import ScheduledTask, TaskScheduler
+
+"""
+Behaviour of the task scheduler: iterations keep running at their frequency and a task whose
+iteration fails, however early, never takes the dispatcher (and so every other task) down with it.
+"""
+
+
+class _RecordingWriter:
+    """Stands in for the shared ResultWriter so the tests write no <service_id>.jsonl files."""
+
+    def __init__(self):
+        self.records = []
+        self._lock = threading.Lock()
+
+    def write(self, service_id, record):
+        with self._lock:
+            self.records.append((service_id, record))
+
+    def iterations(self, service_id):
+        with self._lock:
+            return [record["iteration"] for key, record in self.records if key == service_id]
+
+
+@pytest.fixture
+def writer(monkeypatch):
+    writer = _RecordingWriter()
+    monkeypatch.setattr(monitoring_service_task, "result_writer", writer)
+    monkeypatch.setattr(monitoring_service_task, "result_listeners", [])
+    return writer
+
+
+@pytest.fixture
+def scheduler():
+    scheduler = TaskScheduler(max_workers=4)
+    yield scheduler
+    scheduler._executor.shutdown(wait=False)
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def sync_check(domain):
+    return {domain: {"status": True}}
+
+
+async def async_check(domain):
+    return {domain: {"status": True}}
+
+
+def failing_check(domain):
+    raise RuntimeError("probe failed")
+
+
+def test_task_iterates_at_its_frequency(writer, scheduler):
+    task = ScheduledTask("sync", sync_check, 0.02, "example.com")
+    scheduler.add(task)
+
+    assert wait_for(lambda: len(writer.iterations("sync")) >= 3)
+    assert writer.iterations("sync")[:3] == [1, 2, 3]
+    assert writer.records[0][1]["result"] == {"example.com": {"status": True}}
+
+
+def test_async_task_arguments_not_fitting_do_not_stop_the_dispatcher(writer, scheduler):
+    # async_check takes one argument: building its coroutine raises TypeError in the dispatcher
+    bad = ScheduledTask("bad", async_check, 0.02, "example.com", "extra", "arguments")
+    good_sync = ScheduledTask("good-sync", sync_check, 0.02, "example.com")
+    good_async = ScheduledTask("good-async", async_check, 0.02, "example.com")
+    scheduler.add(bad)
+    scheduler.add(good_sync, delay=0.01)
+    scheduler.add(good_async, delay=0.01)
+
+    assert wait_for(lambda: len(writer.iterations("good-sync")) >= 3 and len(writer.iterations("good-async")) >= 3)
+    assert scheduler._dispatcher.is_alive()
+    assert writer.iterations("bad") == []
+    # The failing task is rescheduled, not dropped: it is still in the heap or being dispatched
+    assert bad.scheduled or bad.running
+    assert bad.iteration == 1
+
+
+def test_failing_iteration_is_retried_and_other_tasks_keep_running(writer, scheduler):
+    failing = ScheduledTask("failing", failing_check, 0.02, "example.com")
+    good = ScheduledTask("good", sync_check, 0.02, "example.com")
+    scheduler.add(failing)
+    scheduler.add(good)
+
+    assert wait_for(lambda: len(writer.iterations("good")) >= 3)
+    assert writer.iterations("failing") == []
+    assert failing.iteration == 1
+
+
+def test_stopped_task_reports_once_and_runs_no_more(writer, scheduler):
+    events = []
+    scheduler.on_event = lambda task, event: events.append((task.service_id, event))
+    task = ScheduledTask("stopped", sync_check, 0.02, "example.com")
+    scheduler.add(task)
+    assert wait_for(lambda: len(writer.iterations("stopped")) >= 1)
+
+    scheduler.stop(task)
+    assert task.idle_event.wait(5)
+    assert wait_for(lambda: ("stopped", "stopped") in events)
+    count = len(writer.iterations("stopped"))
+    time.sleep(0.1)
+    assert len(writer.iterations("stopped")) == count
+    assert events.count(("stopped", "stopped")) == 1
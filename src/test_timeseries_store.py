@@ -0,0 +1,74 @@
+import math
+import os
+from timeseries_store import STATUS_ERROR, STATUS_FAILED, STATUS_OK, TimeSeriesStore, extract_samples
+
+"""
+Behaviour of the sample extraction and of the columnar store.
+"""
+
+EPOCH = 1700000000.0
+
+
+def test_ping_samples_count_error_entries_as_errors():
+    result = {"example.com": {"replies": [{"query": ("93.184.216.34", 0), "time_ms": 12.5},
+                                          {"error": "Request timed out or no reply received"}],
+                              "timings": {"resolve_ms": 0.2, "reply_ms": 1012.7, "total_ms": 1013.0}}}
+    # The timings of the whole task are not a sample
+    assert extract_samples(result) == [(12.5, STATUS_OK), (None, STATUS_ERROR)]
+
+
+def test_check_samples_use_status_and_total_time():
+    assert extract_samples({"example.com": {"status": True, "code": 200, "timings": {"total_ms": 42.0}}}) == \
+        [(42.0, STATUS_OK)]
+    assert extract_samples({"example.com": {"port": 22, "status": False, "description": "closed"}}) == \
+        [(None, STATUS_FAILED)]
+
+
+def test_sweep_summary_adds_no_sample():
+    result = {"summary": {"endpoints": 2, "hosts": 1, "ports": 2, "duration_ms": 1.5,
+                          "open": 1, "closed": 0, "timeout": 0, "unreachable": 0, "error": 1},
+              "endpoints": {"10.0.0.1:22": {"status": True, "state": "open", "time_ms": 0.2},
+                            "10.0.0.1:23": {"status": False, "state": "error", "time_ms": None,
+                                            "description": "Network is unreachable"}}}
+    # One sample per endpoint; the summary's "error" count is not an errored check
+    assert extract_samples(result) == [(0.2, STATUS_OK), (None, STATUS_FAILED)]
+
+
+def test_results_without_checks_give_no_samples():
+    assert extract_samples({"example.com": {"table": " Hop Address ...", "timings": {"total_ms": 3.0}}}) == []
+    assert extract_samples({"summary": {"error": 0, "open": 0}}) == []
+
+
+def test_store_round_trip(tmp_path):
+    store = TimeSeriesStore(str(tmp_path))
+    store.append("1", EPOCH, [(1.5, STATUS_OK), (None, STATUS_ERROR)])
+    store.append("1", EPOCH + 60, [(2.5, STATUS_FAILED)])
+    store.close()
+
+    timestamps, latencies, statuses = store.scan("1")
+    assert list(timestamps) == [EPOCH, EPOCH, EPOCH + 60]
+    assert latencies[0] == 1.5 and math.isnan(latencies[1]) and latencies[2] == 2.5
+    assert list(statuses) == [STATUS_OK, STATUS_ERROR, STATUS_FAILED]
+    assert [row["count"] for row in store.rollups("1", "1m")] == [2, 1]
+
+
+def test_torn_columns_are_evened_out_before_appending(tmp_path):
+    store = TimeSeriesStore(str(tmp_path))
+    store.append("1", EPOCH, [(1.0, STATUS_OK)])
+    store.append("1", EPOCH + 1, [(2.0, STATUS_OK)])
+    store.flush()
+    path = os.path.join(str(tmp_path), "1", store.days("1")[0])
+    # A crash between column appends: one more timestamp and a partial latency
+    with open(f"{path}.ts", "ab") as file:
+        file.write(b"\0" * 11)
+    with open(f"{path}.lat", "ab") as file:
+        file.write(b"\0" * 2)
+
+    reopened = TimeSeriesStore(str(tmp_path))
+    reopened.append("1", EPOCH + 2, [(3.0, STATUS_FAILED)])
+    reopened.flush()
+
+    timestamps, latencies, statuses = reopened.scan("1")
+    assert list(timestamps) == [EPOCH, EPOCH + 1, EPOCH + 2]
+    assert list(latencies) == [1.0, 2.0, 3.0]
+    assert list(statuses) == [STATUS_OK, STATUS_OK, STATUS_FAILED]
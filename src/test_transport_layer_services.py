@@ -0,0 +1,133 @@
+import socket
+import threading
+import time
+import pytest
+import transport_layer_services
+from timeseries_store import STATUS_FAILED, STATUS_OK, extract_samples
+from transport_layer_services import MAX_SWEEP_ENDPOINTS, parse_host_spec, parse_port_spec, tcp_sweep, udp_sweep
+
+"""
+Behaviour of the sweep specifications and of tcp_sweep and udp_sweep against loopback sockets.
+"""
+
+
+def test_host_spec_keeps_order_and_drops_duplicates():
+    assert parse_host_spec("b.example, a.example,b.example,,") == ["b.example", "a.example"]
+    assert parse_host_spec(["10.0.0.2", "10.0.0.1", "10.0.0.2"]) == ["10.0.0.2", "10.0.0.1"]
+
+
+def test_host_spec_cidr_excludes_network_and_broadcast():
+    assert parse_host_spec("10.0.0.0/30") == ["10.0.0.1", "10.0.0.2"]
+    # /31 and /32 have no network or broadcast address to exclude
+    assert parse_host_spec("10.0.0.4/31") == ["10.0.0.4", "10.0.0.5"]
+    assert parse_host_spec("10.0.0.9/32") == ["10.0.0.9"]
+
+
+def test_host_spec_ranges():
+    assert parse_host_spec("10.0.0.254-10.0.1.1") == ["10.0.0.254", "10.0.0.255", "10.0.1.0", "10.0.1.1"]
+    # Short form gives the last octet of the end of the range
+    assert parse_host_spec("10.0.0.3-5") == ["10.0.0.3", "10.0.0.4", "10.0.0.5"]
+    # Overlapping ranges and CIDR blocks are deduplicated
+    assert parse_host_spec("10.0.0.1-3,10.0.0.0/30,10.0.0.3") == ["10.0.0.1", "10.0.0.2", "10.0.0.3"]
+    with pytest.raises(ValueError):
+        parse_host_spec("10.0.0.5-3")
+
+
+def test_host_spec_cap_is_checked_before_expansion(monkeypatch):
+    expanded = []
+    original = transport_layer_services.ipaddress.IPv4Address
+
+    def counting_address(value):
+        expanded.append(value)
+        return original(value)
+
+    monkeypatch.setattr(transport_layer_services.ipaddress, "IPv4Address", counting_address)
+    started = time.perf_counter()
+    for spec in ("10.0.0.0/8", "0.0.0.0/0", "1.0.0.0-2.0.0.0"):
+        with pytest.raises(ValueError, match="more than"):
+            parse_host_spec(spec)
+    with pytest.raises(ValueError, match="more than"):
+        parse_host_spec("::/64")
+    # Rejected from the size alone: no range was walked address by address
+    assert len(expanded) <= 6
+    assert time.perf_counter() - started < 1
+
+
+def test_host_spec_cap_counts_hosts_already_expanded():
+    # Two blocks within the cap each, together over it
+    assert len(parse_host_spec("10.0.0.0/16")) == MAX_SWEEP_ENDPOINTS - 2
+    with pytest.raises(ValueError):
+        parse_host_spec("10.0.0.0/16,10.1.0.0/24")
+    # A block repeating hosts already listed still fits
+    assert len(parse_host_spec("10.0.0.0/16,10.0.0.1")) == MAX_SWEEP_ENDPOINTS - 2
+
+
+def test_port_spec():
+    assert parse_port_spec("443,80,8000-8002,80") == [443, 80, 8000, 8001, 8002]
+    assert parse_port_spec(22) == [22]
+    assert parse_port_spec(["53", "53-54"]) == [53, 54]
+    # Repeated full ranges collapse to the 65535 ports
+    assert len(parse_port_spec("1-65535,1-10")) == 65535
+    for spec in ("0", "65536", "80-22", "http"):
+        with pytest.raises(ValueError):
+            parse_port_spec(spec)
+
+
+def test_sweep_rejects_too_many_endpoints():
+    with pytest.raises(ValueError, match="exceeds"):
+        tcp_sweep("10.0.0.0/24", "1-1000")
+
+
+def test_tcp_sweep_open_and_closed_ports():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as listener, \
+            socket.socket(socket.AF_INET, socket.SOCK_STREAM) as unused:
+        listener.bind(("127.0.0.1", 0))
+        listener.listen()
+        # Bound but not listening: connects are refused
+        unused.bind(("127.0.0.1", 0))
+        open_port, closed_port = listener.getsockname()[1], unused.getsockname()[1]
+
+        result = tcp_sweep("127.0.0.1", [open_port, closed_port], timeout=2)
+
+    endpoints = result["endpoints"]
+    assert endpoints[f"127.0.0.1:{open_port}"]["state"] == "open"
+    assert endpoints[f"127.0.0.1:{open_port}"]["status"] is True
+    assert endpoints[f"127.0.0.1:{closed_port}"]["state"] == "closed"
+    assert endpoints[f"127.0.0.1:{closed_port}"]["status"] is False
+    summary = result["summary"]
+    assert (summary["endpoints"], summary["open"], summary["closed"], summary["error"]) == (2, 1, 1, 0)
+
+
+def test_udp_sweep_states_and_status():
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as responder, \
+            socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as silent, \
+            socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as unused:
+        for sock in (responder, silent, unused):
+            sock.bind(("127.0.0.1", 0))
+        responder_port, silent_port = responder.getsockname()[1], silent.getsockname()[1]
+        # Closed once the socket is gone: the kernel answers with ICMP port unreachable
+        closed_port = unused.getsockname()[1]
+        unused.close()
+
+        def answer():
+            data, address = responder.recvfrom(1024)
+            responder.sendto(b"pong", address)
+
+        thread = threading.Thread(target=answer, daemon=True)
+        thread.start()
+        result = udp_sweep("127.0.0.1,no-such-host.invalid", [responder_port, silent_port, closed_port],
+                           timeout=0.5, payload="ping")
+        thread.join(1)
+
+    endpoints = result["endpoints"]
+    assert endpoints[f"127.0.0.1:{responder_port}"]["state"] == "open"
+    assert endpoints[f"127.0.0.1:{silent_port}"]["state"] == "timeout"
+    assert endpoints[f"127.0.0.1:{closed_port}"]["state"] == "closed"
+    assert endpoints[f"no-such-host.invalid:{responder_port}"]["state"] == "error"
+    # Only endpoints that replied or may be open count as up
+    assert {key: endpoint["status"] for key, endpoint in endpoints.items()} == {
+        f"127.0.0.1:{responder_port}": True, f"127.0.0.1:{silent_port}": True, f"127.0.0.1:{closed_port}": False,
+        f"no-such-host.invalid:{responder_port}": False, f"no-such-host.invalid:{silent_port}": False,
+        f"no-such-host.invalid:{closed_port}": False}
+    assert sorted(status for _, status in extract_samples(result)) == \
+        [STATUS_OK, STATUS_OK, STATUS_FAILED, STATUS_FAILED, STATUS_FAILED, STATUS_FAILED]
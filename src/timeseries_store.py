@@ -0,0 +1,378 @@
+import atexit
+import bisect
+import mmap
+import os
+import struct
+import threading
+import time
+from array import array
+
+"""
+Columnar time-series store for latency and status history.
+
+Every result is reduced to samples of (epoch time, latency in ms, status) and appended to
+per-service, per-day (UTC) segments with one fixed-width column per file:
+
+    <root>/<service_id>/<YYYYMMDD>.ts    float64 epoch seconds, ascending
+    <root>/<service_id>/<YYYYMMDD>.lat   float32 latency in ms, NaN when the check has none
+    <root>/<service_id>/<YYYYMMDD>.st    uint8 status (STATUS_OK, STATUS_FAILED, STATUS_ERROR)
+
+A sample costs 13 bytes instead of the hundreds its JSON record takes. Columns are in native
+byte order (little endian on x86 and ARM) and are read through mmap without parsing: Segment
+exposes them as memoryviews (numpy.frombuffer(segment.latencies, dtype="<f4") wraps one
+without a copy), and time ranges are found by bisecting the timestamp column.
+
+1-minute and 1-hour rollups (<YYYYMMDD>.1m and <YYYYMMDD>.1h) hold one ROLLUP row per bucket,
+so weeks of 1-second samples can be summarised from a few hundred kilobytes.
+"""
+
+STATUS_OK = 0
+STATUS_FAILED = 1  # check ran and reported failure (closed port, HTTP error, timeout)
+STATUS_ERROR = 2   # check could not run (no reply, exception)
+
+COLUMNS = (("ts", "d"), ("lat", "f"), ("st", "B"))
+# bucket start, samples, ok samples, error samples, samples with a latency, latency sum, min and max
+ROLLUP = struct.Struct("=dIIIIdff")
+ROLLUP_FIELDS = ("start", "count", "ok", "errors", "latency_count", "latency_sum", "latency_min", "latency_max")
+RESOLUTIONS = {"1m": 60, "1h": 3600}
+
+
+def extract_samples(result):
+    """
+    Reduce a task result to (latency_ms or None, status) samples.
+
+    Understands the shapes the task functions return: ping replies of {"query", "time_ms"} or
+    {"error": message} and check dicts with a "status" flag (and a latency if one was measured).
+    Other dicts are searched for checks, so a sweep gives one sample per endpoint while its
+    summary of counts (including an "error" count) gives none.
+
+    :param result: Value returned by a task function
+    :return: List of samples, empty for results with nothing to sample (e.g. traceroute)
+    """
+    samples = []
+    if isinstance(result, dict):
+        if "status" in result or "time_ms" in result or isinstance(result.get("error"), str):
+            samples.append(_sample(result))
+        else:
+            for value in result.values():
+                samples.extend(extract_samples(value))
+    elif isinstance(result, list):
+        for value in result:
+            if isinstance(value, dict):
+                samples.extend(extract_samples(value))
+    return samples
+
+
+def _sample(check):
+    latency = check.get("time_ms")
+    if latency is None and isinstance(check.get("timings"), dict):
+        latency = check["timings"].get("total_ms")
+    if isinstance(check.get("error"), str):
+        return latency, STATUS_ERROR
+    if check.get("status", True) is False:
+        return latency, STATUS_FAILED
+    return latency, STATUS_OK
+
+
+def day_of(epoch):
+    return time.strftime("%Y%m%d", time.gmtime(epoch))
+
+
+class Segment:
+    def __init__(self, path):
+        """
+        Read-only, memory-mapped view of one day of samples.
+
+        :param path: Segment path without the column extension
+        """
+        self.path = path
+        self._maps = []
+        self.timestamps = self._map("ts", "d")
+        self.latencies = self._map("lat", "f")
+        self.statuses = self._map("st", "B")
+        # Columns may differ by a partly written last row, only use complete rows
+        self.length = min(len(self.timestamps), len(self.latencies), len(self.statuses))
+
+    def _map(self, extension, typecode):
+        filename = f"{self.path}.{extension}"
+        size = os.path.getsize(filename) if os.path.exists(filename) else 0
+        size -= size % array(typecode).itemsize
+        if size == 0:
+            return memoryview(array(typecode))
+        with open(filename, "rb") as file:
+            mapped = mmap.mmap(file.fileno(), size, access=mmap.ACCESS_READ)
+        self._maps.append(mapped)
+        return memoryview(mapped).cast(typecode)
+
+    def range(self, start=None, end=None):
+        """
+        Row indexes of the samples with start <= timestamp < end.
+
+        :return: (first, stop) for slicing the column memoryviews
+        """
+        timestamps = self.timestamps[:self.length]
+        first = 0 if start is None else bisect.bisect_left(timestamps, start)
+        stop = self.length if end is None else bisect.bisect_left(timestamps, end)
+        return first, stop
+
+    def close(self):
+        for view in (self.timestamps, self.latencies, self.statuses):
+            view.release()
+        for mapped in self._maps:
+            mapped.close()
+        self._maps = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class _Series:
+    """Write side of one service: rows not flushed yet and the open rollup buckets."""
+
+    def __init__(self):
+        self.pending = {name: array(typecode) for name, typecode in COLUMNS}
+        self.pending_day = None
+        # resolution -> [start, count, ok, errors, latency_count, latency_sum, latency_min, latency_max]
+        self.buckets = {}
+
+
+class TimeSeriesStore:
+    def __init__(self, root="timeseries", flush_interval=1.0):
+        """
+        Columnar per-service store of latency and status samples with rollups.
+
+        :param root: Directory holding one directory per service id
+        :param flush_interval: Longest time in seconds samples wait in memory before being appended
+        """
+        self.root = root
+        self.flush_interval = flush_interval
+        self._series = {}
+        # Segment and rollup files checked for a torn last row since the store was opened
+        self._repaired = set()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def record(self, service_id, record):
+        """
+        Sample a timestamped result record. Used as a result listener.
+
+        :param service_id: Service id the record belongs to
+        :param record: Timestamped result record
+        """
+        samples = extract_samples(record["result"])
+        if samples:
+            self.append(service_id, time.time(), samples)
+
+    def append(self, service_id, epoch, samples):
+        """
+        Append samples taken at the same time.
+
+        :param service_id: Service id of the task
+        :param epoch: Epoch seconds of the samples
+        :param samples: List of (latency_ms or None, status)
+        """
+        if self._thread is None:
+            self._start()
+        day = day_of(epoch)
+        with self._lock:
+            series = self._series.setdefault(service_id, _Series())
+            if series.pending_day is not None and series.pending_day != day:
+                self._flush_series(service_id, series)
+            series.pending_day = day
+            for latency, status in samples:
+                series.pending["ts"].append(epoch)
+                series.pending["lat"].append(float("nan") if latency is None else latency)
+                series.pending["st"].append(status)
+                for resolution, seconds in RESOLUTIONS.items():
+                    self._roll_up(service_id, series, resolution, epoch - epoch % seconds, latency, status)
+
+    def flush(self, service_id=None):
+        """Append samples held in memory to their segments (of one service, or all)."""
+        with self._lock:
+            for key, series in list(self._series.items()):
+                if service_id is None or key == service_id:
+                    self._flush_series(key, series)
+
+    def close(self):
+        """Flush samples and write the open rollup buckets."""
+        with self._lock:
+            for service_id, series in self._series.items():
+                self._flush_series(service_id, series)
+                for resolution, bucket in series.buckets.items():
+                    self._write_bucket(service_id, resolution, bucket)
+                series.buckets.clear()
+
+    def days(self, service_id):
+        """Days (YYYYMMDD) with samples for the service, oldest first."""
+        directory = os.path.join(self.root, str(service_id))
+        if not os.path.isdir(directory):
+            return []
+        return sorted(name[:-3] for name in os.listdir(directory) if name.endswith(".ts"))
+
+    def segment(self, service_id, day):
+        """
+        Memory-mapped columns of one day of samples; close it (or use it as a context manager) when done.
+
+        :param service_id: Service id of the task
+        :param day: Day as YYYYMMDD
+        """
+        self.flush(service_id)
+        return Segment(os.path.join(self.root, str(service_id), day))
+
+    def scan(self, service_id, start=None, end=None):
+        """
+        Samples with start <= timestamp < end, oldest first.
+
+        :param service_id: Service id of the task
+        :param start: Epoch seconds, None for the first sample
+        :param end: Epoch seconds, None for the last sample
+        :return: (timestamps, latencies, statuses) as arrays of 'd', 'f' and 'B'
+        """
+        columns = tuple(array(typecode) for _, typecode in COLUMNS)
+        for day in self._days_in_range(service_id, start, end):
+            with self.segment(service_id, day) as segment:
+                first, stop = segment.range(start, end)
+                for column, view in zip(columns, (segment.timestamps, segment.latencies, segment.statuses)):
+                    column.frombytes(view[first:stop].tobytes())
+        return columns
+
+    def rollups(self, service_id, resolution="1m", start=None, end=None):
+        """
+        Rollup rows with start <= bucket start < end, oldest first, open buckets included.
+
+        :param service_id: Service id of the task
+        :param resolution: "1m" or "1h"
+        :return: List of dicts with the ROLLUP_FIELDS and the mean latency
+        """
+        seconds = RESOLUTIONS[resolution]
+        aligned_start = None if start is None else start - start % seconds
+        buckets = {}
+        for day in self._days_in_range(service_id, aligned_start, end):
+            filename = os.path.join(self.root, str(service_id), f"{day}.{resolution}")
+            if not os.path.exists(filename):
+                continue
+            with open(filename, "rb") as file:
+                data = file.read()
+            for row in ROLLUP.iter_unpack(data[:len(data) - len(data) % ROLLUP.size]):
+                self._merge_row(buckets, list(row))
+        with self._lock:
+            series = self._series.get(service_id)
+            if series is not None and resolution in series.buckets:
+                self._merge_row(buckets, list(series.buckets[resolution]))
+
+        rows = []
+        for bucket_start in sorted(buckets):
+            if (start is not None and bucket_start + seconds <= start) or (end is not None and bucket_start >= end):
+                continue
+            row = dict(zip(ROLLUP_FIELDS, buckets[bucket_start]))
+            if row["latency_count"]:
+                row["latency_mean"] = row["latency_sum"] / row["latency_count"]
+            else:
+                row["latency_mean"] = row["latency_min"] = row["latency_max"] = None
+            rows.append(row)
+        return rows
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="timeseries-flush", daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"WARNING: Failed to write time series: {e}")
+
+    def _days_in_range(self, service_id, start, end):
+        first = None if start is None else day_of(start)
+        last = None if end is None else day_of(end)
+        return [day for day in self.days(service_id)
+                if (first is None or day >= first) and (last is None or day <= last)]
+
+    def _flush_series(self, service_id, series):
+        if not series.pending["ts"]:
+            return
+        directory = os.path.join(self.root, str(service_id))
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, series.pending_day)
+        if path not in self._repaired:
+            self._repair_segment(path)
+            self._repaired.add(path)
+        try:
+            for name, _ in COLUMNS:
+                with open(f"{path}.{name}", "ab") as file:
+                    series.pending[name].tofile(file)
+        except OSError:
+            # Some columns may hold the rows and others not: even them out before the retry
+            self._repaired.discard(path)
+            raise
+        for name, typecode in COLUMNS:
+            series.pending[name] = array(typecode)
+
+    @staticmethod
+    def _repair_segment(path):
+        """
+        Truncate every column of a segment to the rows complete in all of them.
+
+        A crash while appending can leave a column with a partial row or more rows than the others;
+        appending after that would pair each new timestamp with another sample's latency and status.
+        """
+        sizes = {name: os.path.getsize(f"{path}.{name}") if os.path.exists(f"{path}.{name}") else 0
+                 for name, _ in COLUMNS}
+        rows = min(sizes[name] // array(typecode).itemsize for name, typecode in COLUMNS)
+        for name, typecode in COLUMNS:
+            if sizes[name] > rows * array(typecode).itemsize:
+                print(f"WARNING: Truncating {path}.{name} to its {rows} complete rows")
+                os.truncate(f"{path}.{name}", rows * array(typecode).itemsize)
+
+    def _roll_up(self, service_id, series, resolution, bucket_start, latency, status):
+        bucket = series.buckets.get(resolution)
+        if bucket is not None and bucket[0] != bucket_start:
+            # The sample starts a new bucket: the previous one is complete
+            self._write_bucket(service_id, resolution, bucket)
+            bucket = None
+        if bucket is None:
+            bucket = series.buckets[resolution] = [bucket_start, 0, 0, 0, 0, 0.0, float("inf"), float("-inf")]
+        bucket[1] += 1
+        if status == STATUS_OK:
+            bucket[2] += 1
+        elif status == STATUS_ERROR:
+            bucket[3] += 1
+        if latency is not None:
+            bucket[4] += 1
+            bucket[5] += latency
+            bucket[6] = min(bucket[6], latency)
+            bucket[7] = max(bucket[7], latency)
+
+    def _write_bucket(self, service_id, resolution, bucket):
+        directory = os.path.join(self.root, str(service_id))
+        os.makedirs(directory, exist_ok=True)
+        filename = os.path.join(directory, f"{day_of(bucket[0])}.{resolution}")
+        if filename not in self._repaired and os.path.exists(filename):
+            # Rows after a torn one would be read out of alignment
+            size = os.path.getsize(filename)
+            if size % ROLLUP.size:
+                print(f"WARNING: Truncating {filename} to its complete rows")
+                os.truncate(filename, size - size % ROLLUP.size)
+        self._repaired.add(filename)
+        with open(filename, "ab") as file:
+            file.write(ROLLUP.pack(*bucket))
+
+    @staticmethod
+    def _merge_row(buckets, row):
+        # A bucket written at shutdown and continued after a restart has two rows
+        merged = buckets.get(row[0])
+        if merged is None:
+            buckets[row[0]] = row
+            return
+        for index in (1, 2, 3, 4, 5):
+            merged[index] += row[index]
+        merged[6] = min(merged[6], row[6])
+        merged[7] = max(merged[7], row[7])
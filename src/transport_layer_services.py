@@ -1,5 +1,15 @@
+import errno
+import ipaddress
+import os
+import selectors
 import socket
+import struct
+import sys
 import time
+from collections import deque
+from probe_timing import timer_phase
+from probe_cancel import CANCEL_POLL_INTERVAL, check_cancelled, wait_socket
+from resolver_cache import resolver_cache
 
 
 ################# UDP FUNCTIONS #######################################################
@@ -71,7 +81,7 @@ def udp_server():
         print("Server socket closed")
 
 
-def check_udp_port(ip_address: str, port: int, timeout: int = 3) -> (bool, str):
+def check_udp_port(ip_address: str, port: int, timeout: int = 3, timer=None) -> (bool, str):
     """
     Checks the status of a specific UDP port on a given IP address.
 
@@ -79,6 +89,7 @@ def check_udp_port(ip_address: str, port: int, timeout: int = 3) -> (bool, str):
     ip_address (str): The IP address of the target server.
     port (int): The UDP port number to check.
     timeout (int): The timeout duration in seconds for the socket operation. Default is 3 seconds.
+    timer (PhaseTimer): Records the resolve, send and reply phases. Optional.
 
     Returns:
     tuple: A tuple containing a boolean and a string.
@@ -97,14 +108,23 @@ def check_udp_port(ip_address: str, port: int, timeout: int = 3) -> (bool, str):
             # Set a timeout for the socket to avoid waiting indefinitely.
             s.settimeout(timeout)
 
+            # Resolved through the shared cache, not by a lookup per probe
+            with timer_phase(timer, "resolve"):
+                address = (resolver_cache.resolve(ip_address), port)
+
             # Send a dummy packet to the specified IP address and port.
             # As UDP is connectionless, this does not establish a connection but merely sends the packet.
-            s.sendto(b'', (ip_address, port))
+            with timer_phase(timer, "send"):
+                s.sendto(b'', address)
 
             try:
                 # Try to receive data from the socket.
                 # If an ICMP 'Destination Unreachable' message is received, the port is considered closed.
-                s.recvfrom(1024)
+                with timer_phase(timer, "reply"):
+                    # Wait in short slices so a stopped task does not sit out the whole timeout
+                    if not wait_socket(s, timeout=timeout):
+                        raise socket.timeout()
+                    s.recvfrom(1024)
                 return False, f"Port {port} on {ip_address} is closed."
 
             except socket.timeout:
@@ -201,13 +221,14 @@ def tcp_server():
         print("Server socket closed")
 
 
-def check_tcp_port(ip_address: str, port: int) -> (bool, str):
+def check_tcp_port(ip_address: str, port: int, timer=None) -> (bool, str):
     """
     Checks the status of a specific TCP port on a given IP address.
 
     Args:
     ip_address (str): The IP address of the target server.
     port (int): The TCP port number to check.
+    timer (PhaseTimer): Records the resolve and connect phases. Optional.
 
     Returns:
     tuple: A tuple containing a boolean and a string.
@@ -225,9 +246,22 @@ def check_tcp_port(ip_address: str, port: int) -> (bool, str):
             # Set a timeout for the socket to avoid waiting indefinitely. Here, 3 seconds is used as a reasonable timeout duration.
             s.settimeout(3)
 
+            # Resolved through the shared cache, not by a lookup per probe
+            with timer_phase(timer, "resolve"):
+                address = (resolver_cache.resolve(ip_address), port)
+
             # Attempt to connect to the specified IP address and port.
             # If the connection is successful, the port is open.
-            s.connect((ip_address, port))
+            with timer_phase(timer, "connect"):
+                # Non-blocking connect, waited for in short slices so a stopped task does not sit out the timeout
+                s.setblocking(False)
+                error = s.connect_ex(address)
+                if error in (errno.EINPROGRESS, errno.EWOULDBLOCK):
+                    if not wait_socket(s, write=True, timeout=3):
+                        raise socket.timeout()
+                    error = s.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                if error:
+                    raise OSError(error, os.strerror(error))
             return True, f"Port {port} on {ip_address} is open."
 
     except socket.timeout:
@@ -243,6 +277,418 @@ def check_tcp_port(ip_address: str, port: int) -> (bool, str):
         return False, f"Failed to check port {port} on {ip_address} due to an error: {e}"
 
 
+# Largest number of endpoints (hosts x ports) one sweep may expand to, guards against a mistyped CIDR
+MAX_SWEEP_ENDPOINTS = 65536
+# States of a swept endpoint, counted in the sweep summary
+SWEEP_STATES = ("open", "closed", "timeout", "unreachable", "error")
+
+
+def parse_host_spec(hosts) -> list:
+    """
+    Expand a host specification into a list of hosts.
+
+    Args:
+    hosts (str | list): Comma separated (or listed) hostnames, IP addresses, CIDR blocks ("10.0.0.0/28",
+                        network and broadcast addresses excluded) and address ranges ("10.0.0.1-10.0.0.20"
+                        or "10.0.0.1-20").
+
+    Returns:
+    list: Hosts in the given order, without duplicates.
+    """
+    items = hosts.split(",") if isinstance(hosts, str) else hosts
+    expanded = {}  # used as an ordered set
+    for item in (str(item).strip() for item in items):
+        if not item:
+            continue
+        if "/" in item:
+            network = ipaddress.ip_network(item, strict=False)
+            # Sized before expanding, a /8 would otherwise build millions of strings before being rejected
+            _check_sweep_size(len(expanded) + network.num_addresses - (2 if network.num_addresses > 2 else 0))
+            addresses = network.hosts() if network.num_addresses > 2 else network
+            expanded.update(dict.fromkeys(str(address) for address in addresses))
+        elif "-" in item and item.replace(".", "").replace("-", "").isdigit():
+            first, last = item.split("-", 1)
+            first = ipaddress.IPv4Address(first)
+            # "10.0.0.1-20" gives the last octet of the end of the range
+            last = ipaddress.IPv4Address(last) if "." in last else ipaddress.IPv4Address(
+                int(first) - int(first) % 256 + int(last))
+            if last < first:
+                raise ValueError(f"Empty address range: {item}")
+            _check_sweep_size(len(expanded) + int(last) - int(first) + 1)
+            addresses = (ipaddress.IPv4Address(value) for value in range(int(first), int(last) + 1))
+            expanded.update(dict.fromkeys(str(address) for address in addresses))
+        else:
+            expanded[item] = None
+            _check_sweep_size(len(expanded))
+    return list(expanded)
+
+
+def parse_port_spec(ports) -> list:
+    """
+    Expand a port specification into a list of ports.
+
+    Args:
+    ports (str | int | list): Comma separated (or listed) ports and port ranges ("22,80,8000-8010").
+
+    Returns:
+    list: Ports in the given order, without duplicates.
+    """
+    items = str(ports).split(",") if isinstance(ports, (str, int)) else ports
+    expanded = {}  # used as an ordered set
+    for item in (str(item).strip() for item in items):
+        if not item:
+            continue
+        first, _, last = item.partition("-")
+        first, last = int(first), int(last or first)
+        if not 0 < first <= last <= 65535:
+            raise ValueError(f"Invalid port or port range: {item}")
+        # Collected as a set: at most 65535 ports whatever the specification repeats
+        expanded.update(dict.fromkeys(range(first, last + 1)))
+    return list(expanded)
+
+
+def _check_sweep_size(size: int):
+    if size > MAX_SWEEP_ENDPOINTS:
+        raise ValueError(f"Host specification expands to more than {MAX_SWEEP_ENDPOINTS} hosts")
+
+
+def tcp_sweep(hosts, ports, timeout: float = 3, concurrency: int = 256) -> dict:
+    """
+    Check many TCP endpoints at once with non-blocking connects multiplexed on one poller.
+
+    Every host is paired with every port. Up to concurrency connects are in flight at any time, so
+    sweeping N endpoints takes about N / concurrency timeouts instead of N, on a single thread and
+    without a thread per endpoint. Each socket is closed as soon as its connect completes.
+
+    Args:
+    hosts (str | list): Host specification, see parse_host_spec().
+    ports (str | int | list): Port specification, see parse_port_spec().
+    timeout (float): Seconds each connect may take before the endpoint counts as timed out. Default is 3 seconds.
+    concurrency (int): Largest number of connects in flight (and sockets open) at once. Default is 256.
+
+    Returns:
+    dict: {"summary": counts per state and the sweep duration,
+           "endpoints": {"host:port": {"status": True if open, "state": "open", "closed", "timeout",
+                                       "unreachable" or "error", "time_ms": connect time or None, ...}}}
+
+    Raises:
+    ValueError: A specification is invalid or expands to more than MAX_SWEEP_ENDPOINTS endpoints.
+    ProbeCancelled: The task was stopped or paused during the sweep.
+    """
+    host_list = parse_host_spec(hosts)
+    port_list = parse_port_spec(ports)
+    if len(host_list) * len(port_list) > MAX_SWEEP_ENDPOINTS:
+        raise ValueError(f"Sweep of {len(host_list)} hosts x {len(port_list)} ports exceeds "
+                         f"{MAX_SWEEP_ENDPOINTS} endpoints")
+    timeout = float(timeout)
+    concurrency = max(1, int(concurrency))
+
+    start = time.perf_counter()
+    endpoints = {}
+    pending = ((host, port) for host in host_list for port in port_list)
+    in_flight = {}  # socket -> (key, start time)
+    deadlines = deque()  # (deadline, socket) in start order, all connects share one timeout
+
+    def finish(sock, state, detail=None):
+        key, started = in_flight.pop(sock)
+        selector.unregister(sock)
+        sock.close()
+        elapsed = (time.perf_counter() - started) * 1000
+        endpoints[key] = {"status": state == "open", "state": state,
+                          "time_ms": None if state == "timeout" else round(elapsed, 3)}
+        if detail:
+            endpoints[key]["description"] = detail
+
+    def start_connects():
+        # Top up the in-flight connects to the concurrency cap
+        for host, port in pending:
+            key = f"{host}:{port}"
+            try:
+                # Resolved through the shared cache, hosts swept on several ports are looked up once
+                address = (resolver_cache.resolve(host), port)
+                sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            except OSError as e:
+                endpoints[key] = {"status": False, "state": "error", "time_ms": None, "description": str(e)}
+                continue
+            sock.setblocking(False)
+            started = time.perf_counter()
+            error = sock.connect_ex(address)
+            in_flight[sock] = (key, started)
+            selector.register(sock, selectors.EVENT_WRITE)
+            if error not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK):
+                finish(sock, _sweep_state(error), os.strerror(error))
+            else:
+                # Completed (0) or in progress: the socket turns writable either way
+                deadlines.append((started + timeout, sock))
+            if len(in_flight) >= concurrency:
+                return
+
+    with selectors.DefaultSelector() as selector:
+        try:
+            start_connects()
+            while in_flight:
+                check_cancelled()
+                # Wake for the earliest deadline, and at least every CANCEL_POLL_INTERVAL to notice cancellation
+                while deadlines and deadlines[0][1] not in in_flight:
+                    deadlines.popleft()
+                wait = CANCEL_POLL_INTERVAL
+                if deadlines:
+                    wait = min(wait, max(0.0, deadlines[0][0] - time.perf_counter()))
+                for selector_key, _ in selector.select(wait):
+                    sock = selector_key.fileobj
+                    error = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                    finish(sock, _sweep_state(error), os.strerror(error) if error else None)
+                now = time.perf_counter()
+                while deadlines and deadlines[0][0] <= now:
+                    _, sock = deadlines.popleft()
+                    if sock in in_flight:
+                        finish(sock, "timeout")
+                start_connects()
+        finally:
+            # Cancelled or failed: do not leak the sockets still connecting
+            for sock in in_flight:
+                sock.close()
+
+    summary = {"endpoints": len(endpoints), "hosts": len(host_list), "ports": len(port_list),
+               "duration_ms": round((time.perf_counter() - start) * 1000, 3)}
+    for state in SWEEP_STATES:
+        summary[state] = 0
+    for result in endpoints.values():
+        summary[result["state"]] += 1
+    return {"summary": summary, "endpoints": endpoints}
+
+
+def _sweep_state(error: int) -> str:
+    if error == 0:
+        return "open"
+    if error == errno.ECONNREFUSED:
+        return "closed"
+    if error == errno.ETIMEDOUT:
+        return "timeout"
+    if error in (errno.EHOSTUNREACH, errno.ENETUNREACH):
+        return "unreachable"
+    return "error"
+
+
+# Linux reports the ICMP errors of a UDP socket with IP_RECVERR set on its error queue (read with
+# MSG_ERRQUEUE), neither is exported by the socket module. Elsewhere a connected UDP socket still sees
+# port unreachable as ECONNREFUSED from recv().
+IP_RECVERR = getattr(socket, "IP_RECVERR", 11 if sys.platform.startswith("linux") else None)
+MSG_ERRQUEUE = getattr(socket, "MSG_ERRQUEUE", 0x2000)
+# struct sock_extended_err: ee_errno, ee_origin, ee_type, ee_code, ee_pad, ee_info, ee_data
+SOCK_EXTENDED_ERR = struct.Struct("=IBBBBII")
+SO_EE_ORIGIN_ICMP = 2
+ICMP_DEST_UNREACH = 3
+ICMP_PORT_UNREACH = 3
+
+
+def udp_sweep(hosts, ports, timeout: float = 3, concurrency: int = 256, payload=b"") -> dict:
+    """
+    Check many UDP endpoints at once from a pool of connected sockets multiplexed on one poller.
+
+    A datagram goes to every endpoint as soon as a socket of the pool is free, so all endpoints of a
+    sweep share one timeout window instead of waiting out a timeout each. Every socket is connected
+    to its endpoint, which makes the kernel hand it the ICMP errors for that endpoint: a closed port
+    is learnt from ICMP port unreachable read off the socket's error queue, typically within a round
+    trip. A socket is drained and reconnected to the next endpoint when its endpoint is done.
+
+    An endpoint that neither replies nor sends back an ICMP error times out and counts as open (or
+    filtered), like in check_udp_port(). Hosts rate limit their ICMP errors (Linux sends about 1000 per
+    second), closed ports beyond that limit also time out.
+
+    Args:
+    hosts (str | list): Host specification, see parse_host_spec().
+    ports (str | int | list): Port specification, see parse_port_spec().
+    timeout (float): Seconds to wait for a reply or an ICMP error per endpoint. Default is 3 seconds.
+    concurrency (int): Largest number of endpoints in flight (and sockets in the pool). Default is 256.
+    payload (bytes | str): Datagram sent to every endpoint. Default is an empty datagram.
+
+    Returns:
+    dict: {"summary": counts per state and the sweep duration,
+           "endpoints": {"host:port": {"status": True if open or timed out, "state": "open" (replied), "closed",
+                                       "timeout", "unreachable" or "error", "time_ms": time to the reply
+                                       or ICMP error, or None, ...}}}
+
+    Raises:
+    ValueError: A specification is invalid or expands to more than MAX_SWEEP_ENDPOINTS endpoints.
+    ProbeCancelled: The task was stopped or paused during the sweep.
+    """
+    host_list = parse_host_spec(hosts)
+    port_list = parse_port_spec(ports)
+    if len(host_list) * len(port_list) > MAX_SWEEP_ENDPOINTS:
+        raise ValueError(f"Sweep of {len(host_list)} hosts x {len(port_list)} ports exceeds "
+                         f"{MAX_SWEEP_ENDPOINTS} endpoints")
+    timeout = float(timeout)
+    concurrency = max(1, int(concurrency))
+    payload = payload.encode("utf-8") if isinstance(payload, str) else bytes(payload)
+
+    start = time.perf_counter()
+    endpoints = {}
+    pending = ((host, port) for host in host_list for port in port_list)
+    in_flight = {}  # socket -> (key, send time)
+    deadlines = deque()  # (deadline, socket, key) in send order, all endpoints share one timeout
+    pool = []  # every socket of the pool
+    idle = []  # sockets of the pool without an endpoint
+
+    def record(key, started, state, detail=None):
+        # Up when it replied or may be open (no answer, as in check_udp_port), down when closed, unreachable or failed
+        endpoints[key] = {"status": state in ("open", "timeout"), "state": state,
+                          "time_ms": None if state == "timeout" else round((time.perf_counter() - started) * 1000, 3)}
+        if detail:
+            endpoints[key]["description"] = detail
+
+    def finish(sock, state, detail=None):
+        key, started = in_flight.pop(sock)
+        selector.unregister(sock)
+        record(key, started, state, detail)
+        _drain_udp_socket(sock)
+        idle.append(sock)
+
+    def start_probes():
+        # Top up the endpoints in flight to the concurrency cap
+        for host, port in pending:
+            key = f"{host}:{port}"
+            started = time.perf_counter()
+            try:
+                # Resolved through the shared cache, hosts swept on several ports are looked up once
+                address = (resolver_cache.resolve(host), port)
+                if not idle:
+                    pool.append(_udp_probe_socket())
+                    idle.append(pool[-1])
+            except OSError as e:
+                record(key, started, "error", str(e))
+                continue
+            sock = idle.pop()
+            # Errors for the previous endpoint may have arrived since the socket was released
+            _drain_udp_socket(sock)
+            try:
+                _udp_send(sock, address, payload)
+            except OSError:
+                # Possibly still an error for the previous endpoint: retry from a new socket, whose
+                # errors can only be about this endpoint
+                pool.remove(sock)
+                sock.close()
+                try:
+                    sock = _udp_probe_socket()
+                except OSError as e:
+                    record(key, started, "error", str(e))
+                    continue
+                pool.append(sock)
+                try:
+                    _udp_send(sock, address, payload)
+                except OSError as e:
+                    # e.g. no route to the host
+                    record(key, started, _sweep_state(e.errno) if e.errno else "error", str(e))
+                    _drain_udp_socket(sock)
+                    idle.append(sock)
+                    continue
+            in_flight[sock] = (key, started)
+            selector.register(sock, selectors.EVENT_READ)
+            deadlines.append((started + timeout, sock, key))
+            if len(in_flight) >= concurrency:
+                return
+
+    with selectors.DefaultSelector() as selector:
+        try:
+            start_probes()
+            while in_flight:
+                check_cancelled()
+                # Wake for the earliest deadline, and at least every CANCEL_POLL_INTERVAL to notice cancellation
+                while deadlines and in_flight.get(deadlines[0][1], (None,))[0] != deadlines[0][2]:
+                    deadlines.popleft()
+                wait = CANCEL_POLL_INTERVAL
+                if deadlines:
+                    wait = min(wait, max(0.0, deadlines[0][0] - time.perf_counter()))
+                # Readable covers both a reply and a pending error (epoll reports EPOLLERR as readable)
+                for selector_key, _ in selector.select(wait):
+                    sock = selector_key.fileobj
+                    state, detail = _udp_reply_state(sock)
+                    if state is not None:
+                        finish(sock, state, detail)
+                now = time.perf_counter()
+                while deadlines and deadlines[0][0] <= now:
+                    _, sock, key = deadlines.popleft()
+                    # The socket may already have been reused for a later endpoint
+                    if in_flight.get(sock, (None,))[0] == key:
+                        finish(sock, "timeout", "No reply or ICMP error received, open or filtered")
+                start_probes()
+        finally:
+            for sock in pool:
+                sock.close()
+
+    summary = {"endpoints": len(endpoints), "hosts": len(host_list), "ports": len(port_list),
+               "duration_ms": round((time.perf_counter() - start) * 1000, 3)}
+    for state in SWEEP_STATES:
+        summary[state] = 0
+    for result in endpoints.values():
+        summary[result["state"]] += 1
+    return {"summary": summary, "endpoints": endpoints}
+
+
+def _udp_probe_socket() -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setblocking(False)
+    if IP_RECVERR is not None:
+        # Queue ICMP errors with their type and code instead of only setting a pending errno
+        sock.setsockopt(socket.IPPROTO_IP, IP_RECVERR, 1)
+    return sock
+
+
+def _udp_send(sock: socket.socket, address: tuple, payload: bytes):
+    # Connecting only sets the peer: no packet is sent, ICMP errors from it now reach the socket
+    sock.connect(address)
+    sock.send(payload)
+
+
+def _udp_reply_state(sock: socket.socket) -> (str, str):
+    # State of a readable probe socket: an ICMP error from the error queue, else a reply.
+    # (None, None) if there was nothing to read after all.
+    if IP_RECVERR is not None:
+        try:
+            # The queued error carries a sock_extended_err followed by the address of the ICMP sender
+            _, ancdata, _, _ = sock.recvmsg(1, socket.CMSG_SPACE(SOCK_EXTENDED_ERR.size + 16), MSG_ERRQUEUE)
+        except OSError:
+            ancdata = ()
+        for level, kind, data in ancdata:
+            if level != socket.IPPROTO_IP or kind != IP_RECVERR or len(data) < SOCK_EXTENDED_ERR.size:
+                continue
+            error, origin, icmp_type, icmp_code, _, _, _ = SOCK_EXTENDED_ERR.unpack_from(data)
+            if origin != SO_EE_ORIGIN_ICMP:
+                return _sweep_state(error), os.strerror(error)
+            if icmp_type == ICMP_DEST_UNREACH and icmp_code == ICMP_PORT_UNREACH:
+                return "closed", "ICMP port unreachable"
+            return "unreachable", f"ICMP type {icmp_type} code {icmp_code} ({os.strerror(error)})"
+    try:
+        sock.recv(65535)
+        return "open", "Reply received"
+    except BlockingIOError:
+        return None, None
+    except OSError as e:
+        # Without the error queue a connected socket reports port unreachable as ECONNREFUSED
+        return _sweep_state(e.errno), e.strerror
+
+
+def _drain_udp_socket(sock: socket.socket):
+    # Discard what is left of the previous endpoint before the socket is reconnected: queued ICMP
+    # errors, the pending errno and unread datagrams
+    if IP_RECVERR is not None:
+        while True:
+            try:
+                sock.recvmsg(1, 512, MSG_ERRQUEUE)
+            except OSError:
+                break
+    sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+    # Bounded, a socket that keeps failing is reused as it is
+    for _ in range(1024):
+        try:
+            sock.recv(65535)
+        except BlockingIOError:
+            break
+        except OSError:
+            # A pending errno raised (and cleared) instead of a datagram
+            continue
+
+
 ################# ECHO FUNCTIONS #######################################################
 def echo_server():
     """